@@ -0,0 +1,136 @@
+"""Measure the cold start of app.py and the calculator page.
+
+Every sample runs in a new Python process, as after a deploy or a worker
+recycle:
+
+- import: time to run the top-level import statements of the script;
+- first paint: time for Streamlit's AppTest to run the script once with no
+  ROI, i.e. until every input widget has been sent;
+- ready: for the calculator page, time until the Earth Engine warm-up of
+  reforestation.startup has finished.
+
+It also lists the heavy modules loaded by the first paint. Without live
+credentials in --secrets, pass a cassette of reforestation.replay so the
+warm-up runs offline.
+
+Usage:
+    python benchmarks/cold_start.py --runs 5 --cassette benchmarks/cassettes/calculator
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = {
+    'app.py': os.path.join(ROOT, 'app.py'),
+    'calculator': os.path.join(ROOT, 'pages', '1_reforestation_calculator.py'),
+}
+HEAVY_MODULES = ['ee', 'geemap', 'geopandas', 'matplotlib', 'pandas', 'PIL', 'rasterio', 'pyarrow']
+
+
+# Run the top-level imports of a script and return their duration
+def measure_imports(path):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    imports = ast.Module([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))], [])
+    code = compile(imports, path, 'exec')
+    started = time.perf_counter()
+    exec(code, {'__name__': '__cold_start__'})
+    return time.perf_counter() - started
+
+
+# Run a script once with AppTest and return the first paint and ready times
+def measure_first_paint(path, secrets_path, cassette):
+    from streamlit.testing.v1 import AppTest
+
+    if cassette:
+        from reforestation import replay
+        replay.install(cassette)
+        secrets = {'service_account': 'replay', 'json_data': '{}'}
+    elif os.path.exists(secrets_path):
+        import tomllib
+        with open(secrets_path, 'rb') as f:
+            secrets = tomllib.load(f)
+    else:
+        secrets = {'service_account': '', 'json_data': '{}'}
+
+    at = AppTest.from_file(path, default_timeout=120)
+    for key, value in secrets.items():
+        at.secrets[key] = value
+    started = time.perf_counter()
+    at.run()
+    first_paint = time.perf_counter() - started
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    ready = None
+    startup = sys.modules.get('reforestation.startup')
+    if startup is not None:
+        try:
+            startup.wait()
+            ready = time.perf_counter() - started
+        except Exception:
+            pass
+    return {'first_paint': first_paint, 'ready': ready, 'loaded': loaded,
+            'exception': at.exception[0].message if at.exception else None}
+
+
+def child(args):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    if args.child == 'import':
+        result = {'import': measure_imports(args.target)}
+    else:
+        result = measure_first_paint(args.target, args.secrets, args.cassette)
+    print(json.dumps(result))
+
+
+def sample(mode, target, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode, '--target', target,
+               '--secrets', args.secrets]
+    if args.cassette:
+        command += ['--cassette', args.cassette]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summary(values):
+    values = [value * 1000 for value in values if value is not None]
+    if not values:
+        return f"{'-':>10}{'-':>10}"
+    return f"{statistics.median(values):10.0f}{max(values):10.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--secrets', default=os.path.join(ROOT, '.streamlit', 'secrets.toml'))
+    parser.add_argument('--cassette', help="replay Earth Engine from this cassette")
+    parser.add_argument('--child', choices=['import', 'paint'], help=argparse.SUPPRESS)
+    parser.add_argument('--target', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cassette and not args.child and not os.path.exists(os.path.join(args.cassette, 'algorithms.json')):
+        parser.error(f"no recording in {args.cassette}; record one with page_benchmark.py --record")
+    if args.child:
+        return child(args)
+
+    print(f"{'':12}{'':14}{'p50 ms':>10}{'max ms':>10}")
+    for name, target in TARGETS.items():
+        imports = [sample('import', target, args)['import'] for _ in range(args.runs)]
+        paints = [sample('paint', target, args) for _ in range(args.runs)]
+        print(f"{name:12}{'import':14}{summary(imports)}")
+        print(f"{name:12}{'first paint':14}{summary(p['first_paint'] for p in paints)}")
+        if any(p['ready'] is not None for p in paints):
+            print(f"{name:12}{'ready':14}{summary(p['ready'] for p in paints)}")
+        print(f"{name:12}{'loaded':14}  {', '.join(paints[-1]['loaded']) or 'none'}")
+        if paints[-1]['exception']:
+            print(f"{name:12}{'error':14}  {paints[-1]['exception']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""End-to-end benchmark of the calculator page on recorded Earth Engine
+responses.
+
+The page is driven headlessly with Streamlit's AppTest against a cassette of
+reforestation.replay: paste the ROI, click Calculate, then move the slope
+threshold through every value (and evaluate every feature for the
+multi-feature ROI). Each scenario starts from an empty result cache and a new
+session. For every rerun the wall time, the number of Earth Engine requests
+sent (after coalescing) and the peak Python memory are reported.
+
+No cassette is committed with the repository: the recording needs live
+credentials and holds the responses of that project. Record it once, then
+replay it anywhere:
+
+    python benchmarks/page_benchmark.py --record --secrets .streamlit/secrets.toml
+    python benchmarks/page_benchmark.py --latency 0.3 --json results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tomllib
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+from reforestation import cache, executor, replay
+from reforestation.ingest import METERS_PER_DEGREE
+
+PAGE = os.path.join(ROOT, 'pages', '1_reforestation_calculator.py')
+CASSETTE = os.path.join(ROOT, 'benchmarks', 'cassettes', 'calculator')
+SLOPE_LABEL = "Select Slope Threshold (degrees)"
+THRESHOLDS = range(1, 46)
+
+# Centre of the ROIs (West Virginia)
+CENTRE = (-80.677, 38.451)
+
+
+# Square polygon of `side` km around a centre
+def square(side, centre=CENTRE):
+    half = side * 500 / METERS_PER_DEGREE
+    x, y = centre
+    return {'type': 'Polygon', 'coordinates': [[
+        [x - half, y - half], [x + half, y - half], [x + half, y + half], [x - half, y + half], [x - half, y - half]]]}
+
+
+def feature_collection(geometries):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': f"Parcel {i + 1}"}, 'geometry': geometry}
+        for i, geometry in enumerate(geometries)]}
+
+
+# Small (4 sq. km), medium (400 sq. km, one request), large (22,500 sq. km,
+# estimated first, then tiled) and multi-feature ROIs
+SCENARIOS = {
+    'small': square(2),
+    'medium': square(20),
+    'large': square(150),
+    'multi': feature_collection([square(3, (CENTRE[0] + dx * 0.1, CENTRE[1] + dy * 0.1))
+                                 for dx in range(3) for dy in range(2)]),
+}
+
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def slider(at, label):
+    return next(s for s in at.slider if s.label == label)
+
+
+# Run one step of the page and measure it
+def measure(step, action, trace_memory):
+    calls = executor.get_executor().stats['calls']
+    if trace_memory:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    at = action()
+    wall = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"{step} failed: {at.exception[0].message}")
+    return {
+        'step': step,
+        'wall_ms': wall * 1000,
+        'ee_calls': executor.get_executor().stats['calls'] - calls,
+        'peak_mb': tracemalloc.get_traced_memory()[1] / 1024 ** 2 if trace_memory else None,
+    }
+
+
+def run_scenario(name, geojson, secrets, thresholds, trace_memory, timeout):
+    # A new session on an empty, memory-only result cache
+    cache._cache = cache.ResultCache(directory=None)
+    at = AppTest.from_file(PAGE, default_timeout=timeout)
+    for key, value in secrets.items():
+        at.secrets[key] = value
+
+    rows = [measure('first paint', at.run, trace_memory)]
+    at.text_area[0].input(json.dumps(geojson))
+    rows.append(measure('ROI', at.run, trace_memory))
+    rows.append(measure('Calculate', lambda: button(at, "Calculate").click().run(), trace_memory))
+    for threshold in thresholds:
+        rows.append(measure(f'threshold {threshold}',
+                            lambda: slider(at, SLOPE_LABEL).set_value(threshold).run(), trace_memory))
+    if geojson.get('type') == 'FeatureCollection':
+        rows.append(measure('batch', lambda: button(at, "Evaluate All Features").click().run(), trace_memory))
+    for row in rows:
+        row['scenario'] = name
+    return rows
+
+
+def report(rows):
+    print(f"{'scenario':10}{'step':16}{'wall ms':>10}{'EE calls':>10}{'peak MB':>10}")
+    for row in rows:
+        if row['step'].startswith('threshold'):
+            continue
+        peak = f"{row['peak_mb']:10.1f}" if row['peak_mb'] is not None else f"{'-':>10}"
+        print(f"{row['scenario']:10}{row['step']:16}{row['wall_ms']:10.1f}{row['ee_calls']:10}{peak}")
+
+    # The threshold sweep of each scenario as percentiles
+    for scenario in dict.fromkeys(row['scenario'] for row in rows):
+        sweep = sorted(row['wall_ms'] for row in rows
+                       if row['scenario'] == scenario and row['step'].startswith('threshold'))
+        if not sweep:
+            continue
+        calls = sum(row['ee_calls'] for row in rows
+                    if row['scenario'] == scenario and row['step'].startswith('threshold'))
+        p95 = sweep[min(len(sweep) - 1, int(len(sweep) * 0.95))]
+        print(f"{scenario:10}{'sweep p50/p95':16}{statistics.median(sweep):10.1f}{calls:10}{p95:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cassette', default=CASSETTE)
+    parser.add_argument('--record', action='store_true', help="send requests to Earth Engine and record them")
+    parser.add_argument('--secrets', default='.streamlit/secrets.toml', help="live credentials for --record")
+    parser.add_argument('--latency', default='0', help="seconds per replayed request, or 'recorded'")
+    parser.add_argument('--latency-scale', type=float, default=1.0)
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append')
+    parser.add_argument('--thresholds', type=int, nargs='*', default=list(THRESHOLDS))
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc, which slows the runs")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--json', help="also write the rows to this JSON file")
+    args = parser.parse_args()
+
+    if args.record:
+        with open(args.secrets, 'rb') as f:
+            secrets = tomllib.load(f)
+        replay.install(args.cassette, mode='record')
+    else:
+        if not replay.is_recorded(args.cassette):
+            parser.error(f"no recording in {args.cassette}; record one with --record and live credentials")
+        secrets = {'service_account': 'replay', 'json_data': '{}'}
+        latency = args.latency if args.latency == 'recorded' else float(args.latency)
+        replay.install(args.cassette, latency=latency, latency_scale=args.latency_scale)
+
+    if not args.no_memory:
+        tracemalloc.start()
+    rows = []
+    for name in args.scenario or SCENARIOS:
+        rows += run_scenario(name, SCENARIOS[name], secrets, args.thresholds, not args.no_memory, args.timeout)
+    report(rows)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
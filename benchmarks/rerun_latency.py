@@ -0,0 +1,74 @@
+"""Measure the per-rerun setup cost of the calculator page, before and after
+the shared Earth Engine session.
+
+"before" repeats what every rerun of the page used to do before reading any
+input: parse the service account key, build credentials, call ee.Initialize
+and construct four geemap maps. "after" is what a rerun does now: a call into
+the already initialized session.
+
+Usage:
+    python benchmarks/rerun_latency.py --secrets .streamlit/secrets.toml --reruns 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tomllib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ee
+import geemap.foliumap as geemap
+
+from reforestation import session
+
+
+def rerun_before(service_account, json_data):
+    json_object = json.dumps(json.loads(json_data, strict=False))
+    credentials = ee.ServiceAccountCredentials(service_account, key_data=json_object)
+    ee.Initialize(credentials)
+    maps = [geemap.Map() for _ in range(4)]
+    maps[1].add_basemap("SATELLITE")
+    maps[2].add_basemap("TERRAIN")
+    maps[3].add_basemap("TERRAIN")
+
+
+def rerun_after(service_account, json_data):
+    session.initialize(service_account, json_data)
+
+
+def measure(func, reruns, *args):
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--secrets', default='.streamlit/secrets.toml')
+    parser.add_argument('--reruns', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.secrets, 'rb') as f:
+        secrets = tomllib.load(f)
+    credentials = (secrets['service_account'], secrets['json_data'])
+
+    results = {
+        'before': measure(rerun_before, args.reruns, *credentials),
+        'after': measure(rerun_after, args.reruns, *credentials),
+    }
+
+    print(f"{'':8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, timings in results.items():
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{name:8}{statistics.median(timings):10.1f}{p95:10.1f}{timings[-1]:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
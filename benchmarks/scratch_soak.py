@@ -0,0 +1,105 @@
+"""Soak test of the session scratch space: simulate thousands of sessions and
+check that disk usage and RSS stay bounded.
+
+Every simulated session uploads a file and comes back for a few reruns. A
+fake clock advances between sessions, so idle sessions expire as they would
+on a long-running server. Disk usage, live sessions and RSS are sampled along
+the way; the run fails if disk usage
+ever exceeds the total quota, or if RSS keeps growing after the warm-up.
+
+Usage:
+    python benchmarks/scratch_soak.py --sessions 5000 --upload-kb 512 --total-quota-mb 64
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reforestation.scratch import QuotaExceeded, ScratchManager
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# Current resident set size in MB (peak RSS where /proc is not available)
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_session(manager, state, upload_bytes):
+    scratch = manager.begin_run(state)
+    try:
+        manager.reserve(scratch, upload_bytes)
+    except QuotaExceeded:
+        return False
+    with open(os.path.join(scratch.mkdtemp('upload-'), 'upload.tif'), 'wb') as f:
+        f.write(os.urandom(upload_bytes))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--reruns', type=int, default=3, help="reruns of each session")
+    parser.add_argument('--upload-kb', type=int, default=512)
+    parser.add_argument('--session-quota-mb', type=float, default=4)
+    parser.add_argument('--total-quota-mb', type=float, default=64)
+    parser.add_argument('--ttl', type=float, default=600, help="idle seconds before a session is evicted")
+    parser.add_argument('--interval', type=float, default=1, help="simulated seconds between sessions")
+    parser.add_argument('--samples', type=int, default=10)
+    args = parser.parse_args()
+
+    clock = FakeClock()
+    root = tempfile.mkdtemp(prefix='scratch-soak-')
+    manager = ScratchManager(root, session_quota=args.session_quota_mb * 1024 ** 2,
+                             total_quota=args.total_quota_mb * 1024 ** 2, ttl=args.ttl, clock=clock)
+    upload_bytes = args.upload_kb * 1024
+    states, rejected, rss = [], 0, []
+
+    print(f"{'sessions':>10}{'live':>8}{'disk MB':>10}{'RSS MB':>9}{'rejected':>10}")
+    every = max(1, args.sessions // args.samples)
+    for n in range(1, args.sessions + 1):
+        clock.now += args.interval
+        states.append({})
+        # The new session and a few recent ones rerun
+        for state in [states[-1]] + random.sample(states[-50:], min(args.reruns, len(states))):
+            if not run_session(manager, state, upload_bytes):
+                rejected += 1
+
+        usage = manager.usage()
+        if usage['bytes'] > manager.total_quota:
+            sys.exit(f"Disk usage {usage['bytes']} exceeds the total quota after {n} sessions")
+        if n % every == 0:
+            rss.append(rss_mb())
+            print(f"{n:10}{usage['sessions']:8}{usage['bytes'] / 1024 ** 2:10.1f}{rss[-1]:9.1f}{rejected:10}")
+
+    clock.now += args.ttl + 1
+    manager.evict_expired()
+    left = sum(len(files) for _, _, files in os.walk(root))
+    if not left:
+        os.rmdir(root)
+
+    # RSS after the warm-up half may drift a little, but not grow with the sessions
+    warm = rss[len(rss) // 2:]
+    growth = warm[-1] - warm[0] if len(warm) > 1 else 0.0
+    print(f"RSS growth after warm-up: {growth:.1f} MB; files left after expiry: {left}")
+    if growth > 0.25 * warm[0] or left:
+        sys.exit("Scratch space is not bounded")
+
+
+if __name__ == '__main__':
+    main()
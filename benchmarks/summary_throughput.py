@@ -0,0 +1,99 @@
+"""Micro-benchmark of the histogram area summary on batches of histograms.
+
+"before" is the per-histogram DataFrame conversion the page and the batch
+mode used to run (string round trip of the areas, per-row legend lookup,
+isin filters for the forest totals), once per histogram. "after" is one
+reforestation.summary.summarize_histograms call over the whole batch.
+Histograms are random NLCD-like frequency histograms with Earth Engine's
+string keys.
+
+Usage:
+    python benchmarks/summary_throughput.py --histograms 10000 --repeats 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reforestation.landcover import (PIXEL_AREA, forested_descriptions, nlcd_legend,
+                                     non_forested_descriptions)
+from reforestation.summary import summarize_histograms
+
+CLASSES = [int(name[len('Class_'):]) for name in nlcd_legend]
+
+
+def random_histograms(n, seed=0):
+    rng = np.random.default_rng(seed)
+    histograms = []
+    for _ in range(n):
+        classes = rng.choice(CLASSES, size=rng.integers(1, len(CLASSES) + 1), replace=False)
+        counts = rng.gamma(1.0, 5000.0, size=len(classes))
+        histograms.append({str(c): float(v) for c, v in zip(classes, counts)})
+    return histograms
+
+
+def summarize_before(histograms):
+    results = []
+    for histogram in histograms:
+        df = pd.DataFrame(histogram.items(), columns=['Class', 'Sum'])
+        df['Sum'] = (df['Sum'] / 1000000*PIXEL_AREA)
+        total_area = df['Sum'].sum()
+        df['Percentage'] = ((df['Sum'] / total_area) * 100).apply(lambda x: "{:.2f}%".format(x))
+        df['Sum'] = df['Sum'].apply(lambda x: "{:.2f}".format(x))
+        df['Description'] = df['Class'].apply(lambda x: nlcd_legend.get('Class_' + str(x), 'Unknown'))
+        df['Sum'] = pd.to_numeric(df['Sum'])
+        df = df.sort_values(by='Sum', ascending=False)
+        forested_area = df[df['Description'].isin(forested_descriptions)]['Sum'].sum()
+        non_forested_area = df[df['Description'].isin(non_forested_descriptions)]['Sum'].sum()
+        results.append((df, forested_area, non_forested_area))
+    return results
+
+
+def summarize_after(histograms):
+    return summarize_histograms(histograms)
+
+
+def measure(func, repeats, histograms):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(histograms)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--histograms', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    histograms = random_histograms(args.histograms)
+
+    # Both paths must agree on the totals, up to the old rounding to 0.01 sq. km
+    before = summarize_before(histograms[:100])
+    after = summarize_after(histograms[:100])
+    tolerance = 0.005 * len(CLASSES)
+    assert np.allclose([r[1] for r in before], after['forested'], atol=tolerance)
+    assert np.allclose([r[2] for r in before], after['non_forested'], atol=tolerance)
+
+    results = {
+        'before': measure(summarize_before, args.repeats, histograms),
+        'after': measure(summarize_after, args.repeats, histograms),
+    }
+
+    print(f"{args.histograms} histograms")
+    print(f"{'':8}{'p50 ms':>10}{'max ms':>10}{'us/hist':>10}")
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(f"{name:8}{median:10.1f}{max(timings):10.1f}{median * 1000 / args.histograms:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,70 @@
-# import libraries
+# import libraries; Earth Engine, geemap, pandas and the calculator modules
+# are imported once an ROI is given, after the warm-up below has loaded them
 import streamlit as st
-import geemap.foliumap as geemap
-import ee
 import json
-import pandas as pd
-import matplotlib.pyplot as plt 
-import geopandas as gpd
-import tempfile
-import zipfile
-import datetime
 import os
-from PIL import Image
 import time
-import shutil
 
-def cleanup_temp_directory(temp_dir):
-    try:
-        import shutil
-        shutil.rmtree(temp_dir)
-        st.success("Temporary directory cleaned up successfully.")
-    except Exception as e:
-        st.error(f"Error cleaning up temporary directory: {e}")
-
-# Create a function to mask clouds using the Sentinel-2 QA60 band
-def mask_clouds(image):
-    # Select the QA60 band from the image
-    QA60 = image.select(['QA60'])
-    
-    # Create a cloud mask by checking if the QA60 band is 0 (indicating no cloud)
-    cloud_mask = QA60.bitwiseAnd(1 << 10).eq(0)
-    
-    # Update the image mask with the cloud mask
-    return image.updateMask(cloud_mask)
+from reforestation.landcover import LANDCOVERS
+from reforestation.ingest import SIMPLIFY_TOLERANCE, read_geojson, read_zipped_shapefile, prepare_geometry
+from reforestation.imagery import OVERLAY_MODES, TRUE_COLOR, overlay_image
+from reforestation.scratch import QuotaExceeded, get_scratch
+from reforestation.metrics import get_metrics, stage
+from reforestation import startup
+
+# Show the progress of a background export; the page reruns once it finishes,
+# so the finished job is drawn once instead of polled
+@st.fragment(run_every=2)
+def export_progress(job_id):
+    job = get_job(job_id)
+    if job is not None and job.state == 'running':
+        st.progress(job.progress, text=f"Exporting plantable areas ({job.progress:.0%})")
+    else:
+        st.rerun()
+
+# Show the progress of the session's export, then its download button. The
+# file of a finished export goes once the scratch space of the session is
+# trimmed or evicted, and the export is forgotten with it.
+def export_status(job):
+    if job.state == 'running':
+        export_progress(job.id)
+    elif job.state == 'done':
+        if not os.path.exists(job.path):
+            del st.session_state['export_job']
+            return
+        with open(job.path, 'rb') as f:
+            st.download_button("Download Plantable Areas", f, file_name=job.file_name, mime=job.mime)
+    else:
+        st.error(f"Error during export: {job.error}")
+
+# Format an area in sq. km, with its error band when it comes from an estimate
+def format_area(area, total_area, statistics):
+    if not statistics.get('estimate'):
+        return f"{area:.2f}"
+    return f"{area:.2f} ± {error_band(area, total_area, statistics['samples']):.2f}"
+
+# Names of the map tiles kept with a cached result, to tell whether a run
+# added any and the result has to be stored again
+def tile_names(result):
+    if result is None:
+        return None
+    names = set(result['tiles'])
+    for threshold, tiles in result.get('plantable_tiles', {}).items():
+        names.update((threshold, name) for name in tiles)
+    return names
+
+# Show the progress of the background 30 m calculation; the page reruns with
+# the refined result once it is cached. A finished job leaves the registry, so
+# without a job and without a cached result the rerun starts a new one.
+@st.fragment(run_every=2)
+def refine_status(key, scale):
+    job = get_refine(key)
+    if job is not None and job.state == 'running':
+        st.info(f"Showing an estimate at {scale} m. Refining to 30 m ({job.elapsed():.0f} s)...")
+    elif job is not None and job.state == 'failed':
+        st.error(f"Error during the 30 m calculation: {job.error}")
+    else:
+        st.rerun()
 
 # Customize the sidebar
 markdown = """
@@ -39,77 +72,86 @@ Web App URL: <https://reforestation.streamlit.app>
 """
 st.sidebar.title("About")
 st.sidebar.info(markdown)
+show_profiling = st.sidebar.toggle("Show stage timings")
 
-# Preparing values
-json_data = st.secrets["json_data"]
-service_account = st.secrets["service_account"]
-json_object = json.loads(json_data, strict=False)
-json_object = json.dumps(json_object)
+# Authorize the app and load Earth Engine in the background (once per server
+# process) while the input widgets render
+startup.warm_up(st.secrets["service_account"], st.secrets["json_data"])
+request_heartbeat = st.empty()
 
-# Authorizing the app
-credentials = ee.ServiceAccountCredentials(service_account, key_data=json_object)
-ee.Initialize(credentials)
+# Scratch files of this session, evicted once the session is idle
+scratch = get_scratch().begin_run(st.session_state)
 
-# Create a temporary directory
-temp_dir = tempfile.TemporaryDirectory()
+# Latency, payload size and cache use of every stage of this run
+metrics = get_metrics()
+metrics.begin_run(scratch.session_id)
 
 # Upload a JSON file for ROI
 st.sidebar.header("Upload a GeoJSON")
 geojson_file = st.sidebar.file_uploader("Upload a GeoJSON", type=["geojson"])
 
+# Parse the GeoJSON content as a JSON object, straight from the upload
+uploaded_geojson = None
 if geojson_file is not None:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".geojson") as temp_geojson_file:
-    
-        temp_geojson_file.write(geojson_file.read())
-        temp_geojson_file_path = temp_geojson_file.name
-    
-    with open(temp_geojson_file_path, "r") as temp_geojson_file:
-        geojson_content = temp_geojson_file.read()
-    
-    # Parse the GeoJSON content as a JSON object
     try:
-        cleaned_content = geojson_content.strip()
-        
-        if cleaned_content:
-
-            json_object = json.loads(cleaned_content.encode('utf-8').decode('utf-8'))
-            print("GeoJSON loaded successfully.")
-
-        else:
-            print("GeoJSON file is empty.")
-            
-    except json.JSONDecodeError as e:
-        
-        print(f"Error decoding JSON: {e}")
+        uploaded_geojson = read_geojson(geojson_file)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        st.sidebar.error(f"Error decoding JSON: {e}")
 
 # Upload a shapefile
 st.sidebar.header("Upload Shapefile")
 shapefile = st.sidebar.file_uploader("Upload a shapefile (ZIP)", type=["zip"])
 
+# Read each uploaded shapefile once, from the ZIP without extracting it; its
+# prepared features are kept with it for the last simplification tolerance
+shapefile_upload = None
 if shapefile is not None:
-    # Extract the uploaded shapefile to the temporary directory
-    with open(f"{temp_dir.name}/shapefile.zip", "wb") as f:
-        f.write(shapefile.read())
-    with zipfile.ZipFile(f"{temp_dir.name}/shapefile.zip", 'r') as zip_ref:
-        zip_ref.extractall(temp_dir.name)
-
-    # Read the shapefile using GeoPandas
-    custom_shape = gpd.read_file(temp_dir.name)
-else: 
-    custom_shape = None
+    shapefile_upload = st.session_state.get('shapefile_upload')
+    if shapefile_upload is None or shapefile_upload['file_id'] != shapefile.file_id:
+        st.session_state.pop('shapefile_upload', None)
+        try:
+            shapefile_upload = {'file_id': shapefile.file_id, 'gdf': read_zipped_shapefile(shapefile)}
+            st.session_state['shapefile_upload'] = shapefile_upload
+        except ValueError as e:
+            shapefile_upload = None
+            st.sidebar.error(f"Error reading shapefile: {e}")
+custom_shape = shapefile_upload['gdf'] if shapefile_upload is not None else None
+
+# Simplify ROI boundaries before they are sent to Earth Engine
+st.sidebar.header("ROI Simplification")
+simplify_tolerance = st.sidebar.slider("Simplification tolerance (m)", 0, 30, SIMPLIFY_TOLERANCE)
 
 # Allow the user to upload a GeoTIFF file
 st.sidebar.header("Upload Geotiff")
 tiff = st.sidebar.file_uploader("Upload a GeoTIFF file", type=["tif", "tiff"])
 
 if tiff is not None:
-    # Create a temporary directory
-    temp_dir = tempfile.mkdtemp()
-
-    # Save the uploaded file to the temporary directory
-    temp_image_path = os.path.join(temp_dir, tiff.name)
-    with open(temp_image_path, "wb") as temp_file:
-        temp_file.write(tiff.read())
+    # rasterio is only loaded for GeoTIFF uploads
+    from reforestation.uploads import save_upload, build_overviews, preview, class_histogram, class_table
+
+    # Save each uploaded file once, with overviews and a preview for display.
+    # The copy is saved again if the session's scratch space was evicted.
+    upload = st.session_state.get('tiff_upload')
+    if upload is None or upload['file_id'] != tiff.file_id or not os.path.exists(upload['path']):
+        if upload is not None:
+            scratch.remove(os.path.dirname(upload['path']))
+            del st.session_state['tiff_upload']
+        # Room for the file and its overviews (about a third of its size),
+        # keeping an export still being written
+        export_job = st.session_state.get('export_job')
+        keep = [export_job.directory] if export_job is not None and export_job.state == 'running' else []
+        try:
+            get_scratch().reserve(scratch, tiff.size * 4 // 3, keep)
+        except QuotaExceeded as e:
+            st.sidebar.error(f"The GeoTIFF cannot be stored: {e}")
+            st.stop()
+
+        # Save the uploaded file to a scratch directory of the session
+        temp_image_path = save_upload(tiff, scratch.mkdtemp('upload-'))
+        build_overviews(temp_image_path)
+        upload = {'file_id': tiff.file_id, 'path': temp_image_path, 'preview': preview(temp_image_path)}
+        st.session_state['tiff_upload'] = upload
+    temp_image_path = upload['path']
 
     # # Upload the image to Earth Engine
     # asset_id = '/users/noahportman/folder-or-collection-id/new-asset' 
@@ -118,120 +160,30 @@ if tiff is not None:
     # # print the image
     # print(image)
     
-    # Read the tiff as an image
-    uploaded_image = Image.open(temp_image_path)
+    # Downsampled image of the tiff, read from its overviews
+    uploaded_image = upload['preview']
 
 else:
     temp_image_path = None
     uploaded_image = None
 
-# Initialize NLCD legends
-nlcd_class_names = [
-    'Open Water',
-    'Perennial Ice/Snow',
-    'Developed - Open Space',
-    'Developed - Low Intensity',
-    'Developed - Medium Intensity',
-    'Developed - High Intensity',
-    'Barren Land (Rock/Sand/Clay)',
-    'Deciduous Forest',
-    'Evergreen Forest',
-    'Mixed Forest',
-    'Dwarf Scrub',
-    'Shrub/Scrub',
-    'Grassland/Herbaceous',
-    'Sedge/Herbaceous',
-    'Lichens',
-    'Moss',
-    'Pasture/Hay',
-    'Cultivated Crops',
-    'Woody Wetlands',
-    'Emergent Herbaceous Wetlands'
-]
-nlcd_legend = {
-    'Class_11': 'Open Water',
-    'Class_12': 'Perennial Ice/Snow',
-    'Class_21': 'Developed - Open Space',
-    'Class_22': 'Developed - Low Intensity',
-    'Class_23': 'Developed - Medium Intensity',
-    'Class_24': 'Developed - High Intensity',
-    'Class_31': 'Barren Land (Rock/Sand/Clay)',
-    'Class_41': 'Deciduous Forest',
-    'Class_42': 'Evergreen Forest',
-    'Class_43': 'Mixed Forest',
-    'Class_51': 'Dwarf Scrub',
-    'Class_52': 'Shrub/Scrub',
-    'Class_71': 'Grassland/Herbaceous',
-    'Class_72': 'Sedge/Herbaceous',
-    'Class_73': 'Lichens',
-    'Class_74': 'Moss',
-    'Class_81': 'Pasture/Hay',
-    'Class_82': 'Cultivated Crops',
-    'Class_90': 'Woody Wetlands',
-    'Class_95': 'Emergent Herbaceous Wetlands'
-}       
-nlcd_colors = {
-    'Open Water': '#466b9f',
-    'Perennial Ice/Snow': '#d1def8',
-    'Developed - Open Space': '#dec5c5',
-    'Developed - Low Intensity': '#d99282',
-    'Developed - Medium Intensity': '#eb0000',
-    'Developed - High Intensity': '#ab0000',
-    'Barren Land (Rock/Sand/Clay)': '#b3ac9f',
-    'Deciduous Forest': '#68ab5f',
-    'Evergreen Forest': '#1c5f2c',
-    'Mixed Forest': '#b5c58f',
-    'Dwarf Scrub': '#af963c',
-    'Shrub/Scrub': '#ccb879',
-    'Grassland/Herbaceous': '#dfdfc2',
-    'Sedge/Herbaceous': '#d1d182',
-    'Lichens': '#a3cc51',
-    'Moss': '#82ba9e',
-    'Pasture/Hay': '#dcd939',
-    'Cultivated Crops': '#ab6c28',
-    'Woody Wetlands': '#b8d9eb',
-    'Emergent Herbaceous Wetlands': '#6c9fb8',
-}
-color_mapping_esa = {
-    10: "#006400",  # Tree cover
-    20: "#ffbb22",  # Shrubland
-    30: "#ffff4c",  # Grassland
-    40: "#f096ff",  # Cropland
-    50: "#fa0000",  # Built-up
-    60: "#b4b4b4",  # Bare / sparse vegetation
-    70: "#f0f0f0",  # Snow and ice
-    80: "#0064c8",  # Permanent water bodies
-    90: "#0096a0",  # Herbaceous wetland
-    95: "#00cf75",  # Mangroves
-    100: "#fae6a0"  # Moss and lichen
-}
-
 # Print title label
 st.title("Reforestation Calculator")
 
-# Create a Map
-m0 = geemap.Map()
-m1 = geemap.Map()
-m2 = geemap.Map()
-ms = geemap.Map()
-
-# Initialize df
-df = pd.DataFrame()
-
-# Add a selectbox for choosing the slope threshold
+# Add a slider for choosing the slope threshold; results for a new threshold
+# are read from the cached joint histogram without another request
 st.header("STEP 1: Define the slope threshold for your reforestation project")
-slope_threshold_options = [30, 20, 10]
-slope_threshold = st.selectbox("Select Slope Threshold (%)", slope_threshold_options)
+slope_threshold = st.slider("Select Slope Threshold (degrees)", min_value=1, max_value=45, value=30)
+
+# NLCD covers the United States; ESA WorldCover runs the calculator anywhere
+landcover = st.selectbox("Landcover dataset", list(LANDCOVERS), format_func=lambda name: LANDCOVERS[name]['name'])
+landcover_info = LANDCOVERS[landcover]
 
 # Allow the user to input start and end dates
 st.header("STEP 2: Enter the start date and end date for a satellite image overlay")
 start_date = st.text_input("Enter the start date (e.g., YYYY-MM-DD):", "2021-01-01")
 end_date = st.text_input("Enter the end date (e.g., YYYY-MM-DD):","2021-12-31")
-
-# Add the selected basemap for m1 and m2
-m1.add_basemap("SATELLITE")
-m2.add_basemap("TERRAIN")
-ms.add_basemap("TERRAIN")
+overlay_mode = st.radio("Satellite image overlay", OVERLAY_MODES, horizontal=True)
 
 st.header("STEP 3: Define the ROI (region of interest)")
 st.write(f"Visit GeoJson.io to copy the JSON of your ROI:")
@@ -240,30 +192,66 @@ st.markdown(f'<a href="{url}" target="_blank">Open GeoJSON.io</a>', unsafe_allow
 
 geojson_json = st.text_area("Paste the JSON script of your ROI here:", "")
 
-if geojson_json != "":
-    custom_geojson = json.loads(geojson_json)
+if geojson_json != "" or uploaded_geojson is not None:
+    with stage('warm_up'), st.spinner("Loading Earth Engine..."):
+        startup.wait()
+
+    import ee
+    import geemap.foliumap as geemap
+    import pandas as pd
+
+    from reforestation import session
+    from reforestation.summary import area_table, split_joint, summarize_histograms, threshold_curve
+    from reforestation.planner import sentinel_collection, build_layers, imagery_request, histogram_request, estimate_request, fetch, fetch_with_imagery, format_dates
+    from reforestation.tiling import TILE_PIXELS, estimate_pixels
+    from reforestation.gridindex import joint_histogram
+    from reforestation.cache import cache_key, get_cache
+    from reforestation.maps import add_cached_layer, prefetch_tiles, zoom_to_geometry
+    from reforestation.executor import get_executor
+    from reforestation.export import EXPORT_FORMATS, estimate_export_bytes, start_export, get_job
+    from reforestation.progressive import PROGRESSIVE_PIXELS, normalize_estimate, error_band, start_refine, get_refine
+    from reforestation.batch import features_from_geojson, features_from_gdf, run_batch, summarize
+    from reforestation.charts import bar_spec, pie_spec
+    from reforestation.change import EPOCHS, epoch_range, reduce_change, trend_table, transition_table, forest_transitions
+
+    # Refresh the access token if it has expired
+    session.initialize(st.secrets["service_account"], st.secrets["json_data"])
+
+    # Earth Engine requests of this run; a rerun cancels what is still queued.
+    # Waits touch an empty placeholder so Streamlit can stop a superseded run.
+    get_executor().begin_run(st.session_state, heartbeat=request_heartbeat.empty)
+
+    with stage('roi_parse'):
+        custom_geojson = json.loads(geojson_json) if geojson_json != "" else uploaded_geojson
+
+        # Repair, simplify and quantize the ROI before building the EE geometry.
+        # Its edges are planar, like those of the tiles of reforestation.tiling,
+        # so a small ROI and a tiled one cover the same pixels.
+        roi_geojson, slimming = prepare_geometry(features_from_geojson(custom_geojson)[0][1], simplify_tolerance)
+        roi_geometry = ee.Geometry(roi_geojson, None, False)
     st.success("GeoJSON loaded successfully.")
-    
-    coordinates = custom_geojson['features'][0]['geometry']['coordinates']
-    roi_geometry = ee.Geometry.Polygon(coordinates)
+    st.caption(f"ROI simplified from {slimming['vertices_before']} to {slimming['vertices_after']} vertices "
+               f"({slimming['bytes_before'] / 1024:.1f} KB to {slimming['bytes_after'] / 1024:.1f} KB), "
+               f"area error {slimming['area_error']:.3%}"
+               + (", invalid geometry repaired" if slimming['repaired'] else ""))
+
+    # Results are cached per ROI, date range and landcover dataset, across sessions;
+    # the statistics serve every slope threshold
+    cache = get_cache()
+    imagery_key = cache_key(roi_geojson, start_date=start_date, end_date=end_date)
+    statistics_key = cache_key(roi_geojson, landcover=landcover)
+    estimate_key = cache_key(roi_geojson, landcover=landcover, estimate=True)
     
     # Convert the ROI to an ee.FeatureCollection
     # roi_fc = ee.FeatureCollection(ee.Geometry(roi_geometry))
-    m0.centerObject(roi_geometry)
 
-    m0.addLayer(roi_geometry, {}, "ROI")
+    # Create a Map
+    m0 = geemap.Map()
+    zoom_to_geometry(m0, roi_geojson)
 
     # Load Sentinel-2 imagery for the specified date range and ROI
-    collection = ee.ImageCollection('COPERNICUS/S2') \
-        .filterBounds(roi_geometry) \
-        .filterDate(start_date, end_date) \
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10)) \
-        # .map(mask_clouds) \
+    collection = sentinel_collection(roi_geometry, start_date, end_date)
 
-    esa = ee.ImageCollection('ESA/WorldCover/v100').first().clip(roi_geometry)
-
-    # m0.add_layer(esa, color_mapping_esa, 'ESA Landcover')
-    
     if custom_shape is not None:
         m0.add_gdf(custom_shape, layer_name="Uploaded Shapefile")
 
@@ -280,97 +268,146 @@ if geojson_json != "":
 
     #     m0.add_raster(input_image, colormap='gray', layer_name = "Landcover.io raster")
 
-    image_count = int(collection.size().getInfo())
+    # The clearest image, or a per-pixel cloud-masked median composite
+    overlay, overlay_name = overlay_image(overlay_mode, roi_geometry, collection, start_date, end_date)
 
-    # Sort the image collection by cloud coverage, with the least cloudy images first
-    sorted_collection = collection.sort('CLOUDY_PIXEL_PERCENTAGE', True)
-
-    if image_count > 5:
-        # Limit the collection to the first 5 clearest images
-        limited_collection = sorted_collection.limit(5)
-    else:
-        limited_collection = sorted_collection.limit(image_count)
-
-    # Select the first (clearest) image from the sorted collection
-    clearest_image = limited_collection.first().clip(roi_geometry)
-
-    m0.addLayer(clearest_image, {'bands': ['B4', 'B3', 'B2'],  # True color bands
-                'min': 0,
-                'max': 2000,
-                }, 'Satellite Imagery')
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        m0.to_streamlit(height=500)
-
-        if uploaded_image is not None:
-            st.write("Landcover NAIP layer from PEARL landcover.io:")
-            st.image(uploaded_image)
-                
-    with col2:
-        
-        st.write(f'Number of clear satellite images in the range provided: {image_count}')
-
-        # Iterate through the collection and extract timestamps
-        timestamps = []
-        for image in limited_collection.getInfo()['features']:
-            timestamp_ms = image['properties']['system:time_start']
-            datetime_obj = datetime.datetime.fromtimestamp(timestamp_ms / 1000)
-            formatted_date = datetime_obj.strftime('%m-%d-%Y')
-            timestamps.append(formatted_date)
-
-        # Convert the list to a Pandas DataFrame for a table format
-        dates_df = pd.DataFrame({'Date': timestamps})
-
-        # # Print the DataFrame
-        # st.write("Satellite imagery (for clearest dates):")
-        # st.dataframe(dates_df)
+    # The ROI step is drawn here once the request below has been fetched
+    roi_container = st.container()
 
     st.header("STEP 4: Calculate Landcover Area and Map the Potential Areas for Reforestation")
-    st.write("Click on the button below to calculate the NLCD map and landcover type breakdown for your ROI.")
+    st.write("Click on the button below to calculate the landcover map and landcover type breakdown for your ROI.")
 
     # Button to set the selected geometry as ROI
-    if st.button("Calculate"):
+    calculate = st.button("Calculate")
+    progressive = st.toggle("Show a quick estimate while large ROIs are calculated at 30 m", value=True)
+    roi = roi_geometry
+
+    # Results stay on the page for this ROI after Calculate, so moving the
+    # slope threshold slider updates them in place
+    if calculate:
+        st.session_state['calculated'] = statistics_key
+    show_results = st.session_state.get('calculated') == statistics_key
+
+    # Fetch whatever is not cached in one request: the Sentinel-2 summary,
+    # plus the joint landcover-by-slope histogram once Calculate was clicked
+    with stage('imagery_cache') as timed:
+        imagery = cache.get(imagery_key)
+        timed.cache = 'miss' if imagery is None else 'hit'
+    stored_imagery_tiles = tile_names(imagery)
+    statistics = None
+    if show_results:
+        with stage('statistics_cache') as timed:
+            statistics = cache.get(statistics_key)
+            timed.cache = 'miss' if statistics is None else 'hit'
+        stored_tiles = tile_names(statistics)
+
+    if show_results:
+        layers = build_layers(roi, slope_threshold, landcover)
+        pixels = estimate_pixels(roi_geojson)
+        started = time.perf_counter()
+        if statistics is None and progressive and pixels > PROGRESSIVE_PIXELS:
+            # Large ROIs: show a coarse estimate now and refine to 30 m in the background
+            start_refine(statistics_key, roi_geojson, landcover)
+            statistics = cache.get(estimate_key)
+            stored_tiles = tile_names(statistics)
+            if statistics is None:
+                results, imagery = fetch_with_imagery(estimate_request(roi, layers['joint']), collection, imagery,
+                                                      'estimate_reduce_region')
+                statistics = dict(normalize_estimate(results), tiles={}, latency=time.perf_counter() - started)
+        elif statistics is None:
+            if pixels <= TILE_PIXELS:
+                # One reduceRegion, with the Sentinel-2 summary when it is not cached
+                results, imagery = fetch_with_imagery(histogram_request(roi, layers['joint']), collection, imagery,
+                                                      'calculate_reduce_region')
+                statistics = {'joint': results['joint'], 'tiles': {}}
+            else:
+                # Large ROIs are read from the grid index, or split into tiles reduced in parallel
+                with stage('tiled_reduce_region'):
+                    statistics = dict(joint_histogram(roi_geojson, landcover), tiles={})
+            statistics['latency'] = time.perf_counter() - started
+        elif not statistics['tiles']:
+            # A refined result from the background keeps the map tiles of its estimate
+            estimate = cache.get(estimate_key)
+            if estimate is not None:
+                statistics['tiles'] = estimate['tiles']
+                statistics['plantable_tiles'] = estimate.get('plantable_tiles', {})
+        is_estimate = statistics.get('estimate', False)
+    if imagery is None:
+        imagery = dict(fetch(imagery_request(collection), 'sentinel2_query'), tiles={})
+
+    image_count = int(imagery['image_count'])
+    timestamps = format_dates(imagery['image_dates'])
+
+    with stage('map_tiles') as timed:
+        timed.cache = 'hit' if {"ROI", overlay_name} <= set(imagery['tiles']) else 'miss'
+        prefetch_tiles(imagery['tiles'], [(roi_geometry, {}, "ROI"), (overlay, TRUE_COLOR, overlay_name)])
+        add_cached_layer(m0, imagery['tiles'], roi_geometry, {}, "ROI")
+        add_cached_layer(m0, imagery['tiles'], overlay, TRUE_COLOR, overlay_name)
+    if tile_names(imagery) != stored_imagery_tiles:
+        cache.set(imagery_key, imagery)
+
+    with roi_container:
+        col1, col2 = st.columns(2)
 
-        # Convert ROI to GeoJSON
-        roi_geojson = roi_geometry.getInfo()
-        custom_geojson_json = json.dumps(roi_geojson, indent=2)
+        with col1:
+            with stage('map_render'):
+                m0.to_streamlit(height=500)
 
-        # Create an Earth Engine Feature from the GeoJSON and add it to the map
-        roi_feature= ee.Feature(ee.Geometry(roi_geojson))
-        roi = roi_feature.geometry()
-        m1.addLayer(roi, {'color': 'FF0000'}, 'ROI')
+            if uploaded_image is not None:
+                st.write("Landcover NAIP layer from PEARL landcover.io:")
+                st.image(uploaded_image)
+                    
+        with col2:
+            
+            st.write(f'Number of clear satellite images in the range provided: {image_count}')
+
+            # Convert the list to a Pandas DataFrame for a table format
+            dates_df = pd.DataFrame({'Date': timestamps})
+
+            # # Print the DataFrame
+            # st.write("Satellite imagery (for clearest dates):")
+            # st.dataframe(dates_df)
+
+    if show_results:
+
+        # Latency of each stage, to tune the estimate scale
+        if is_estimate:
+            refine_status(statistics_key, statistics['scale'])
+            st.caption(f"Estimate at {statistics['scale']} m: {statistics['latency']:.1f} s")
+        elif 'latency' in statistics:
+            estimate = cache.get(estimate_key)
+            stages = [f"Estimate at {estimate['scale']} m: {estimate['latency']:.1f} s"] if estimate else []
+            stages.append(f"30 m result: {statistics['latency']:.1f} s")
+            st.caption(" · ".join(stages))
+
+        # Create the maps of the Calculate step
+        m1 = geemap.Map()
+        ms = geemap.Map()
+        m1.add_basemap("SATELLITE")
+        ms.add_basemap("TERRAIN")
+
+        tiles = statistics['tiles']
+        slope_vis = {'min':0, 'max':40, 'palette': 'rainbow'}
+        with stage('map_tiles') as timed:
+            timed.cache = 'hit' if {'ROI', landcover_info['layer'], 'Slope'} <= set(tiles) else 'miss'
+            prefetch_tiles(tiles, [(roi, {'color': 'FF0000'}, 'ROI'),
+                                   (layers['landcover'], {}, landcover_info['layer']),
+                                   (layers['slope'], slope_vis, 'Slope')])
+        add_cached_layer(m1, tiles, roi, {'color': 'FF0000'}, 'ROI')
         
         # Create a map and add the clipped elevation image
-        m1.centerObject(roi)
-        m2.centerObject(roi)
-
-        # Add NLCD 2021 and clip to the user-defined ROI
-        nlcd = ee.Image('USGS/NLCD_RELEASES/2021_REL/NLCD/2021').select('landcover').clip(roi)
-        m1.addLayer(nlcd, {}, 'NLCD 2021')
-
-        # Add a legend for the NLCD data
-        m1.add_legend(builtin_legend='NLCD')
-
-        # Define forested areas (NLCD class 41, 42, and 43) and slope threshold
-        forested = nlcd.eq(41).And(nlcd.eq(42)).And(nlcd.eq(43))
+        zoom_to_geometry(m1, roi_geojson)
 
-        # Create a binary mask for non-forested areas and other features
-        non_forested = nlcd.neq(41).And(nlcd.neq(42)).And(nlcd.neq(43))  \
-        .And(nlcd.neq(11)).And(nlcd.neq(12)).And(nlcd.neq(21))  \
-        .And(nlcd.neq(22)).And(nlcd.neq(23)).And(nlcd.neq(24))   \
-        .And(nlcd.neq(90)).And(nlcd.neq(95)).And(nlcd.neq(82)) \
-        .And(nlcd.neq(81))
+        # Add the landcover clipped to the user-defined ROI
+        add_cached_layer(m1, tiles, layers['landcover'], {}, landcover_info['layer'])
 
-        # Clip the elevation image to ROI
-        elevation = ee.Image('CGIAR/SRTM90_V4').clip(roi)
+        # Add a legend for the landcover data
+        m1.add_legend(builtin_legend=landcover_info['builtin_legend'])
 
         # Apply an algorithm to an image to compute the slope
-        slope = ee.Terrain.slope(elevation)
-        slope_vis = {'min':0, 'max':40, 'palette': 'rainbow'}
-        ms.addLayer(slope, slope_vis, "Slope")
-        ms.centerObject(roi)
+        slope = layers['slope']
+        add_cached_layer(ms, tiles, slope, slope_vis, "Slope")
+        zoom_to_geometry(ms, roi_geojson)
         
         # Add a colorbar for the slope layer
         ms.add_colorbar(
@@ -381,63 +418,24 @@ if geojson_json != "":
         col1, col2 = st.columns(2)   
         
         with col1:
-            st.header("NLCD Lancover Types")
-            m1.to_streamlit(height = 500, add_layer_control = True)
+            st.header(f"{landcover_info['layer']} Landcover Types")
+            with stage('map_render'):
+                m1.to_streamlit(height = 500, add_layer_control = True)
         with col2: 
             st.header("Slope Map")
-            ms.to_streamlit(height=500)
-
-            # Create a binary mask for slopes less than threshold
-            slope_lt_threshold_mask = slope.lt(slope_threshold)
-
-            # Create a binary mask for slopes greater than or equal to threshold
-            slope_ge_threshold_mask = slope.gte(slope_threshold)
-
-            # Apply masking to show slopes less than threshold in blue
-            blue_slope = slope.updateMask(slope_lt_threshold_mask)
-
-            # Apply masking to show slopes greater than or equal to threshold in red
-            red_slope = slope.updateMask(slope_ge_threshold_mask)
-
-            # Define the palette for slope layers
-            slope_palette = '0000FF'  # Default palette for slopes < 30 degrees
-            if slope_threshold == 20:
-                slope_palette = '00FF00'  # Change palette for slopes < 20 degrees
-            elif slope_threshold == 10:
-                slope_palette = 'FFFF00'  # Change palette for slopes < 10 degrees
-
-            # Add the slope layers with the dynamic legend
-            m2.addLayer(blue_slope, {'min': 0, 'max': 60, 'palette': slope_palette}, f'Slope < {slope_threshold} degrees', False)
-            m2.addLayer(red_slope, {'min': 0, 'max': 60, 'palette': 'FF0000'}, f'Slope >= {slope_threshold} degrees', False)
-
-            # Apply masking to show only non-forested areas
-            masked_non_forested_nlcd = nlcd.updateMask(non_forested).updateMask(slope_lt_threshold_mask)
-
-            # Add the masked layers to the map
-            m2.addLayer(masked_non_forested_nlcd, {}, 'NLCD 2021 Non-Forested')
-
-            # Calculate zonal statistics within the defined ROI
-            nlcd_stats = nlcd.reduceRegion(
-                reducer=ee.Reducer.frequencyHistogram(),
-                geometry=roi,
-                scale=30,
-            )
-
-            nlcd_dict = nlcd_stats.getInfo()
-            df = pd.DataFrame(nlcd_dict['landcover'].items(), columns=['Class', 'Sum'])
-            df['Sum'] = (df['Sum'] / 1000000*900 )
-            total_area = df['Sum'].sum()
-            df['Percentage'] = ((df['Sum'] / total_area) * 100).apply(lambda x: "{:.2f}%".format(x))
-            df['Sum'] = df['Sum'].apply(lambda x: "{:.2f}".format(x))
-            df['Description'] = df['Class'].apply(lambda x: nlcd_legend.get('Class_' + str(x), 'Unknown'))
-            df['Sum'] = pd.to_numeric(df['Sum'])
-            df = df.sort_values(by='Sum', ascending = False)
+            with stage('map_render'):
+                ms.to_streamlit(height=500)
+
+            # Non-forested areas below the slope threshold
+            masked_non_forested_nlcd = layers['plantable']
+
+            # Area summary of the zonal statistics of the ROI and of the plantable areas, fetched above
+            histograms = split_joint(statistics['joint'], slope_threshold, landcover)
+            summary = summarize_histograms([histograms['landcover'], histograms['plantable']], landcover=landcover)
+            df = area_table(summary, 0)
             
-            # Calculate the total areas for forested and non-forested areas
-            forested_area = df[df['Description'].isin(['Deciduous Forest', 'Evergreen Forest', 'Mixed Forest'])]['Sum'].sum()
-            non_forested_area = df[df['Description'].isin(['Developed - Open Space', 'Developed - Low Intensity', 'Developed - Medium Intensity', 'Developed - High Intensity',
-                                                            'Barren Land (Rock/Sand/Clay)', 'Dwarf Scrub', 'Shrub/Scrub', 'Grassland/Herbaceous', 'Sedge/Herbaceous',
-                                                            'Lichens', 'Moss', 'Pasture/Hay', 'Cultivated Crops', 'Woody Wetlands', 'Emergent Herbaceous Wetlands'])]['Sum'].sum()
+            # Total areas for forested and non-forested areas
+            forested_area, non_forested_area = summary['forested'][0], summary['non_forested'][0]
 
             total_area = forested_area + non_forested_area
         
@@ -448,58 +446,29 @@ if geojson_json != "":
         with col1:
             
             # Display the total areas for forested and non-forested areas with percentages
-            st.write(f"Total Forested Area: {forested_area:.2f} Sq. Km ({(forested_area / total_area * 100):.2f}%)")
-            st.write(f"Total Non-Forested Area: {non_forested_area:.2f} Sq. Km ({(non_forested_area / total_area * 100):.2f}%)")
-
-            # Create a horizontal bar plot with specified colors and percentages
-            plt.figure(figsize=(8, 4))
-            df = df.sort_values(by='Sum', ascending = True)
-            bars = plt.barh(df['Description'], df['Sum'].astype(float), color=[nlcd_colors.get(nlcd_legend['Class_' + str(class_val)], '#FFFFFF') for class_val in df['Class']])  # Use the nlcd_colors dictionary to get colors
+            st.write(f"Total Forested Area: {format_area(forested_area, total_area, statistics)} Sq. Km ({(forested_area / total_area * 100):.2f}%)")
+            st.write(f"Total Non-Forested Area: {format_area(non_forested_area, total_area, statistics)} Sq. Km ({(non_forested_area / total_area * 100):.2f}%)")
 
-            # Add percentages as text labels to the bars
-            for bar, percentage in zip(bars, df['Sum']):
-                plt.text(float(bar.get_width()), bar.get_y() + bar.get_height() / 2, percentage, ha='left', va='center')
-
-            plt.xlabel('Area (Sq. Km)')
-            plt.title('NLCD Landcover Types')
-            plt.tight_layout()  # To adjust the spacing
-
-            st.pyplot(plt)
+            # Horizontal bar chart with the class colors, drawn in the browser
+            with stage('chart_render'):
+                st.vega_lite_chart(bar_spec(df, landcover_info['colors'], f"{landcover_info['layer']} Landcover Types"),
+                                   use_container_width=True)
 
         with col2:
-            # Create a pie plot
-            fig, ax = plt.subplots(figsize=(2,2))
-            labels = ['Forested', 'Non-Forested']
-            sizes = [forested_area, non_forested_area]
-            colors = ['#68ab5f', '#b3ac9f']  # Forested in green, Non-Forested in gray
-            ax.pie(
-                sizes, 
-                labels=labels, 
-                colors=colors, 
-                autopct='%1.1f%%', 
-                startangle=90,
-            )
-            ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-
-            # Display the pie plot in Streamlit
-            # st.pyplot(fig)
-
-            # Calculate zonal statistics within the defined ROI
-            nlcd_stats = masked_non_forested_nlcd.reduceRegion(
-                reducer=ee.Reducer.frequencyHistogram(),
-                geometry=roi,
-                scale=30,
-            )
-
-            nlcd_dict = nlcd_stats.getInfo()
-            df = pd.DataFrame(nlcd_dict['landcover'].items(), columns=['Class', 'Sum'])
-            df['Sum'] = (df['Sum'] / 1000000*900 )
-            total_area_nf = df['Sum'].sum()
-            df['Percentage'] = ((df['Sum'] / total_area_nf) * 100).apply(lambda x: "{:.2f}%".format(x))
-            df['Sum'] = df['Sum'].apply(lambda x: "{:.2f}".format(x))
-            df['Description'] = df['Class'].apply(lambda x: nlcd_legend.get('Class_' + str(x), 'Unknown'))
-            df['Sum'] = pd.to_numeric(df['Sum'])
-            df = df.sort_values(by='Sum', ascending = False)
+            # Class breakdown of the uploaded landcover raster within the ROI
+            if temp_image_path is not None:
+                st.write("Uploaded landcover raster class breakdown:")
+                # The counts of the last ROI are kept with the upload, so a
+                # rerun does not read the raster again
+                roi_key = cache_key(roi_geojson)
+                if upload.get('histogram', (None,))[0] != roi_key:
+                    upload['histogram'] = (roi_key,) + class_histogram(temp_image_path, roi_geojson)
+                _, counts, pixel_area = upload['histogram']
+                st.dataframe(class_table(counts, pixel_area), hide_index=True)
+
+            # Breakdown of the plantable areas
+            df = area_table(summary, 1)
+            total_area_nf = summary['total'][1]
         
         st.header("Non-Forested Landcover Class Breakdown")
 
@@ -507,45 +476,21 @@ if geojson_json != "":
 
         with col1:
 
-            df = df.sort_values(by='Sum', ascending = True)
-
-            # Create a horizontal bar plot with specified colors and percentages
-            plt.figure(figsize=(8, 4))
-            bars = plt.barh(df['Description'], df['Sum'].astype(float), color=[nlcd_colors.get(nlcd_legend['Class_' + str(class_val)], '#FFFFFF') for class_val in df['Class']])  # Use the nlcd_colors dictionary to get colors
-
-            # Add percentages as text labels to the bars
-            for bar, percentage in zip(bars, df['Sum']):
-                plt.text(float(bar.get_width()), bar.get_y() + bar.get_height() / 2, percentage, ha='left', va='center')
-
-            plt.xlabel('Area (Sq. Km)')
-            plt.title('NLCD Landcover Types')
-            plt.tight_layout()  # To adjust the spacing
-
-            # Display the plot in Streamlit
-            st.pyplot(plt)
+            # Horizontal bar chart with the class colors, drawn in the browser
+            with stage('chart_render'):
+                st.vega_lite_chart(bar_spec(df, landcover_info['colors'], f"{landcover_info['layer']} Landcover Types"),
+                                   use_container_width=True)
 
         with col2:
-            # Create a pie plot
-            fig, ax = plt.subplots(figsize=(2,2))
-            labels = df['Description']
-            colors = [nlcd_colors.get(class_name, '#FFFFFF') for class_name in labels]
-            ax.pie(
-                df['Sum'], 
-                labels=labels, 
-                colors=colors, 
-                autopct='%1.1f%%', 
-                startangle=90
-            )
-            ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-
-            # Display the pie plot in Streamlit
-            st.pyplot(fig)
+            # Pie chart of the plantable classes
+            with stage('chart_render'):
+                st.vega_lite_chart(pie_spec(df, landcover_info['colors']), use_container_width=True)
         
         st.header("Potential for Reforestation Map")
-        st.write(f"Total plantable areas that are non-forested and within slope threshold:  {total_area_nf:.2f} sq. km ({(total_area_nf / total_area * 100):.2f}% of total ROI)")
+        st.write(f"Total plantable areas that are non-forested and within slope threshold:  {format_area(total_area_nf, total_area, statistics)} sq. km ({(total_area_nf / total_area * 100):.2f}% of total ROI)")
 
         m3 = geemap.Map()
-        m3.centerObject(roi)
+        zoom_to_geometry(m3, roi_geojson)
         m3.add_basemap("TERRAIN")
         
         # # Add Satellite Imagery
@@ -554,24 +499,122 @@ if geojson_json != "":
         #                             'max': 2000,
         #             }, 'Satellite Imagery')
 
-        m3.addLayer(masked_non_forested_nlcd, {'palette': 'green'}, 'Plantable Areas')
+        # The plantable layer differs per threshold, so its tiles are cached per threshold
+        plantable_tiles = statistics.setdefault('plantable_tiles', {}).setdefault(str(slope_threshold), {})
+        with stage('map_tiles') as timed:
+            timed.cache = 'hit' if 'Plantable Areas' in plantable_tiles else 'miss'
+            add_cached_layer(m3, plantable_tiles, masked_non_forested_nlcd, {'palette': 'green'}, 'Plantable Areas')
         m3.addLayerControl()
-        m3.to_streamlit()
-
-        # Export button
-        if st.button("Download Shapefile"):
+        with stage('map_render'):
+            m3.to_streamlit()
+
+        st.header("Plantable Area by Slope Threshold")
+        curve = threshold_curve(statistics['joint'], landcover)
+        st.line_chart(curve, x='Slope threshold (degrees)', y='Plantable (sq. km)')
+        st.caption(f"Selected threshold: {slope_threshold} degrees")
+        if tile_names(statistics) != stored_tiles:
+            cache.set(estimate_key if is_estimate else statistics_key, statistics)
+
+    # Forest loss and gain over the NLCD epochs, from one stacked reduction
+    if landcover == 'nlcd':
+        st.header("Forest Change Across NLCD Epochs")
+        first_epoch, last_epoch = st.select_slider("NLCD epochs", options=EPOCHS, value=(EPOCHS[0], EPOCHS[-1]))
+        epochs = epoch_range(first_epoch, last_epoch)
+        change_key = cache_key(roi_geojson, change=epochs)
+        if st.button("Analyze Change"):
+            st.session_state['change'] = change_key
+
+        if st.session_state.get('change') == change_key and len(epochs) > 1:
+            with stage('change_reduce_region') as timed:
+                change = cache.get(change_key)
+                timed.cache = 'miss' if change is None else 'hit'
+                if change is None:
+                    change = reduce_change(roi_geojson, epochs)
+                    cache.set(change_key, change)
+
+            transitions = forest_transitions(change['transition'])
+            forest_loss, forest_gain = transitions['Loss (sq. km)'].sum(), transitions['Gain (sq. km)'].sum()
+            st.write(f"Forest lost from {first_epoch} to {last_epoch}: {forest_loss:.2f} sq. km, "
+                     f"gained: {forest_gain:.2f} sq. km (net {forest_gain - forest_loss:+.2f} sq. km)")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("Area by epoch")
+                st.line_chart(trend_table(change), x='Year')
+            with col2:
+                st.write(f"Forest loss and gain by class, {first_epoch} to {last_epoch}")
+                st.bar_chart(transitions, x='Description', y=['Loss (sq. km)', 'Gain (sq. km)'])
+
+            st.write(f"Transition matrix (sq. km), {first_epoch} (rows) to {last_epoch} (columns)")
+            st.dataframe(transition_table(change['transition']).style.format("{:.2f}"))
+
+    # Export the plantable areas in the background; the job outlives reruns
+    st.header("Export Plantable Areas")
+    col1, col2 = st.columns(2)
+    with col1:
+        export_format = st.selectbox("File format", list(EXPORT_FORMATS))
+    with col2:
+        if st.button("Start Export"):
+            previous = st.session_state.get('export_job')
+            if previous is not None and previous.state != 'running':
+                scratch.remove(previous.directory)
+            # Room for the file, keeping the GeoTIFF on display and an export
+            # still being written
+            keep = [os.path.dirname(upload['path'])] if temp_image_path is not None else []
+            if previous is not None and previous.state == 'running':
+                keep.append(previous.directory)
             try:
-                st.write(os.path.exists(temp_dir.name))
-    
-                # Export the shapefile
-                output_shp = "Result.shp"
-                geemap.ee_export_vector(masked_non_forested_nlcd, output_shp, temp_dir, crs='EPSG:4326')
-                
-                # Display a download link
-                shapefile_path = os.path.join(temp_dir, output_shp)
-                
-                st.markdown(f"Download the Plantable Area shapefile [here]({shapefile_path}).")
-            except Exception as e:
-                st.exception("Error during shapefile export:")
+                get_scratch().reserve(scratch, estimate_export_bytes(roi_geojson), keep)
+            except QuotaExceeded as e:
+                st.error(f"The export cannot be stored: {e}")
+            else:
+                st.session_state['export_job'] = start_export(roi_geojson, slope_threshold, export_format, landcover,
+                                                              directory=scratch.mkdtemp('export-'))
+
+    if st.session_state.get('export_job') is not None:
+        export_status(st.session_state['export_job'])
+
+    # Evaluate every pasted feature and every row of the uploaded shapefile
+    batch_features = [(name, prepare_geometry(geometry, simplify_tolerance)[0])
+                      for name, geometry in features_from_geojson(custom_geojson)]
+    if shapefile_upload is not None:
+        if shapefile_upload.get('features', (None,))[0] != simplify_tolerance:
+            shapefile_upload['features'] = (simplify_tolerance, [
+                (name, prepare_geometry(geometry, simplify_tolerance)[0])
+                for name, geometry in features_from_gdf(custom_shape)])
+        batch_features += shapefile_upload['features'][1]
+
+    if len(batch_features) > 1:
+        st.header("Batch Mode: Evaluate Every Feature")
+        st.write(f"{len(batch_features)} features found in the pasted GeoJSON and the uploaded shapefile.")
+
+        if st.button("Evaluate All Features"):
+            progress = st.progress(0.0)
+            table = st.empty()
+
+            # Results stream into the table as the features finish
+            rows = []
+            for row in run_batch(batch_features, slope_threshold, landcover=landcover):
+                rows.append(row)
+                progress.progress(len(rows) / len(batch_features), text=f"{len(rows)} / {len(batch_features)} features")
+                table.dataframe(pd.DataFrame(rows), hide_index=True)
+
+            summary = summarize(rows)
+            st.write(f"Total Forested Area: {summary['forested_area']:.2f} Sq. Km")
+            st.write(f"Total Non-Forested Area: {summary['non_forested_area']:.2f} Sq. Km")
+            st.write(f"Total plantable areas that are non-forested and within slope threshold:  {summary['plantable_area']:.2f} sq. km ({summary['plantable_percentage']:.2f}% of all features)")
+            if summary['failed']:
+                st.warning(f"{summary['failed']} of {summary['features']} features could not be evaluated, see the Error column.")
 else:
-    st.error("Please input a GeoJSON in JSON format above or upload a GeoJSON file.")
\ No newline at end of file
+    st.error("Please input a GeoJSON in JSON format above or upload a GeoJSON file.")
+
+# Stage timings of this run, and recent percentiles of the server process
+if show_profiling:
+    import pandas as pd
+
+    with st.sidebar.expander("Stage timings", expanded=True):
+        st.write("This run")
+        st.dataframe(pd.DataFrame(metrics.trace()), hide_index=True)
+        st.write("Server process")
+        st.dataframe(pd.DataFrame(metrics.summary()), hide_index=True)
+metrics.publish()
@@ -0,0 +1 @@
+"""Shared computation code for the Reforestation Calculator pages."""
@@ -0,0 +1,121 @@
+"""Evaluate every feature of a FeatureCollection or shapefile.
+
+Each feature costs one Earth Engine request for its joint landcover-by-slope
+histogram (more for features large enough to be tiled, see
+reforestation.tiling), which is cached and serves every slope threshold.
+Features are evaluated on a bounded thread pool and yielded as they finish, so the page
+can fill its table while the rest of the batch is still running. A feature that fails is reported with
+its error instead of aborting the batch.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from reforestation.executor import get_executor
+from reforestation.cache import cache_key, get_cache
+from reforestation.summary import area_table, split_joint, summarize_histograms
+from reforestation.gridindex import joint_histogram
+
+MAX_WORKERS = 8
+
+
+# List the (name, GeoJSON geometry) pairs of a pasted GeoJSON object
+def features_from_geojson(geojson):
+    if geojson.get('type') == 'FeatureCollection':
+        features = geojson.get('features', [])
+    elif geojson.get('type') == 'Feature':
+        features = [geojson]
+    else:
+        features = [{'geometry': geojson, 'properties': {}}]
+
+    return [(feature_name(feature.get('properties'), index), feature['geometry'])
+            for index, feature in enumerate(features)
+            if feature.get('geometry') is not None]
+
+
+# List the (name, GeoJSON geometry) pairs of an uploaded shapefile
+def features_from_gdf(gdf):
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(epsg=4326)
+    properties = gdf.drop(columns=gdf.geometry.name).to_dict('records')
+    return [(feature_name(props, index), geometry.__geo_interface__)
+            for index, (props, geometry) in enumerate(zip(properties, gdf.geometry))
+            if geometry is not None and not geometry.is_empty]
+
+
+# Use a name-like property of the feature as its label, else its position
+def feature_name(properties, index):
+    for key in ('name', 'Name', 'NAME', 'id', 'ID'):
+        if properties and properties.get(key) not in (None, ''):
+            return str(properties[key])
+    return f"Feature {index + 1}"
+
+
+# Fetch (or read from the cache) the joint landcover-by-slope histogram of
+# one feature; it serves every slope threshold
+def feature_statistics(geometry, landcover='nlcd'):
+    cache = get_cache()
+    key = cache_key(geometry, landcover=landcover)
+    statistics = cache.get(key)
+    if statistics is None:
+        statistics = dict(joint_histogram(geometry, landcover), tiles={})
+        cache.set(key, statistics)
+    return statistics
+
+
+# Summarize one feature: forest/non-forest area, plantable area and the area
+# of every landcover class
+def evaluate_feature(name, geometry, slope_threshold, landcover='nlcd'):
+    histograms = split_joint(feature_statistics(geometry, landcover)['joint'], slope_threshold, landcover)
+    summary = summarize_histograms([histograms['landcover'], histograms['plantable']], landcover=landcover)
+    forested_area, non_forested_area = summary['forested'][0], summary['non_forested'][0]
+    plantable_area = summary['total'][1]
+    total_area = forested_area + non_forested_area
+
+    row = {
+        'Feature': name,
+        'Forested (sq. km)': forested_area,
+        'Non-Forested (sq. km)': non_forested_area,
+        'Plantable (sq. km)': plantable_area,
+        'Plantable (%)': plantable_area / total_area * 100 if total_area else 0.0,
+        'Error': None,
+    }
+    df = area_table(summary, 0)
+    row.update(zip(df['Description'], df['Sum']))
+    return row
+
+
+# Evaluate all features concurrently and yield one row per feature as it finishes
+def run_batch(features, slope_threshold, max_workers=MAX_WORKERS, landcover='nlcd'):
+    executor = get_executor()
+    token = executor.current_token()
+    evaluate = executor.bind(evaluate_feature, token)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {pool.submit(evaluate, name, geometry, slope_threshold, landcover): name
+                   for name, geometry in features}
+        for future in executor.as_completed(futures, token):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'Feature': futures[future], 'Error': str(e)}
+    finally:
+        # A rerun closes the generator mid-batch: drop the queued features and
+        # leave the running ones to fail on the cancelled token, without
+        # blocking the script thread on them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Aggregate summary of a finished batch
+def summarize(rows):
+    succeeded = [row for row in rows if row.get('Error') is None]
+    forested_area = sum(row['Forested (sq. km)'] for row in succeeded)
+    non_forested_area = sum(row['Non-Forested (sq. km)'] for row in succeeded)
+    plantable_area = sum(row['Plantable (sq. km)'] for row in succeeded)
+    total_area = forested_area + non_forested_area
+    return {
+        'features': len(rows),
+        'failed': len(rows) - len(succeeded),
+        'forested_area': forested_area,
+        'non_forested_area': non_forested_area,
+        'plantable_area': plantable_area,
+        'plantable_percentage': plantable_area / total_area * 100 if total_area else 0.0,
+    }
@@ -0,0 +1,164 @@
+"""Content-addressed cache for the calculator results.
+
+Entries are keyed on a hash of the ROI geometry and the parameters of the
+query (slope threshold, date range, ...), and hold plain JSON values:
+histogram dicts, image dates and map tile URLs. Lookups go through an
+in-memory LRU first and then an on-disk directory of JSON files, both with a
+time-to-live. The disk tier is evicted oldest-first once it outgrows its size
+budget. One cache is shared by every session of the server process, so
+values are copied in and out: a caller changing its copy has to set() it
+again for the change to be seen.
+"""
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Map tile URLs issued by Earth Engine expire, so entries are kept for a few hours
+DEFAULT_TTL = 6 * 3600
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_DIRECTORY = os.environ.get(
+    'REFORESTATION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'reforestation-cache'))
+
+
+# Canonical hash of a GeoJSON geometry plus query parameters.
+# Coordinates are rounded so the same ROI pasted twice hashes the same.
+def cache_key(geometry, **params):
+    def canonical(value):
+        if isinstance(value, float):
+            return round(value, 9)
+        if isinstance(value, (list, tuple)):
+            return [canonical(v) for v in value]
+        if isinstance(value, dict):
+            return {k: canonical(v) for k, v in value.items()}
+        return value
+
+    payload = json.dumps({'geometry': canonical(geometry), 'params': canonical(params)},
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    # Return a copy of the cached value for `key`, or None on a miss
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return copy.deepcopy(value)
+                del self._memory[key]
+
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            expires_at = os.path.getmtime(path) + self.ttl
+            if expires_at <= now:
+                os.remove(path)
+                return None
+            with open(path, 'r') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(key, copy.deepcopy(value), expires_at)
+        return value
+
+    # Store a copy of a JSON-serializable value under `key` in both tiers
+    def set(self, key, value):
+        self._remember(key, copy.deepcopy(value), time.time() + self.ttl)
+        if self.directory is None:
+            return
+
+        # Write to a temporary file first so readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict_disk()
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    # Drop expired files, then the oldest ones until the directory fits max_bytes
+    def _evict_disk(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_mtime + self.ttl <= now:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    self._remove(os.path.join(self.directory, name))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Return the cache shared by all sessions of this process
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
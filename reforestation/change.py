@@ -0,0 +1,123 @@
+"""Multi-year NLCD change analysis in one stacked reduction.
+
+Every NLCD epoch between two years is stacked into one multi-band image, one
+band per epoch, plus a transition band that encodes the class of the first
+epoch and the class of the last one as from * N_CLASSES + to. A single
+frequencyHistogram over the stack returns the class histogram of every epoch
+and the transition histogram together, so the whole analysis costs one
+request (one per tile for ROIs large enough to be tiled, see
+reforestation.tiling). Trends, the transition matrix and the forest loss and
+gain are then computed locally from that result.
+"""
+import ee
+import numpy as np
+import pandas as pd
+
+from reforestation.executor import get_executor, request_key
+from reforestation.landcover import PIXEL_AREA
+from reforestation.planner import MAX_PIXELS
+from reforestation.session import NLCD_EPOCHS, dataset
+from reforestation.summary import LOOKUPS, N_CLASSES, count_matrix, summarize_histograms
+from reforestation.tiling import TILE_PIXELS, merge_histograms, plan_tiles, tile_geometry
+
+EPOCHS = sorted(NLCD_EPOCHS)
+
+# The stack reduces one band per epoch plus the transitions, so tiles hold
+# fewer pixels than those of the single-band joint histogram
+CHANGE_TILE_PIXELS = TILE_PIXELS / 4
+
+
+# Epochs from `first` to `last` (inclusive)
+def epoch_range(first, last):
+    return [year for year in EPOCHS if first <= year <= last]
+
+
+def band_name(year):
+    return f"y{year}"
+
+
+# Stack the NLCD epochs of the ROI, one band per epoch, and the transition
+# band from the first epoch to the last
+def epoch_stack(roi, epochs):
+    bands = [dataset(f'nlcd_{year}').rename(band_name(year)) for year in epochs]
+    first, last = bands[0].toInt32(), bands[-1].toInt32()
+    transition = first.multiply(N_CLASSES).add(last).rename('transition')
+    return ee.Image.cat(bands + [transition]).clip(roi)
+
+
+# Request for the class histogram of every epoch and the transition histogram
+def change_request(roi, epochs, scale=30, max_pixels=MAX_PIXELS, tile_scale=1):
+    return epoch_stack(roi, epochs).reduceRegion(
+        reducer=ee.Reducer.frequencyHistogram(),
+        geometry=roi,
+        scale=scale,
+        maxPixels=max_pixels,
+        tileScale=tile_scale,
+    )
+
+
+# Rename the bands of a fetched reduction; empty ROIs reduce to null histograms
+def normalize_change(result, epochs):
+    return {
+        'epochs': {str(year): result.get(band_name(year)) or {} for year in epochs},
+        'transition': result.get('transition') or {},
+    }
+
+
+# Epoch and transition histograms of an ROI of any size. The tiles are
+# requested together through the shared executor and summed.
+def reduce_change(geometry, epochs, tile_pixels=CHANGE_TILE_PIXELS):
+    requests = []
+    for tile in plan_tiles(geometry, tile_pixels):
+        request = change_request(tile_geometry(tile), epochs)
+        requests.append((request_key('getInfo', request), request.getInfo))
+    results = [normalize_change(result, epochs) for result in get_executor().run_all(requests)]
+    return {
+        'epochs': {str(year): merge_histograms(result['epochs'][str(year)] for result in results)
+                   for year in epochs},
+        'transition': merge_histograms(result['transition'] for result in results),
+    }
+
+
+# Forested, non-forested and plantable area (sq. km) of every epoch
+def trend_table(change, pixel_area=PIXEL_AREA):
+    years = sorted(change['epochs'], key=int)
+    summary = summarize_histograms([change['epochs'][year] for year in years], pixel_area)
+    return pd.DataFrame({
+        'Year': [int(year) for year in years],
+        'Forested (sq. km)': summary['forested'],
+        'Non-Forested (sq. km)': summary['non_forested'],
+        'Plantable (sq. km)': summary['areas'] @ LOOKUPS['nlcd']['plantable'],
+    })
+
+
+# Transition areas (sq. km) as an (N_CLASSES, N_CLASSES) matrix, from-class rows
+def transition_areas(histogram, pixel_area=PIXEL_AREA):
+    matrix = count_matrix([histogram], N_CLASSES * N_CLASSES).reshape(N_CLASSES, N_CLASSES)
+    return matrix * (pixel_area / 1000000)
+
+
+# Transition matrix (sq. km) between the classes present in either epoch,
+# with from-class rows and to-class columns
+def transition_table(histogram, pixel_area=PIXEL_AREA):
+    areas = transition_areas(histogram, pixel_area)
+    classes = np.flatnonzero(areas.sum(axis=0) + areas.sum(axis=1))
+    descriptions = LOOKUPS['nlcd']['descriptions'][classes]
+    return pd.DataFrame(areas[np.ix_(classes, classes)], index=pd.Index(descriptions, name='From'),
+                        columns=pd.Index(descriptions, name='To'))
+
+
+# Forest lost to and gained from every other class (sq. km) between the
+# first and the last epoch
+def forest_transitions(histogram, pixel_area=PIXEL_AREA):
+    areas = transition_areas(histogram, pixel_area)
+    forest = LOOKUPS['nlcd']['forested'] > 0
+    loss = np.where(forest, 0.0, areas[forest].sum(axis=0))
+    gain = np.where(forest, 0.0, areas[:, forest].sum(axis=1))
+    classes = np.flatnonzero(loss + gain)
+    return pd.DataFrame({
+        'Class': classes,
+        'Description': LOOKUPS['nlcd']['descriptions'][classes],
+        'Loss (sq. km)': loss[classes],
+        'Gain (sq. km)': gain[classes],
+    })
@@ -0,0 +1,110 @@
+"""Declarative Vega-Lite specs of the area breakdown charts.
+
+The bar and pie charts of the class breakdowns are built as Vega-Lite specs
+from the area tables of reforestation.summary, with the class colors of the
+landcover dataset, and drawn in the browser by st.vega_lite_chart. The data
+rows travel inline with the spec, a few hundred bytes per class, instead of
+a PNG rasterized on every rerun. Specs are cached in memory by a hash of
+their rows and options, so repeated views of the same result (a rerun, the
+same ROI from another session) cost a dict lookup.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+MAX_SPECS = 512
+# Color of classes missing from the color table
+DEFAULT_COLOR = '#FFFFFF'
+
+_specs = OrderedDict()
+_lock = threading.Lock()
+
+
+# Rows of an area table: class description, area (sq. km) and percentage
+def chart_rows(df):
+    return [{'Description': description, 'Sum': round(float(area), 4), 'Percentage': round(float(percentage), 2)}
+            for description, area, percentage in zip(df['Description'], df['Sum'], df['Percentage'])]
+
+
+# Hash of the rows and options of a chart
+def spec_key(kind, rows, **options):
+    payload = json.dumps([kind, rows, options], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Build a spec once per key; the most recently used specs are kept
+def cached_spec(kind, rows, build, **options):
+    key = spec_key(kind, rows, **options)
+    with _lock:
+        spec = _specs.get(key)
+        if spec is not None:
+            _specs.move_to_end(key)
+            return spec
+    spec = build(rows, **options)
+    with _lock:
+        _specs[key] = spec
+        while len(_specs) > MAX_SPECS:
+            _specs.popitem(last=False)
+    return spec
+
+
+def color_scale(rows, colors):
+    descriptions = [row['Description'] for row in rows]
+    return {'domain': descriptions, 'range': [colors.get(description, DEFAULT_COLOR) for description in descriptions]}
+
+
+def build_bar(rows, colors, title):
+    return {
+        '$schema': 'https://vega.github.io/schema/vega-lite/v5.json',
+        'title': title,
+        'data': {'values': rows},
+        'encoding': {
+            'y': {'field': 'Description', 'type': 'nominal', 'sort': '-x', 'title': None},
+            'x': {'field': 'Sum', 'type': 'quantitative', 'title': 'Area (Sq. Km)'},
+        },
+        'layer': [
+            {'mark': {'type': 'bar', 'stroke': '#999999', 'strokeWidth': 0.5},
+             'encoding': {
+                 'color': {'field': 'Description', 'type': 'nominal', 'scale': color_scale(rows, colors),
+                           'legend': None},
+                 'tooltip': [{'field': 'Description'}, {'field': 'Sum', 'format': '.2f', 'title': 'Sq. Km'},
+                             {'field': 'Percentage', 'format': '.1f', 'title': '%'}],
+             }},
+            {'mark': {'type': 'text', 'align': 'left', 'dx': 3},
+             'encoding': {'text': {'field': 'Sum', 'type': 'quantitative', 'format': '.2f'}}},
+        ],
+    }
+
+
+def build_pie(rows, colors):
+    return {
+        '$schema': 'https://vega.github.io/schema/vega-lite/v5.json',
+        'data': {'values': rows},
+        'transform': [
+            {'joinaggregate': [{'op': 'sum', 'field': 'Sum', 'as': 'Total'}]},
+            {'calculate': 'datum.Sum / datum.Total', 'as': 'Share'},
+        ],
+        'encoding': {
+            'theta': {'field': 'Sum', 'type': 'quantitative', 'stack': True},
+            'color': {'field': 'Description', 'type': 'nominal', 'scale': color_scale(rows, colors),
+                      'legend': {'title': None}},
+            'tooltip': [{'field': 'Description'}, {'field': 'Sum', 'format': '.2f', 'title': 'Sq. Km'},
+                        {'field': 'Share', 'format': '.1%'}],
+        },
+        'layer': [
+            {'mark': {'type': 'arc', 'stroke': '#FFFFFF'}},
+            {'mark': {'type': 'text', 'radiusOffset': 20, 'radius': 60},
+             'encoding': {'text': {'field': 'Share', 'type': 'quantitative', 'format': '.1%'}}},
+        ],
+    }
+
+
+# Horizontal bar chart of an area table, largest class on top
+def bar_spec(df, colors, title):
+    return cached_spec('bar', chart_rows(df), build_bar, colors=colors, title=title)
+
+
+# Pie chart of an area table
+def pie_spec(df, colors):
+    return cached_spec('pie', chart_rows(df), build_pie, colors=colors)
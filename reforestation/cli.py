@@ -0,0 +1,164 @@
+"""Command-line screening of many ROIs.
+
+Reads ROIs from a GeoJSON file or shapefile, evaluates them on a process pool
+and streams one row per ROI to a CSV file or a Parquet dataset (a directory of
+part files). ROIs already evaluated in the output are skipped, so an
+interrupted run resumes where it stopped; rows of ROIs that failed are
+dropped on resume and those ROIs are evaluated again.
+
+Usage:
+    python -m reforestation.cli parcels.shp -o screening.csv --slope-threshold 20
+    python -m reforestation.cli parcels.geojson -o screening.parquet --workers 16
+
+Earth Engine credentials are taken from --service-account/--key-file (or the
+EE_SERVICE_ACCOUNT/EE_KEY_FILE environment variables), else from the default
+`earthengine authenticate` credentials.
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import ee
+import pandas as pd
+
+from reforestation import session
+from reforestation.landcover import nlcd_legend
+from reforestation.pipeline import evaluate_roi, read_rois
+
+# Fixed output columns, so every flushed chunk has the same schema
+COLUMNS = ['feature_id', 'Feature', 'Forested (sq. km)', 'Non-Forested (sq. km)', 'Plantable (sq. km)',
+           'Plantable (%)', 'Error'] + list(nlcd_legend.values())
+
+
+# Initialize Earth Engine in each worker process
+def init_worker(service_account, key_file):
+    if service_account and key_file:
+        with open(key_file) as f:
+            session.initialize(service_account, f.read())
+    else:
+        ee.Initialize()
+
+
+def evaluate(feature_id, name, geometry, slope_threshold):
+    try:
+        row = evaluate_roi(name, geometry, slope_threshold)
+    except Exception as e:
+        row = {'Feature': name, 'Error': str(e)}
+    row['feature_id'] = feature_id
+    return row
+
+
+# Append rows to a CSV file or to part files of a Parquet dataset
+class ResultWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        if self.parquet:
+            os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    # IDs of the ROIs an earlier run evaluated without an error
+    def done(self):
+        if self.parquet:
+            parts = self._parts()
+            if not parts:
+                return set()
+            df = pd.concat(pd.read_parquet(part, columns=['feature_id', 'Error']) for part in parts)
+        elif os.path.exists(self.path):
+            df = pd.read_csv(self.path, usecols=['feature_id', 'Error'])
+        else:
+            return set()
+        return set(df.loc[df['Error'].isna(), 'feature_id'])
+
+    # Remove the rows of failed ROIs from the output, so the rows of their
+    # next evaluation take their place; returns the number of rows removed.
+    # Emptied Parquet parts are kept, since part names follow their count.
+    def drop_failed(self):
+        paths = self._parts() if self.parquet else [self.path] if os.path.exists(self.path) else []
+        removed = 0
+        for path in paths:
+            df = pd.read_parquet(path) if self.parquet else pd.read_csv(path)
+            failed = df['Error'].notna()
+            if not failed.any():
+                continue
+            removed += int(failed.sum())
+            df = df[~failed].reindex(columns=COLUMNS)
+            df['Error'] = df['Error'].astype('string')
+            tmp_path = path + '.tmp'
+            if self.parquet:
+                df.to_parquet(tmp_path, index=False)
+            else:
+                df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        return removed
+
+    def write(self, rows):
+        df = pd.DataFrame(rows).reindex(columns=COLUMNS)
+        df['Error'] = df['Error'].astype('string')
+        if self.parquet:
+            df.to_parquet(os.path.join(self.path, f"part-{len(self._parts()):06d}.parquet"), index=False)
+        else:
+            df.to_csv(self.path, mode='a', header=not os.path.exists(self.path), index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen ROIs for reforestation potential.")
+    parser.add_argument('input', help="GeoJSON file or shapefile with one ROI per feature")
+    parser.add_argument('-o', '--output', required=True, help="output .csv file or .parquet directory")
+    parser.add_argument('--slope-threshold', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--flush-every', type=int, default=100, help="rows buffered before each write")
+    parser.add_argument('--service-account', default=os.environ.get('EE_SERVICE_ACCOUNT'))
+    parser.add_argument('--key-file', default=os.environ.get('EE_KEY_FILE'))
+    args = parser.parse_args(argv)
+
+    writer = ResultWriter(args.output)
+    retried = writer.drop_failed()
+    done = writer.done()
+    if retried:
+        print(f"Retrying {retried} ROIs that failed in an earlier run", file=sys.stderr)
+    if done:
+        print(f"Resuming: {len(done)} ROIs already in {args.output}", file=sys.stderr)
+
+    buffer = []
+    written = failed = 0
+
+    def collect(futures):
+        nonlocal written, failed
+        for future in futures:
+            row = future.result()
+            failed += row.get('Error') is not None
+            buffer.append(row)
+        if len(buffer) >= args.flush_every:
+            writer.write(buffer)
+            written += len(buffer)
+            buffer.clear()
+            print(f"{written} ROIs written ({failed} failed)", file=sys.stderr)
+
+    # Keep a bounded number of ROIs in flight so memory stays constant
+    max_pending = args.workers * 4
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.service_account, args.key_file)) as executor:
+        pending = set()
+        for feature_id, name, geometry in read_rois(args.input):
+            if feature_id in done:
+                continue
+            pending.add(executor.submit(evaluate, feature_id, name, geometry, args.slope_threshold))
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(pending)
+
+    if buffer:
+        writer.write(buffer)
+        written += len(buffer)
+    print(f"Done: {written} ROIs written ({failed} failed)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
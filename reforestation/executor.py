@@ -0,0 +1,248 @@
+"""Process-wide execution layer for Earth Engine requests.
+
+Every getInfo() and getMapId() of the app goes through one RequestExecutor:
+
+- calls run on a bounded thread pool, so independent requests of a page run
+  are in flight together while the process stays under MAX_WORKERS;
+- identical requests in flight (same serialized expression, e.g. the same ROI
+  and date range from two sessions) are coalesced into one call;
+- a token bucket keeps the process under RATE requests per second;
+- quota, rate-limit and unavailable errors are retried with jittered
+  exponential backoff;
+- each page run holds a CancelToken. When a rerun supersedes the run, its
+  queued requests and pending retries are dropped, unless another run is
+  still waiting for the same request.
+
+The token and heartbeat of a run belong to the script thread. Work a run fans
+out to its own thread pools (tiles, batch features, index cells) is wrapped
+with bind() so it runs under the token of the run, and the script thread
+waits for it with result() or as_completed(), which heartbeat. The heartbeat
+is not passed on: only the script thread may update Streamlit elements.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import ee
+
+MAX_WORKERS = 10
+# Sustained requests per second and burst size of the token bucket
+RATE = 10
+BURST = 20
+MAX_RETRIES = 5
+# Backoff base and cap in seconds
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+# How often a waiting caller checks for cancellation, in seconds
+WAIT_INTERVAL = 0.25
+
+# Error messages worth retrying: quota and rate limits, overloaded backends
+RETRYABLE = ('429', 'too many', 'quota', 'rate limit', 'resource_exhausted', '503', 'unavailable')
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def is_retryable(error):
+    message = str(error).lower()
+    return any(pattern in message for pattern in RETRYABLE)
+
+
+# Full-jitter exponential backoff delay for a retry attempt (0-based)
+def backoff_delay(attempt, base=BACKOFF, cap=MAX_BACKOFF):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimiter:
+
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Block until a request may be sent
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# A request in flight and the tokens of the runs waiting for it
+class _Call:
+
+    def __init__(self):
+        self.future = None
+        self.tokens = []
+
+    def abandoned(self):
+        return all(token is not None and token.cancelled for token in self.tokens)
+
+
+class RequestExecutor:
+
+    def __init__(self, max_workers=MAX_WORKERS, rate=RATE, burst=BURST, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ee-request')
+        self._limiter = RateLimiter(rate, burst)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {'calls': 0, 'coalesced': 0, 'retries': 0, 'cancelled': 0}
+
+    # Start a new page run for a session: the previous run of the session is
+    # cancelled, and its token becomes the default for this thread. `heartbeat`
+    # is called while the thread waits, so Streamlit can interrupt the wait.
+    def begin_run(self, state, heartbeat=None):
+        previous = state.get('_request_token')
+        if previous is not None:
+            previous.cancel()
+        token = state['_request_token'] = CancelToken()
+        self._local.token = token
+        self._local.heartbeat = heartbeat
+        return token
+
+    # The token of the page run on this thread, to hand to worker threads
+    def current_token(self):
+        return getattr(self._local, 'token', None)
+
+    # Wrap func so its requests run under `token` on whichever thread calls it
+    def bind(self, func, token):
+        def run(*args, **kwargs):
+            previous = getattr(self._local, 'token', None)
+            self._local.token = token
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.token = previous
+        return run
+
+    # Submit func() under a coalescing key; returns (future, token)
+    def submit(self, key, func, token=None):
+        if token is None:
+            token = getattr(self._local, 'token', None)
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.tokens.append(token)
+                self.stats['coalesced'] += 1
+                return call.future, token
+            call = self._calls[key] = _Call()
+            call.tokens.append(token)
+            call.future = self._pool.submit(self._run, key, call, func)
+            self.stats['calls'] += 1
+            return call.future, token
+
+    def _run(self, key, call, func):
+        try:
+            for attempt in range(self.max_retries + 1):
+                with self._lock:
+                    if call.abandoned():
+                        # Later submitters of the same request start a new call
+                        self._calls.pop(key, None)
+                        self.stats['cancelled'] += 1
+                        raise Cancelled()
+                self._limiter.acquire()
+                try:
+                    return self._call(key, func)
+                except ee.EEException as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    with self._lock:
+                        self.stats['retries'] += 1
+                    time.sleep(backoff_delay(attempt))
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    # Send one request; reforestation.replay overrides this to record or replay
+    def _call(self, key, func):
+        return func()
+
+    # Wait for a submitted request, giving up if the token is cancelled
+    def result(self, future, token=None):
+        heartbeat = getattr(self._local, 'heartbeat', None)
+        while True:
+            if token is not None and token.cancelled:
+                raise Cancelled()
+            try:
+                return future.result(timeout=WAIT_INTERVAL)
+            except FutureTimeoutError:
+                if heartbeat is not None:
+                    heartbeat()
+
+    # Yield futures as they finish, giving up if the token is cancelled
+    def as_completed(self, futures, token=None):
+        heartbeat = getattr(self._local, 'heartbeat', None)
+        pending = set(futures)
+        while pending:
+            if token is not None and token.cancelled:
+                raise Cancelled()
+            done, pending = wait(pending, timeout=WAIT_INTERVAL, return_when=FIRST_COMPLETED)
+            if not done and heartbeat is not None:
+                heartbeat()
+            yield from done
+
+    # Run several (key, func) requests concurrently and return their results in order
+    def run_all(self, requests, token=None):
+        submitted = [self.submit(key, func, token) for key, func in requests]
+        return [self.result(future, token) for future, token in submitted]
+
+    def get_info(self, ee_object, token=None):
+        future, token = self.submit(request_key('getInfo', ee_object), ee_object.getInfo, token)
+        return self.result(future, token)
+
+    def get_map_id(self, ee_object, vis_params, token=None):
+        future, token = self.submit(request_key('getMapId', ee_object, vis_params),
+                                    lambda: ee_object.getMapId(vis_params), token)
+        return self.result(future, token)
+
+
+# Coalescing key of a request: the method and the serialized expression
+def request_key(method, ee_object, params=None):
+    payload = json.dumps([method, ee_object.serialize(), params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# The executor shared by every session of the server process
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = RequestExecutor()
+        return _executor
+
+
+# Replace the shared executor (see reforestation.replay); returns the previous one
+def set_executor(executor):
+    global _executor
+    with _executor_lock:
+        previous, _executor = _executor, executor
+        return previous
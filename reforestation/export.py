@@ -0,0 +1,183 @@
+"""Background export of the plantable areas as vector data.
+
+The plantable mask is vectorized server-side with reduceToVectors, one tile
+of the ROI at a time (see reforestation.tiling), and simplified before it is
+downloaded. Each tile is streamed to the output file as it arrives:
+GeoPackage and FlatGeobuf through GDAL's Arrow writer, GeoParquet as one row
+group per tile. Exports run on a background thread and keep running across
+Streamlit reruns; the page keeps its job in the session state, and running
+jobs are tracked in a process-wide registry until they finish.
+"""
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+import ee
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from reforestation.executor import get_executor, request_key
+from reforestation.planner import build_layers
+from reforestation.tiling import estimate_pixels, plan_tiles, tile_geometry
+
+# File extension and MIME type of each output format
+EXPORT_FORMATS = {
+    'GeoPackage': ('gpkg', 'application/geopackage+sqlite3'),
+    'FlatGeobuf': ('fgb', 'application/octet-stream'),
+    'GeoParquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Pixels vectorized per tile; vectors are much heavier than histograms
+VECTOR_TILE_PIXELS = 5e6
+# Simplification tolerance of the exported polygons in metres (ROIs are
+# simplified with reforestation.ingest.SIMPLIFY_TOLERANCE)
+VECTOR_SIMPLIFY_TOLERANCE = 15
+# Upper estimate of the output size per 30 m pixel of the ROI, for the
+# scratch space reserved before an export starts
+EXPORT_BYTES_PER_PIXEL = 1
+
+SCHEMA = pa.schema([
+    pa.field('landcover', pa.int32()),
+    pa.field('geometry', pa.binary(), metadata={b'ARROW:extension:name': b'geoarrow.wkb'}),
+])
+
+
+# Vectorize the plantable areas of one tile and download them as an Arrow batch
+def tile_batch(tile, slope_threshold, scale=30, tolerance=VECTOR_SIMPLIFY_TOLERANCE, landcover='nlcd'):
+    roi = tile_geometry(tile)
+    vectors = build_layers(roi, slope_threshold, landcover)['plantable'].reduceToVectors(
+        geometry=roi,
+        scale=scale,
+        geometryType='polygon',
+        labelProperty='landcover',
+        maxPixels=1e10,
+        tileScale=2,
+    ).map(lambda feature: feature.simplify(maxError=tolerance))
+
+    # computeFeatures pages through collections larger than a getInfo() allows
+    executor = get_executor()
+    future, token = executor.submit(request_key('computeFeatures', vectors), lambda: ee.data.computeFeatures(
+        {'expression': vectors, 'fileFormat': 'GEOPANDAS_GEODATAFRAME'}))
+    gdf = executor.result(future, token)
+    if gdf.empty:
+        return pa.record_batch([pa.array([], pa.int32()), pa.array([], pa.binary())], schema=SCHEMA)
+    return pa.record_batch([
+        pa.array(gdf['landcover'].astype('int32')),
+        pa.array(shapely.to_wkb(gdf.geometry.values), pa.binary()),
+    ], schema=SCHEMA)
+
+
+# Stream record batches into a GeoParquet file, one row group per batch
+def write_geoparquet(batches, path):
+    geo = {
+        'version': '1.0.0',
+        'primary_column': 'geometry',
+        'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': []}},
+    }
+    schema = SCHEMA.with_metadata({b'geo': json.dumps(geo).encode('utf-8')})
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema))
+
+
+# Stream record batches into a GeoPackage or FlatGeobuf file through GDAL
+def write_ogr(batches, path, driver):
+    from pyogrio.raw import write_arrow
+
+    # GDAL only reports that the stream failed, so keep the original error
+    errors = []
+
+    def guarded():
+        try:
+            yield from batches
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    reader = pa.RecordBatchReader.from_batches(SCHEMA, guarded())
+    try:
+        write_arrow(reader, path, driver=driver, geometry_name='geometry', geometry_type='Unknown',
+                    crs='EPSG:4326')
+    except Exception:
+        if errors:
+            raise errors[0]
+        raise
+
+
+# Export the plantable areas of an ROI to `path`; progress(done, total) is
+# called after every tile
+def export_plantable(geometry, slope_threshold, export_format, path, progress=None, landcover='nlcd'):
+    tiles = plan_tiles(geometry, VECTOR_TILE_PIXELS)
+
+    def batches():
+        for done, tile in enumerate(tiles, start=1):
+            yield tile_batch(tile, slope_threshold, landcover=landcover)
+            if progress is not None:
+                progress(done, len(tiles))
+
+    if export_format == 'GeoParquet':
+        write_geoparquet(batches(), path)
+    elif export_format == 'GeoPackage':
+        write_ogr(batches(), path, 'GPKG')
+    else:
+        write_ogr(batches(), path, export_format)
+
+
+# Disk space to reserve for the export of an ROI, in bytes
+def estimate_export_bytes(geometry):
+    return int(estimate_pixels(geometry) * EXPORT_BYTES_PER_PIXEL)
+
+
+# An export running on a background thread
+class ExportJob:
+
+    def __init__(self, geometry, slope_threshold, export_format, directory=None, landcover='nlcd'):
+        extension, self.mime = EXPORT_FORMATS[export_format]
+        self.id = uuid.uuid4().hex
+        self.file_name = f"plantable_areas_{slope_threshold}.{extension}"
+        self.directory = directory or tempfile.mkdtemp(prefix='reforestation-export-')
+        self.path = os.path.join(self.directory, self.file_name)
+        self.state = 'running'
+        self.progress = 0.0
+        self.error = None
+        self._thread = threading.Thread(
+            target=self._run, args=(geometry, slope_threshold, export_format, landcover), daemon=True)
+
+    def _run(self, geometry, slope_threshold, export_format, landcover):
+        def progress(done, total):
+            self.progress = done / total
+
+        try:
+            export_plantable(geometry, slope_threshold, export_format, self.path, progress, landcover)
+            self.state = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+        with _jobs_lock:
+            _jobs.pop(self.id, None)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+# Start an export in the background and return its job; the file is written
+# to `directory` (a scratch directory of the session) or a new temporary one
+def start_export(geometry, slope_threshold, export_format, landcover='nlcd', directory=None):
+    job = ExportJob(geometry, slope_threshold, export_format, directory, landcover)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    return job.start()
+
+
+# A running export, or None once it has finished
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
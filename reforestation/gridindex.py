@@ -0,0 +1,271 @@
+"""Local grid index of precomputed joint landcover-by-slope histograms.
+
+The world is cut into a fixed grid of CELL_SIZE degree cells. Each cell of the
+index holds the joint histogram (see reforestation.planner.joint_image) of the
+landcover dataset and SRTM slope inside it, stored in SQLite as two binary
+arrays (codes and pixel counts). An ROI is then answered by summing the cells
+it fully covers, straight from the index, and reducing only the ROI inside its
+partial edge cells with Earth Engine. frequencyHistogram weights pixels by
+the fraction inside the geometry, so the cells and the edges add up to the
+histogram of the whole ROI.
+
+The index is built incrementally with the build command: cells are reduced
+on a thread pool and written as they finish, and cells already present from
+the same sources are skipped. A query never waits for the index to grow:
+full cells it finds missing are reduced together with its edges, through the
+tiled path of reforestation.tiling. With `prorate=True`, indexed edge cells are scaled by the share of the cell
+inside the ROI instead of being reduced, so a query needs no request at all.
+
+Usage:
+    python -m reforestation.gridindex build watershed.geojson --db cells.sqlite --workers 16
+    python -m reforestation.gridindex stats --db cells.sqlite
+
+The page and batch mode use the index named by REFORESTATION_GRID_INDEX.
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from shapely import prepared
+from shapely.geometry import box, shape
+from shapely.ops import unary_union
+
+from reforestation import session
+from reforestation.executor import get_executor
+from reforestation.summary import N_CLASSES, SLOPE_CODES, to_histogram
+from reforestation.tiling import MAX_WORKERS, merge_histograms, reduce_histograms, reduce_tile
+
+# Cell size in degrees (about 11 x 9 km, 1e5 30 m pixels at mid latitudes)
+CELL_SIZE = 0.1
+DEFAULT_PATH = os.environ.get('REFORESTATION_GRID_INDEX')
+
+# Datasets a cell was computed from; cells from other sources are rebuilt
+SOURCES = {
+    'nlcd': f"{session.NLCD_2021}|{session.SRTM}|{SLOPE_CODES}",
+    'worldcover': f"{session.WORLDCOVER}|{session.SRTM}|{SLOPE_CODES}",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    landcover TEXT NOT NULL,
+    col INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    codes BLOB NOT NULL,
+    counts BLOB NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (landcover, col, row)
+)
+"""
+
+
+# Column and row of the cells intersecting a geometry's bounds
+def cell_range(geom, cell_size=CELL_SIZE):
+    minx, miny, maxx, maxy = geom.bounds
+    return (math.floor(minx / cell_size), math.floor(miny / cell_size),
+            math.ceil(maxx / cell_size) - 1, math.ceil(maxy / cell_size) - 1)
+
+
+def cell_box(col, row, cell_size=CELL_SIZE):
+    return box(col * cell_size, row * cell_size, (col + 1) * cell_size, (row + 1) * cell_size)
+
+
+# Split the cells touching a geometry into those it fully covers and the
+# partial ones, with the part of the geometry inside each partial cell
+def cover(geom, cell_size=CELL_SIZE):
+    target = prepared.prep(geom)
+    full, partial = [], {}
+    min_col, min_row, max_col, max_row = cell_range(geom, cell_size)
+    for col in range(min_col, max_col + 1):
+        for row in range(min_row, max_row + 1):
+            cell = cell_box(col, row, cell_size)
+            if target.contains(cell):
+                full.append((col, row))
+            elif target.intersects(cell):
+                part = geom.intersection(cell)
+                if part.area > 0:
+                    partial[(col, row)] = part
+    return full, partial
+
+
+# Encode a joint histogram as (codes, counts) byte strings
+def encode(histogram):
+    codes = np.array([int(float(key)) for key in histogram], dtype=np.uint16)
+    counts = np.array(list(histogram.values()), dtype=np.float64)
+    return codes.tobytes(), counts.tobytes()
+
+
+# Reduce the joint histogram of one cell with Earth Engine
+def reduce_cell(col, row, landcover, cell_size=CELL_SIZE):
+    results = reduce_tile(cell_box(col, row, cell_size), landcover=landcover)
+    return merge_histograms(result['joint'] for result in results)
+
+
+class GridIndex:
+
+    def __init__(self, path, cell_size=CELL_SIZE):
+        self.path = path
+        self.cell_size = cell_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(SCHEMA)
+        self._connection.commit()
+
+    # Store the joint histogram of a cell
+    def put(self, landcover, col, row, histogram):
+        codes, counts = encode(histogram)
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (landcover, col, row, SOURCES[landcover], codes, counts, time.time()))
+            self._connection.commit()
+
+    # Read the (codes, counts) arrays of the indexed cells among `cells`
+    def get(self, landcover, cells):
+        cells = set(cells)
+        if not cells:
+            return {}
+        cols = [col for col, _ in cells]
+        rows = [row for _, row in cells]
+        with self._lock:
+            records = self._connection.execute(
+                'SELECT col, row, codes, counts FROM cells WHERE landcover = ? AND source = ? '
+                'AND col BETWEEN ? AND ? AND row BETWEEN ? AND ?',
+                (landcover, SOURCES[landcover], min(cols), max(cols), min(rows), max(rows))).fetchall()
+        return {(col, row): (np.frombuffer(codes, dtype=np.uint16), np.frombuffer(counts, dtype=np.float64))
+                for col, row, codes, counts in records if (col, row) in cells}
+
+    # Compute and store the cells that are missing (or all of them with
+    # refresh); progress(done, total) is called after every cell
+    def build(self, cells, landcover='nlcd', refresh=False, max_workers=MAX_WORKERS, progress=None):
+        cells = list(cells)
+        if not refresh:
+            present = self.get(landcover, cells)
+            cells = [cell for cell in cells if cell not in present]
+        if not cells:
+            return 0
+        executor = get_executor()
+        token = executor.current_token()
+        reduce = executor.bind(reduce_cell, token)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(cells))) as pool:
+            futures = {pool.submit(reduce, col, row, landcover, self.cell_size): (col, row)
+                       for col, row in cells}
+            for done, future in enumerate(executor.as_completed(futures, token), start=1):
+                col, row = futures[future]
+                self.put(landcover, col, row, future.result())
+                if progress is not None:
+                    progress(done, len(cells))
+        return len(cells)
+
+    # Build the index for every cell touching a GeoJSON geometry
+    def build_region(self, geometry, landcover='nlcd', **kwargs):
+        full, partial = cover(shape(geometry), self.cell_size)
+        return self.build(full + list(partial), landcover, **kwargs)
+
+    # Joint histogram of a GeoJSON geometry: indexed full cells are summed,
+    # and the ROI inside missing full cells and partial cells is reduced (the
+    # partial cells are prorated from indexed cells instead with `prorate`)
+    def query(self, geometry, landcover='nlcd', prorate=False, max_workers=MAX_WORKERS):
+        geom = shape(geometry)
+        full, partial = cover(geom, self.cell_size)
+
+        indexed_full = self.get(landcover, full)
+        arrays = list(indexed_full.values())
+        weights = [np.ones(len(codes)) for codes, _ in arrays]
+        missing = [cell_box(*cell, self.cell_size) for cell in full if cell not in indexed_full]
+        edges = partial
+        if prorate:
+            indexed = self.get(landcover, partial)
+            for cell, (codes, counts) in indexed.items():
+                share = partial[cell].area / cell_box(*cell, self.cell_size).area
+                arrays.append((codes, counts))
+                weights.append(np.full(len(codes), share))
+            edges = {cell: part for cell, part in partial.items() if cell not in indexed}
+
+        joint = {}
+        if arrays:
+            codes = np.concatenate([codes for codes, _ in arrays]).astype(np.intp)
+            counts = np.concatenate([counts for _, counts in arrays]) * np.concatenate(weights)
+            joint = to_histogram(np.bincount(codes, weights=counts, minlength=N_CLASSES * SLOPE_CODES))
+        if edges or missing:
+            rest = unary_union(list(edges.values()) + missing).__geo_interface__
+            joint = merge_histograms([joint, reduce_histograms(rest, max_workers=max_workers,
+                                                               landcover=landcover)['joint']])
+
+        return {'joint': joint, 'cells': len(full), 'edge_cells': len(partial), 'reduced_edges': len(edges),
+                'missing_cells': len(missing)}
+
+    # Number of indexed cells per landcover dataset
+    def stats(self):
+        with self._lock:
+            return dict(self._connection.execute(
+                'SELECT landcover, COUNT(*) FROM cells WHERE source IN (?, ?) GROUP BY landcover',
+                tuple(SOURCES.values())).fetchall())
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# The index named by REFORESTATION_GRID_INDEX, or None when there is none
+def get_index():
+    global _index
+    if DEFAULT_PATH is None:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = GridIndex(DEFAULT_PATH)
+        return _index
+
+
+# Joint histogram of an ROI, from the grid index when one is configured
+def joint_histogram(geometry, landcover='nlcd'):
+    index = get_index()
+    if index is None:
+        return reduce_histograms(geometry, landcover=landcover)
+    return index.query(geometry, landcover)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['build', 'stats'])
+    parser.add_argument('region', nargs='?', help="GeoJSON file of the region to index")
+    parser.add_argument('--db', default=DEFAULT_PATH, required=DEFAULT_PATH is None)
+    parser.add_argument('--landcover', choices=list(SOURCES), default='nlcd')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--refresh', action='store_true', help="recompute cells that are already indexed")
+    args = parser.parse_args(argv)
+
+    index = GridIndex(args.db)
+    if args.command == 'stats':
+        for landcover, count in index.stats().items():
+            print(f"{landcover}: {count} cells")
+        return
+
+    if args.region is None:
+        parser.error("build needs a region")
+    import ee
+    ee.Initialize()
+
+    from reforestation.batch import features_from_geojson
+    with open(args.region) as f:
+        geometry = unary_union([shape(g) for _, g in features_from_geojson(json.load(f))]).__geo_interface__
+
+    def progress(done, total):
+        print(f"\r{done}/{total} cells", end='', file=sys.stderr)
+
+    built = index.build_region(geometry, args.landcover, refresh=args.refresh,
+                               max_workers=args.workers, progress=progress)
+    print(f"\n{built} cells computed", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
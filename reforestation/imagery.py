@@ -0,0 +1,50 @@
+"""Sentinel-2 overlay images for the ROI step.
+
+Earth Engine is imported by the functions that build the images, so the page
+can list the overlay modes while Earth Engine is still being loaded (see
+reforestation.startup).
+"""
+
+# Scene-level cloud cover allowed into the composite; cloudy pixels of the
+# remaining scenes are masked individually
+COMPOSITE_MAX_CLOUD = 30
+
+# True color bands
+TRUE_COLOR = {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 2000}
+
+OVERLAY_MODES = ['Cloud-masked median composite', 'Clearest image']
+
+
+# Create a function to mask clouds using the Sentinel-2 QA60 band
+def mask_clouds(image):
+    # Select the QA60 band from the image
+    QA60 = image.select(['QA60'])
+
+    # Create a cloud mask by checking if the QA60 band is 0 (indicating no cloud)
+    cloud_mask = QA60.bitwiseAnd(1 << 10).eq(0)
+
+    # Update the image mask with the cloud mask
+    return image.updateMask(cloud_mask)
+
+
+# Per-pixel cloud-masked median mosaic of the ROI for the date range
+def cloud_free_composite(roi, start_date, end_date, max_cloud=COMPOSITE_MAX_CLOUD):
+    import ee
+    from reforestation.session import dataset
+
+    collection = dataset('sentinel2') \
+        .filterBounds(roi) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud)) \
+        .map(mask_clouds)
+    return collection.median().clip(roi)
+
+
+# Overlay image for the selected mode, and its layer name
+def overlay_image(mode, roi, collection, start_date, end_date):
+    from reforestation.planner import clearest_images
+
+    if mode == 'Clearest image':
+        # Select the first (clearest) image from the sorted collection
+        return clearest_images(collection).first().clip(roi), 'Satellite Imagery'
+    return cloud_free_composite(roi, start_date, end_date), 'Cloud-free Composite'
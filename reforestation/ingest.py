@@ -0,0 +1,114 @@
+"""ROI ingestion: read uploads in memory and slim geometries before they are
+sent to Earth Engine.
+
+Zipped shapefiles are read straight from the upload buffer. Geometries are
+repaired, simplified within a tolerance and quantized to a coordinate grid,
+since every vertex of a detailed parcel boundary is serialized into each
+Earth Engine request and evaluated server-side. prepare_geometry reports what
+the slimming saved and how much area it changed.
+"""
+import io
+import json
+import posixpath
+import zipfile
+
+import shapely
+from shapely.geometry import mapping, shape
+from shapely.validation import make_valid
+
+# Metres per degree of latitude
+METERS_PER_DEGREE = 111320
+# Default simplification tolerance in metres (a sixth of a 30 m NLCD pixel)
+SIMPLIFY_TOLERANCE = 5
+# Coordinates are rounded to this many decimal degrees (1e-6 is about 0.1 m)
+GRID_SIZE = 1e-6
+
+
+# Read a zipped shapefile from an upload buffer without extracting it to disk.
+# The members of the first shapefile are copied into a flat in-memory zip,
+# since GDAL only finds shapefiles at the root of an archive it is given.
+# geopandas is only imported here, when a shapefile is uploaded. Archives and
+# shapefiles that cannot be read raise ValueError.
+def read_zipped_shapefile(buffer):
+    import geopandas as gpd
+
+    if hasattr(buffer, 'seek'):
+        buffer.seek(0)
+    data = buffer.read() if hasattr(buffer, 'read') else buffer
+
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"The upload is not a valid ZIP file: {e}") from e
+    with archive:
+        names = sorted(n for n in archive.namelist() if n.lower().endswith('.shp'))
+        if not names:
+            raise ValueError("The ZIP file does not contain a shapefile (.shp)")
+        stem = posixpath.splitext(names[0])[0]
+
+        flat = io.BytesIO()
+        with zipfile.ZipFile(flat, 'w') as shapefile:
+            for name in archive.namelist():
+                if posixpath.splitext(name)[0] == stem:
+                    shapefile.writestr(posixpath.basename(name), archive.read(name))
+
+    # GDAL errors surface as RuntimeError (pyogrio) or OSError
+    try:
+        return gpd.read_file(io.BytesIO(flat.getvalue()))
+    except (RuntimeError, OSError) as e:
+        raise ValueError(f"The shapefile cannot be read: {e}") from e
+
+
+# Read an uploaded GeoJSON file as a dict
+def read_geojson(buffer):
+    if hasattr(buffer, 'seek'):
+        buffer.seek(0)
+    data = buffer.read() if hasattr(buffer, 'read') else buffer
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data.strip())
+
+
+# Repair an invalid geometry and keep only its polygonal parts
+def repair(geom):
+    if not geom.is_valid:
+        geom = make_valid(geom)
+    if geom.geom_type == 'GeometryCollection':
+        geom = shapely.union_all([g for g in geom.geoms if g.geom_type in ('Polygon', 'MultiPolygon')])
+    return geom
+
+
+# Repair, simplify and quantize a GeoJSON geometry (EPSG:4326).
+# Returns the prepared GeoJSON geometry and a report of the reduction.
+def prepare_geometry(geometry, tolerance=SIMPLIFY_TOLERANCE, grid_size=GRID_SIZE):
+    original = shape(geometry)
+    geom = repair(original)
+    reference = geom
+
+    if tolerance:
+        # Convert the tolerance to degrees of latitude. A degree of longitude
+        # is never longer, so no vertex moves by more than the tolerance in
+        # any direction (longitude is simplified more finely than needed).
+        degrees = tolerance / METERS_PER_DEGREE
+        geom = geom.simplify(degrees, preserve_topology=True)
+    if grid_size:
+        geom = shapely.set_precision(geom, grid_size)
+    geom = repair(geom)
+
+    if geom.is_empty:
+        # Slimming must never lose the ROI; fall back to the repaired input
+        geom = reference
+
+    # Area error: share of the ROI added or removed by the slimming
+    area_error = geom.symmetric_difference(reference).area / reference.area if reference.area else 0.0
+
+    prepared = mapping(geom)
+    report = {
+        'vertices_before': int(shapely.get_num_coordinates(original)),
+        'vertices_after': int(shapely.get_num_coordinates(geom)),
+        'bytes_before': len(json.dumps(geometry)),
+        'bytes_after': len(json.dumps(prepared)),
+        'area_error': area_error,
+        'repaired': not original.is_valid,
+    }
+    return prepared, report
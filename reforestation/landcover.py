@@ -0,0 +1,175 @@
+"""Landcover legends and the class tables that reclassify NLCD and ESA
+WorldCover into forest, plantable and excluded land (see
+reforestation.summary for the area conversion).
+"""
+
+# Area of one 30 m NLCD pixel in square metres
+PIXEL_AREA = 900
+
+# Initialize NLCD legends
+nlcd_class_names = [
+    'Open Water',
+    'Perennial Ice/Snow',
+    'Developed - Open Space',
+    'Developed - Low Intensity',
+    'Developed - Medium Intensity',
+    'Developed - High Intensity',
+    'Barren Land (Rock/Sand/Clay)',
+    'Deciduous Forest',
+    'Evergreen Forest',
+    'Mixed Forest',
+    'Dwarf Scrub',
+    'Shrub/Scrub',
+    'Grassland/Herbaceous',
+    'Sedge/Herbaceous',
+    'Lichens',
+    'Moss',
+    'Pasture/Hay',
+    'Cultivated Crops',
+    'Woody Wetlands',
+    'Emergent Herbaceous Wetlands'
+]
+nlcd_legend = {
+    'Class_11': 'Open Water',
+    'Class_12': 'Perennial Ice/Snow',
+    'Class_21': 'Developed - Open Space',
+    'Class_22': 'Developed - Low Intensity',
+    'Class_23': 'Developed - Medium Intensity',
+    'Class_24': 'Developed - High Intensity',
+    'Class_31': 'Barren Land (Rock/Sand/Clay)',
+    'Class_41': 'Deciduous Forest',
+    'Class_42': 'Evergreen Forest',
+    'Class_43': 'Mixed Forest',
+    'Class_51': 'Dwarf Scrub',
+    'Class_52': 'Shrub/Scrub',
+    'Class_71': 'Grassland/Herbaceous',
+    'Class_72': 'Sedge/Herbaceous',
+    'Class_73': 'Lichens',
+    'Class_74': 'Moss',
+    'Class_81': 'Pasture/Hay',
+    'Class_82': 'Cultivated Crops',
+    'Class_90': 'Woody Wetlands',
+    'Class_95': 'Emergent Herbaceous Wetlands'
+}
+nlcd_colors = {
+    'Open Water': '#466b9f',
+    'Perennial Ice/Snow': '#d1def8',
+    'Developed - Open Space': '#dec5c5',
+    'Developed - Low Intensity': '#d99282',
+    'Developed - Medium Intensity': '#eb0000',
+    'Developed - High Intensity': '#ab0000',
+    'Barren Land (Rock/Sand/Clay)': '#b3ac9f',
+    'Deciduous Forest': '#68ab5f',
+    'Evergreen Forest': '#1c5f2c',
+    'Mixed Forest': '#b5c58f',
+    'Dwarf Scrub': '#af963c',
+    'Shrub/Scrub': '#ccb879',
+    'Grassland/Herbaceous': '#dfdfc2',
+    'Sedge/Herbaceous': '#d1d182',
+    'Lichens': '#a3cc51',
+    'Moss': '#82ba9e',
+    'Pasture/Hay': '#dcd939',
+    'Cultivated Crops': '#ab6c28',
+    'Woody Wetlands': '#b8d9eb',
+    'Emergent Herbaceous Wetlands': '#6c9fb8',
+}
+color_mapping_esa = {
+    10: "#006400",  # Tree cover
+    20: "#ffbb22",  # Shrubland
+    30: "#ffff4c",  # Grassland
+    40: "#f096ff",  # Cropland
+    50: "#fa0000",  # Built-up
+    60: "#b4b4b4",  # Bare / sparse vegetation
+    70: "#f0f0f0",  # Snow and ice
+    80: "#0064c8",  # Permanent water bodies
+    90: "#0096a0",  # Herbaceous wetland
+    95: "#00cf75",  # Mangroves
+    100: "#fae6a0"  # Moss and lichen
+}
+
+# ESA WorldCover legend
+worldcover_legend = {
+    10: 'Tree cover',
+    20: 'Shrubland',
+    30: 'Grassland',
+    40: 'Cropland',
+    50: 'Built-up',
+    60: 'Bare / sparse vegetation',
+    70: 'Snow and ice',
+    80: 'Permanent water bodies',
+    90: 'Herbaceous wetland',
+    95: 'Mangroves',
+    100: 'Moss and lichen',
+}
+worldcover_colors = {worldcover_legend[code]: color for code, color in color_mapping_esa.items()}
+
+# Reclassification categories of the landcover classes
+WATER = 0      # water and ice, left out of the forest totals
+FOREST = 1
+PLANTABLE = 2  # non-forested land open to planting
+EXCLUDED = 3   # non-forested land that is not planted: developed, agriculture, wetlands
+
+# Category of every class of each landcover dataset
+NLCD_CATEGORIES = {
+    11: WATER, 12: WATER,
+    21: EXCLUDED, 22: EXCLUDED, 23: EXCLUDED, 24: EXCLUDED,
+    31: PLANTABLE,
+    41: FOREST, 42: FOREST, 43: FOREST,
+    51: PLANTABLE, 52: PLANTABLE,
+    71: PLANTABLE, 72: PLANTABLE, 73: PLANTABLE, 74: PLANTABLE,
+    81: EXCLUDED, 82: EXCLUDED,
+    90: EXCLUDED, 95: EXCLUDED,
+}
+WORLDCOVER_CATEGORIES = {
+    10: FOREST,
+    20: PLANTABLE,
+    30: PLANTABLE,
+    40: EXCLUDED,
+    50: EXCLUDED,
+    60: PLANTABLE,
+    70: WATER,
+    80: WATER,
+    90: EXCLUDED,
+    95: FOREST,
+    100: PLANTABLE,
+}
+
+# Landcover datasets the calculator can run on (keyed by their dataset name in
+# reforestation.session): display names, builtin geemap legend, class
+# descriptions, class colors and reclassification table
+LANDCOVERS = {
+    'nlcd': {
+        'name': 'NLCD 2021 (United States)',
+        'layer': 'NLCD 2021',
+        'builtin_legend': 'NLCD',
+        'legend': {int(name[len('Class_'):]): description for name, description in nlcd_legend.items()},
+        'colors': nlcd_colors,
+        'categories': NLCD_CATEGORIES,
+    },
+    'worldcover': {
+        'name': 'ESA WorldCover 2020 (global)',
+        'layer': 'ESA WorldCover 2020',
+        'builtin_legend': 'ESA_WorldCover',
+        'legend': worldcover_legend,
+        'colors': worldcover_colors,
+        'categories': WORLDCOVER_CATEGORIES,
+    },
+}
+
+
+# Class codes of a landcover dataset in one category
+def classes_in(categories, category):
+    return [code for code, value in categories.items() if value == category]
+
+
+# Forested classes (41, 42 and 43)
+FORESTED_CLASSES = classes_in(NLCD_CATEGORIES, FOREST)
+
+# Classes left by the non-forested mask: everything that is not forest, water,
+# ice, developed land, wetland or agriculture
+NON_FORESTED_CLASSES = classes_in(NLCD_CATEGORIES, PLANTABLE)
+
+# Descriptions counted towards the forested and non-forested totals
+forested_descriptions = [nlcd_legend[f'Class_{code}'] for code in FORESTED_CLASSES]
+non_forested_descriptions = [nlcd_legend[f'Class_{code}'] for code in NLCD_CATEGORIES
+                             if NLCD_CATEGORIES[code] in (PLANTABLE, EXCLUDED)]
@@ -0,0 +1,58 @@
+"""Map helpers that avoid Earth Engine round trips when a result is cached."""
+import ee
+
+from reforestation.executor import get_executor, request_key
+
+ATTRIBUTION = 'Google Earth Engine'
+
+
+# The image and visualization parameters to request tiles for, drawing
+# vectors the way geemap's addLayer does
+def map_request(ee_object, vis_params):
+    if isinstance(ee_object, (ee.Geometry, ee.Feature, ee.FeatureCollection)):
+        ee_object = ee.FeatureCollection(ee_object).draw(
+            color=vis_params.get('color', '000000'), strokeWidth=2)
+        vis_params = {}
+    return ee_object, vis_params
+
+
+# Request a map tile URL for an Earth Engine object
+def tile_url(ee_object, vis_params):
+    image, vis_params = map_request(ee_object, vis_params)
+    return get_executor().get_map_id(image, vis_params)['tile_fetcher'].url_format
+
+
+# Request the tile URLs of several (ee_object, vis_params, name) layers
+# concurrently and store them in `tiles`
+def prefetch_tiles(tiles, layers):
+    requests, names = [], []
+    for ee_object, vis_params, name in layers:
+        if name in tiles or name in names:
+            continue
+        image, vis_params = map_request(ee_object, vis_params)
+        requests.append((request_key('getMapId', image, vis_params),
+                         lambda image=image, vis_params=vis_params: image.getMapId(vis_params)))
+        names.append(name)
+    for name, map_id in zip(names, get_executor().run_all(requests)):
+        tiles[name] = map_id['tile_fetcher'].url_format
+
+
+# Add an Earth Engine layer to a map, reusing the tile URL stored in `tiles`
+# (a dict kept with the cached result) when there is one
+def add_cached_layer(m, tiles, ee_object, vis_params, name, shown=True):
+    if name not in tiles:
+        tiles[name] = tile_url(ee_object, vis_params)
+    m.add_tile_layer(tiles[name], name=name, attribution=ATTRIBUTION, shown=shown)
+
+
+# Zoom a map to a GeoJSON geometry without asking Earth Engine for its bounds
+def zoom_to_geometry(m, geometry):
+    def points(coordinates):
+        if isinstance(coordinates[0], (int, float)):
+            yield coordinates
+        else:
+            for child in coordinates:
+                yield from points(child)
+
+    x, y = zip(*[(point[0], point[1]) for point in points(geometry['coordinates'])])
+    m.zoom_to_bounds([min(x), min(y), max(x), max(y)])
@@ -0,0 +1,237 @@
+"""Stage-level latency, payload and cache metrics of the calculator pipeline.
+
+Each stage of a page run (ROI parsing, the Sentinel-2 query, every
+reduceRegion, map building, chart rendering) is timed with `stage()`, which
+also takes the size of the payload the stage fetched and whether it was
+served from the cache. Every sample is:
+
+- kept in the trace of the page run, for the debug panel of the sidebar;
+- logged as one JSON object per line on the 'reforestation.metrics' logger,
+  which writes to REFORESTATION_METRICS_LOG (a path, or '-' for stderr);
+- added to process-wide Prometheus histograms and counters, rendered in the
+  text exposition format to the file named by REFORESTATION_METRICS_FILE
+  (for node_exporter's textfile collector) and served on
+  REFORESTATION_METRICS_PORT when it is set.
+
+Percentiles are computed by Prometheus from the histogram buckets; the debug
+panel shows those of the last SAMPLES samples of each stage.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_FILE = os.environ.get('REFORESTATION_METRICS_FILE')
+METRICS_PORT = os.environ.get('REFORESTATION_METRICS_PORT')
+METRICS_LOG = os.environ.get('REFORESTATION_METRICS_LOG')
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Recent samples kept per stage for the debug panel
+SAMPLES = 500
+
+logger = logging.getLogger('reforestation.metrics')
+
+
+# One timed stage; payload_bytes and cache ('hit' or 'miss') are set by the
+# code inside the stage when they apply
+class Stage:
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+        self.payload_bytes = None
+        self.cache = None
+        self.error = None
+
+    def record(self):
+        return {'stage': self.name, 'seconds': self.seconds, 'payload_bytes': self.payload_bytes,
+                'cache': self.cache, 'error': self.error}
+
+
+# Size in bytes of a fetched JSON value
+def payload_size(value):
+    return len(json.dumps(value, separators=(',', ':'), default=str))
+
+
+class Metrics:
+
+    def __init__(self, buckets=BUCKETS, samples=SAMPLES):
+        self.buckets = buckets
+        self.samples = samples
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # Start the trace of a page run on this thread; returns its list of records
+    def begin_run(self, session=None):
+        self._local.trace = []
+        self._local.session = session
+        return self._local.trace
+
+    def trace(self):
+        return getattr(self._local, 'trace', [])
+
+    # Time the block as stage `name`. Streamlit stops a superseded run with
+    # exceptions outside Exception; a stage cut short that way is dropped
+    # rather than counted as an error or a latency sample.
+    @contextmanager
+    def stage(self, name):
+        stage = Stage(name)
+        started = time.perf_counter()
+        try:
+            yield stage
+        except Exception as e:
+            stage.error = type(e).__name__
+            stage.seconds = time.perf_counter() - started
+            self.observe(stage)
+            raise
+        stage.seconds = time.perf_counter() - started
+        self.observe(stage)
+
+    def observe(self, stage):
+        record = stage.record()
+        with self._lock:
+            entry = self._stages.get(stage.name)
+            if entry is None:
+                entry = self._stages[stage.name] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0, 'bytes': 0,
+                    'hits': 0, 'misses': 0, 'errors': 0, 'recent': deque(maxlen=self.samples)}
+            for i, bound in enumerate(self.buckets):
+                if stage.seconds <= bound:
+                    entry['buckets'][i] += 1
+            entry['count'] += 1
+            entry['sum'] += stage.seconds
+            entry['bytes'] += stage.payload_bytes or 0
+            entry['hits'] += stage.cache == 'hit'
+            entry['misses'] += stage.cache == 'miss'
+            entry['errors'] += stage.error is not None
+            entry['recent'].append(stage.seconds)
+
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.append(record)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(dict(record, event='stage', session=getattr(self._local, 'session', None),
+                                        time=time.time())))
+
+    # p50, p95 and p99 latency, count and cache hit rate of each stage over
+    # its recent samples
+    def summary(self):
+        import numpy as np
+
+        with self._lock:
+            stages = {name: (list(entry['recent']), entry['count'], entry['hits'], entry['misses'])
+                      for name, entry in self._stages.items()}
+        rows = []
+        for name, (recent, count, hits, misses) in sorted(stages.items()):
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+            rows.append({'stage': name, 'count': count, 'p50 s': p50, 'p95 s': p95, 'p99 s': p99,
+                         'cache hit rate': hits / (hits + misses) if hits + misses else None})
+        return rows
+
+    # The metrics in the Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            stages = {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in self._stages.items()}
+        lines = [
+            '# HELP reforestation_stage_seconds Latency of the calculator pipeline stages.',
+            '# TYPE reforestation_stage_seconds histogram',
+        ]
+        for name, entry in sorted(stages.items()):
+            for bound, count in zip(self.buckets, entry['buckets']):
+                lines.append(f'reforestation_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'reforestation_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'reforestation_stage_seconds_sum{{stage="{name}"}} {entry["sum"]}')
+            lines.append(f'reforestation_stage_seconds_count{{stage="{name}"}} {entry["count"]}')
+        counters = [
+            ('reforestation_stage_payload_bytes_total', 'Bytes fetched by the stages.', 'bytes', None),
+            ('reforestation_stage_cache_total', 'Cache lookups of the stages.', 'hits', 'hit'),
+            ('reforestation_stage_errors_total', 'Stages that raised an error.', 'errors', None),
+        ]
+        for metric, help_text, field, result in counters:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for name, entry in sorted(stages.items()):
+                if result is None:
+                    lines.append(f'{metric}{{stage="{name}"}} {entry[field]}')
+                else:
+                    lines.append(f'{metric}{{stage="{name}",result="hit"}} {entry["hits"]}')
+                    lines.append(f'{metric}{{stage="{name}",result="miss"}} {entry["misses"]}')
+        return '\n'.join(lines) + '\n'
+
+    # Write the metrics for node_exporter's textfile collector, atomically
+    def write_textfile(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # Serve the metrics on /metrics from a daemon thread
+    def serve(self, port, host='0.0.0.0'):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    # Publish the metrics where the environment asks for them
+    def publish(self):
+        if METRICS_FILE:
+            self.write_textfile(METRICS_FILE)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# Write the JSON log lines to a file, or to stderr for '-'
+def log_to(path):
+    handler = logging.StreamHandler() if path == '-' else logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# The metrics shared by every session of the server process; the log and the
+# endpoint are set up with them when the environment asks for them
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            if METRICS_LOG:
+                log_to(METRICS_LOG)
+            if METRICS_PORT:
+                _metrics.serve(METRICS_PORT)
+        return _metrics
+
+
+# Time a block as a stage of the shared metrics
+def stage(name):
+    return get_metrics().stage(name)
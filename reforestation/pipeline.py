@@ -0,0 +1,67 @@
+"""Headless calculator pipeline.
+
+The stages of the calculator page as plain functions, so they can be driven
+from scripts, notebooks or the command line (see reforestation.cli) without
+Streamlit:
+
+    features = parse_roi(geojson_text)
+    collection, clearest_image = select_sentinel2(roi, '2021-01-01', '2021-12-31')
+    plantable = mask_slope(mask_landcover(landcover_image(roi)), slope_image(roi), 30)
+    row = evaluate_roi(name, geometry, slope_threshold=30)
+"""
+import json
+
+import geopandas as gpd
+
+from reforestation.batch import evaluate_feature, feature_name, features_from_geojson
+from reforestation.planner import (clearest_images, landcover_image, mask_landcover, mask_slope,
+                                   sentinel_collection, slope_image)
+from reforestation.summary import area_table, summarize_histograms
+
+__all__ = [
+    'parse_roi', 'read_rois', 'select_sentinel2', 'landcover_image', 'slope_image', 'mask_landcover',
+    'mask_slope', 'histogram_to_areas', 'evaluate_roi',
+]
+
+
+# Parse pasted GeoJSON (text or dict) into (name, geometry) pairs
+def parse_roi(geojson):
+    if isinstance(geojson, (str, bytes)):
+        geojson = json.loads(geojson)
+    return features_from_geojson(geojson)
+
+
+# Read ROIs from a GeoJSON file or shapefile in chunks of `chunk_size` rows,
+# yielding (row index, name, geometry) so large files are never fully loaded
+def read_rois(path, chunk_size=1000):
+    start = 0
+    while True:
+        gdf = gpd.read_file(path, rows=slice(start, start + chunk_size))
+        if gdf.empty:
+            return
+        if gdf.crs is not None:
+            gdf = gdf.to_crs(epsg=4326)
+        properties = gdf.drop(columns=gdf.geometry.name).to_dict('records')
+        for offset, (props, geometry) in enumerate(zip(properties, gdf.geometry)):
+            if geometry is None or geometry.is_empty:
+                continue
+            index = start + offset
+            yield index, feature_name(props, index), geometry.__geo_interface__
+        start += chunk_size
+
+
+# Select the Sentinel-2 images of the ROI and the clearest one, clipped to the ROI
+def select_sentinel2(roi, start_date, end_date):
+    collection = sentinel_collection(roi, start_date, end_date)
+    return collection, clearest_images(collection).first().clip(roi)
+
+
+# Convert a frequencyHistogram dict to the area table and forest totals
+def histogram_to_areas(histogram, landcover='nlcd'):
+    summary = summarize_histograms([histogram], landcover=landcover)
+    return area_table(summary), summary['forested'][0], summary['non_forested'][0]
+
+
+# Evaluate one ROI: forest/non-forest area, plantable area and class breakdown
+def evaluate_roi(name, geometry, slope_threshold, landcover='nlcd'):
+    return evaluate_feature(name, geometry, slope_threshold, landcover)
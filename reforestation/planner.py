@@ -0,0 +1,159 @@
+"""Build the Earth Engine work of the calculator page as one server-side request.
+
+Each step of the page used to call getInfo() on its own object. Here every
+value the page displays is put into a single ee.Dictionary, so a page run
+costs one round trip: the ROI step asks for the Sentinel-2 summary, and the
+Calculate step asks for the same summary plus the joint landcover-by-slope
+histogram of the ROI. Any slope threshold is then read from that histogram
+locally (see reforestation.summary), without another request.
+"""
+import datetime
+
+import ee
+
+from reforestation.executor import get_executor
+from reforestation.landcover import LANDCOVERS, PLANTABLE
+from reforestation.metrics import payload_size, stage
+from reforestation.session import dataset
+from reforestation.summary import MAX_SLOPE_BIN, NO_SLOPE, SLOPE_CODES
+
+# Number of clearest Sentinel-2 images listed for the ROI
+IMAGE_LIMIT = 5
+
+# Pixel budget of one reduceRegion; larger ROIs are split by reforestation.tiling
+MAX_PIXELS = 1e9
+
+# Scale (m) and pixel budget of the coarse estimate of reforestation.progressive
+COARSE_SCALE = 300
+COARSE_MAX_PIXELS = 1e6
+
+
+# Load Sentinel-2 imagery for the specified date range and ROI
+def sentinel_collection(roi, start_date, end_date):
+    return dataset('sentinel2') \
+        .filterBounds(roi) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10))
+
+
+# Sort the image collection by cloud coverage and keep the clearest images
+def clearest_images(collection, limit=IMAGE_LIMIT):
+    return collection.sort('CLOUDY_PIXEL_PERCENTAGE', True).limit(limit)
+
+
+# Reclassify a landcover image into the categories of its class table (see
+# reforestation.landcover) with a single remap; unknown classes are masked
+def reclassify(image, landcover='nlcd'):
+    categories = LANDCOVERS[landcover]['categories']
+    return image.remap(list(categories), list(categories.values()))
+
+
+# Create a binary mask for the non-forested classes open to planting
+def plantable_mask(image, landcover='nlcd'):
+    return reclassify(image, landcover).eq(PLANTABLE)
+
+
+# Add a landcover dataset ('nlcd' or 'worldcover') and clip to the ROI
+def landcover_image(roi, landcover='nlcd'):
+    return dataset(landcover).clip(roi)
+
+
+# Compute the slope (degrees) of the SRTM elevation clipped to the ROI
+def slope_image(roi):
+    return ee.Terrain.slope(dataset('srtm').clip(roi))
+
+
+# Apply masking to show only non-forested areas
+def mask_landcover(image, landcover='nlcd'):
+    return image.updateMask(plantable_mask(image, landcover))
+
+
+# Apply masking to keep only pixels with slopes less than the threshold
+def mask_slope(image, slope, slope_threshold):
+    return image.updateMask(slope.lt(slope_threshold))
+
+
+# Encode the landcover class and whole-degree slope bin of every pixel as one
+# value, class * SLOPE_CODES + bin, so a single frequencyHistogram gives their
+# joint distribution. Pixels without a slope go to the NO_SLOPE bin.
+def joint_image(image, slope):
+    slope_bin = slope.floor().min(MAX_SLOPE_BIN).unmask(NO_SLOPE).toInt32()
+    return image.toInt32().multiply(SLOPE_CODES).add(slope_bin).rename('joint')
+
+
+# Build the landcover, slope, plantable and joint images of the Calculate step
+def build_layers(roi, slope_threshold, landcover='nlcd'):
+    image = landcover_image(roi, landcover)
+    slope = slope_image(roi)
+    return {
+        'landcover': image,
+        'slope': slope,
+        'plantable': mask_slope(mask_landcover(image, landcover), slope, slope_threshold),
+        'joint': joint_image(image, slope),
+    }
+
+
+# Request for the ROI step: image count and dates of the clearest images
+def imagery_request(collection):
+    return ee.Dictionary({
+        'image_count': collection.size(),
+        'image_dates': clearest_images(collection).aggregate_array('system:time_start'),
+    })
+
+
+# Request for the joint landcover-by-slope histogram of the ROI. Both landcover
+# datasets are counted in 30 m pixels.
+def histogram_request(roi, joint, scale=30, max_pixels=MAX_PIXELS, tile_scale=1):
+    stats = joint.reduceRegion(
+        reducer=ee.Reducer.frequencyHistogram(),
+        geometry=roi,
+        scale=scale,
+        maxPixels=max_pixels,
+        tileScale=tile_scale,
+    )
+    return ee.Dictionary({'joint': stats.get('joint')})
+
+
+# Request for a coarse estimate of the joint histogram. bestEffort lets Earth
+# Engine coarsen the scale further to stay within max_pixels, so the area of
+# the pixels with landcover data is reduced alongside to rescale the counts.
+def estimate_request(roi, joint, scale=COARSE_SCALE, max_pixels=COARSE_MAX_PIXELS):
+    options = dict(geometry=roi, scale=scale, maxPixels=max_pixels, bestEffort=True)
+    stats = joint.reduceRegion(reducer=ee.Reducer.frequencyHistogram(), **options)
+    area = ee.Image.pixelArea().updateMask(joint.mask()).reduceRegion(reducer=ee.Reducer.sum(), **options)
+    return ee.Dictionary({'joint': stats.get('joint'), 'valid_area': area.get('area')})
+
+
+# Add the values of the ROI step to a request, unless they are cached
+# (`imagery` is not None)
+def with_imagery(request, collection, imagery=None):
+    if imagery is None:
+        return imagery_request(collection).combine(request)
+    return request
+
+
+# Fetch a planned request in a single round trip, through the shared executor,
+# timed as stage `stage_name` (see reforestation.metrics)
+def fetch(request, stage_name='ee_request'):
+    with stage(stage_name) as timed:
+        result = get_executor().get_info(request)
+        timed.payload_bytes = payload_size(result)
+    # Empty ROIs reduce to null histograms
+    if 'joint' in result and result['joint'] is None:
+        result['joint'] = {}
+    return result
+
+
+# Fetch a request together with the values of the ROI step when they are not
+# cached; returns the results and the ROI step values, with no map tiles yet
+def fetch_with_imagery(request, collection, imagery, stage_name):
+    results = fetch(with_imagery(request, collection, imagery), stage_name)
+    if imagery is None:
+        imagery = {'image_count': results['image_count'], 'image_dates': results['image_dates'], 'tiles': {}}
+    return results, imagery
+
+
+# Format image timestamps (ms since epoch) as dates
+def format_dates(timestamps):
+    return [datetime.datetime.fromtimestamp(timestamp_ms / 1000).strftime('%m-%d-%Y')
+            for timestamp_ms in timestamps]
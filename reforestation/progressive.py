@@ -0,0 +1,105 @@
+"""Progressive evaluation: a coarse estimate first, the 30 m result after.
+
+A 30 m reduction of a large ROI can take minutes. A first pass at
+COARSE_SCALE with bestEffort comes back within a second or two. Its pixel
+counts are rescaled to 30 m pixels from the area of the ROI that has
+landcover data, and every area read from it gets a sampling error band.
+The 30 m joint histogram is meanwhile reduced on a background thread (tiled,
+see reforestation.tiling, or read from the grid index of
+reforestation.gridindex) and stored in the result cache, where the page picks
+it up. Both stages record their latency.
+"""
+import math
+import threading
+import time
+
+from reforestation.cache import get_cache
+from reforestation.landcover import PIXEL_AREA
+from reforestation.planner import COARSE_SCALE
+from reforestation.gridindex import joint_histogram
+
+# ROIs with fewer 30 m pixels are reduced at 30 m straight away
+PROGRESSIVE_PIXELS = 2e6
+# z-score of the error band (95%)
+Z_95 = 1.96
+
+
+# Rescale a fetched coarse estimate to a joint histogram in 30 m pixels.
+# `samples` is the number of coarse pixels the estimate is based on.
+def normalize_estimate(result, scale=COARSE_SCALE):
+    joint = result.get('joint') or {}
+    samples = sum(joint.values())
+    factor = (result.get('valid_area') or 0) / PIXEL_AREA / samples if samples else 0.0
+    return {
+        'joint': {key: count * factor for key, count in joint.items()},
+        'estimate': True,
+        'scale': scale,
+        'samples': samples,
+    }
+
+
+# Half-width of the 95% error band of an area estimated from `samples` coarse
+# pixels of an ROI of `total_area` (same unit as `area`)
+def error_band(area, total_area, samples):
+    if not samples or not total_area:
+        return 0.0
+    share = min(max(area / total_area, 0.0), 1.0)
+    return Z_95 * math.sqrt(share * (1 - share) / samples) * total_area
+
+
+# The 30 m reduction of an ROI running on a background thread; its result is
+# written to the cache under `key`
+class RefineJob:
+
+    def __init__(self, key, geometry, landcover):
+        self.key = key
+        self.state = 'running'
+        self.error = None
+        self.started = time.perf_counter()
+        self.latency = None
+        self._thread = threading.Thread(target=self._run, args=(geometry, landcover), daemon=True)
+
+    def _run(self, geometry, landcover):
+        try:
+            statistics = dict(joint_histogram(geometry, landcover), tiles={})
+            statistics['latency'] = time.perf_counter() - self.started
+            get_cache().set(self.key, statistics)
+            self.state = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+        self.latency = time.perf_counter() - self.started
+
+        # The result is in the cache now; a failed job stays so its error can
+        # be shown, until the next start_refine replaces it
+        if self.state == 'done':
+            with _jobs_lock:
+                if _jobs.get(self.key) is self:
+                    del _jobs[self.key]
+
+    def elapsed(self):
+        return self.latency if self.latency is not None else time.perf_counter() - self.started
+
+    def start(self):
+        self._thread.start()
+        return self
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+# Start the 30 m reduction for `key` unless it is already running. The page
+# only calls this on a cache miss, so a finished job whose result has since
+# left the cache is started again.
+def start_refine(key, geometry, landcover):
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None or job.state != 'running':
+            job = _jobs[key] = RefineJob(key, geometry, landcover).start()
+        return job
+
+
+def get_refine(key):
+    with _jobs_lock:
+        return _jobs.get(key)
@@ -0,0 +1,140 @@
+"""Offline NumPy backend for the plantable-area computation.
+
+Reads an NLCD landcover GeoTIFF and a DEM GeoTIFF from disk and reproduces the
+Earth Engine path of the calculator page (slope, non-forested and slope masks,
+frequency histograms) block by block, without any network access.
+
+The slope follows ee.Terrain.slope: central differences over the 4-connected
+neighbours of each pixel, with the DEM resampled nearest-neighbour, as Earth
+Engine does by default. Earth Engine computes the slope on the DEM's own grid
+before resampling it to the landcover grid, whereas here the DEM is first
+warped onto the landcover grid, so single pixels close to a threshold can
+still fall on the other side of it.
+"""
+import math
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.features import bounds as geometry_bounds
+from rasterio.features import geometry_mask
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, from_bounds
+
+from reforestation.landcover import NON_FORESTED_CLASSES
+from reforestation.summary import area_table, summarize_histograms
+
+# Lookup table of NLCD codes kept by the non-forested mask
+PLANTABLE_LUT = np.zeros(256, dtype=bool)
+PLANTABLE_LUT[NON_FORESTED_CLASSES] = True
+
+
+# Compute slope in degrees from the 4-connected neighbours of each pixel
+# (central differences), like ee.Terrain.slope.
+# `dem` carries a one pixel border around the block the slope is wanted for.
+def slope_degrees(dem, xres, yres):
+    z = dem.astype('float64')
+    dzdx = (z[1:-1, 2:] - z[1:-1, :-2]) / (2 * xres)
+    dzdy = (z[2:, 1:-1] - z[:-2, 1:-1]) / (2 * yres)
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+
+
+# Yield the blocks of `window` in chunk_size x chunk_size pieces
+def iter_blocks(window, chunk_size):
+    row_stop = window.row_off + window.height
+    col_stop = window.col_off + window.width
+    for row in range(window.row_off, row_stop, chunk_size):
+        for col in range(window.col_off, col_stop, chunk_size):
+            yield Window(col, row, min(chunk_size, col_stop - col), min(chunk_size, row_stop - row))
+
+
+# Read a DEM block with a one pixel border, replicating the edge where the
+# border falls outside the raster
+def read_padded(dem, block):
+    row0 = max(block.row_off - 1, 0)
+    col0 = max(block.col_off - 1, 0)
+    row1 = min(block.row_off + block.height + 1, dem.height)
+    col1 = min(block.col_off + block.width + 1, dem.width)
+    data = dem.read(1, window=Window(col0, row0, col1 - col0, row1 - row0), masked=True)
+    data = data.astype('float64').filled(np.nan)
+    top = 1 - (block.row_off - row0)
+    bottom = block.row_off + block.height + 1 - row1
+    left = 1 - (block.col_off - col0)
+    right = block.col_off + block.width + 1 - col1
+    return np.pad(data, ((top, bottom), (left, right)), mode='edge')
+
+
+# Window of the raster covered by the ROI (or the whole raster without one)
+def roi_window(src, roi):
+    if roi is None:
+        return Window(0, 0, src.width, src.height)
+    window = from_bounds(*geometry_bounds(roi), transform=src.transform)
+    col0, row0 = math.floor(window.col_off), math.floor(window.row_off)
+    col1 = math.ceil(window.col_off + window.width)
+    row1 = math.ceil(window.row_off + window.height)
+    col0, row0 = max(col0, 0), max(row0, 0)
+    col1, row1 = min(col1, src.width), min(row1, src.height)
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+
+# Compute the full NLCD histogram and the plantable (non-forested and below the
+# slope threshold) histogram of an ROI from local rasters.
+#
+# `roi` is a GeoJSON geometry in EPSG:4326, as pasted on the calculator page.
+# Returns both histograms in the frequencyHistogram format Earth Engine uses
+# ({'landcover': {'41': count, ...}}) and the pixel area in square metres.
+def compute_histograms(nlcd_path, dem_path, slope_threshold, roi=None, chunk_size=1024):
+    with rasterio.open(nlcd_path) as nlcd_src, rasterio.open(dem_path) as dem_src:
+        if nlcd_src.crs is None or nlcd_src.crs.is_geographic:
+            raise ValueError("The NLCD raster must be in a projected CRS (e.g. the NLCD Albers grid)")
+
+        xres, yres = abs(nlcd_src.transform.a), abs(nlcd_src.transform.e)
+        nodata = nlcd_src.nodata
+
+        if roi is not None:
+            roi = transform_geom('EPSG:4326', nlcd_src.crs, roi)
+
+        all_counts = np.zeros(256, dtype=np.int64)
+        plantable_counts = np.zeros(256, dtype=np.int64)
+
+        # Resample the DEM onto the NLCD grid so both rasters share blocks,
+        # nearest-neighbour like Earth Engine's default
+        with WarpedVRT(dem_src, crs=nlcd_src.crs, transform=nlcd_src.transform,
+                       width=nlcd_src.width, height=nlcd_src.height,
+                       resampling=Resampling.nearest) as dem:
+            window = roi_window(nlcd_src, roi)
+            if window.width <= 0 or window.height <= 0:
+                raise ValueError("The ROI does not overlap the NLCD raster")
+
+            for block in iter_blocks(window, chunk_size):
+                landcover = nlcd_src.read(1, window=block)
+                valid = np.ones(landcover.shape, dtype=bool)
+                if nodata is not None:
+                    valid &= landcover != nodata
+                if roi is not None:
+                    valid &= geometry_mask([roi], out_shape=landcover.shape,
+                                           transform=nlcd_src.window_transform(block), invert=True)
+                if not valid.any():
+                    continue
+
+                slope = slope_degrees(read_padded(dem, block), xres, yres)
+                classes = landcover.astype(np.uint8)
+                plantable = valid & PLANTABLE_LUT[classes] & (slope < slope_threshold)
+
+                all_counts += np.bincount(classes[valid], minlength=256)
+                plantable_counts += np.bincount(classes[plantable], minlength=256)
+
+    def to_histogram(counts):
+        return {'landcover': {str(code): float(counts[code]) for code in np.flatnonzero(counts)}}
+
+    return to_histogram(all_counts), to_histogram(plantable_counts), xres * yres
+
+
+# Offline equivalent of the Calculate step: returns the NLCD breakdown and the
+# plantable breakdown DataFrames built by the calculator page
+def compute_plantable_area(nlcd_path, dem_path, slope_threshold, roi=None, chunk_size=1024):
+    nlcd_dict, plantable_dict, pixel_area = compute_histograms(
+        nlcd_path, dem_path, slope_threshold, roi=roi, chunk_size=chunk_size)
+    summary = summarize_histograms([nlcd_dict['landcover'], plantable_dict['landcover']], pixel_area)
+    return area_table(summary, 0), area_table(summary, 1)
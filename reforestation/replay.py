@@ -0,0 +1,201 @@
+"""Record and replay Earth Engine responses, for offline runs and benchmarks.
+
+Every request of the app goes through the shared executor of
+reforestation.executor, keyed by a hash of its serialized expression. A
+ReplayExecutor takes its place and, in 'record' mode, sends each request to
+Earth Engine and appends the response and its latency to a cassette; in
+'replay' mode it answers from the cassette without credentials or network,
+so the same page run always gets the same getInfo (reduceRegion histograms,
+collection sizes and dates), getMapId and computeFeatures responses. A
+request missing from the cassette raises ReplayMiss.
+
+Building expressions needs Earth Engine's algorithm signatures, so a
+recording also stores them, and replay initializes the client library from
+them instead of the server. Latency can be injected on replay: a fixed
+number of seconds per request, or 'recorded' to wait as long as the
+recorded request took (times `latency_scale`).
+
+A cassette is a directory holding algorithms.json and responses.jsonl:
+
+    replay.install('benchmarks/cassettes/wv', mode='record')   # with live credentials
+    replay.install('benchmarks/cassettes/wv', latency=0.2)     # offline, 200 ms per request
+"""
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import ee
+
+from reforestation import executor, session
+
+ALGORITHMS = 'algorithms.json'
+RESPONSES = 'responses.jsonl'
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+# Convert a response to JSON: map IDs keep their tile URL, GeoDataFrames
+# become GeoJSON
+def encode(response):
+    if isinstance(response, dict) and 'tile_fetcher' in response:
+        return {'__type__': 'map_id', 'mapid': response.get('mapid'), 'token': response.get('token'),
+                'url_format': response['tile_fetcher'].url_format}
+    if hasattr(response, 'to_json') and hasattr(response, 'geometry'):
+        return {'__type__': 'geodataframe', 'crs': str(response.crs) if response.crs else None,
+                'geojson': json.loads(response.to_json())}
+    return response
+
+
+def decode(value):
+    if isinstance(value, dict) and value.get('__type__') == 'map_id':
+        return {'mapid': value['mapid'], 'token': value['token'],
+                'tile_fetcher': SimpleNamespace(url_format=value['url_format'])}
+    if isinstance(value, dict) and value.get('__type__') == 'geodataframe':
+        import geopandas as gpd
+        return gpd.GeoDataFrame.from_features(value['geojson'], crs=value['crs'])
+    return value
+
+
+class Cassette:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._responses = {}
+        self._lock = threading.Lock()
+        path = os.path.join(directory, RESPONSES)
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._responses[entry['key']] = entry
+
+    def get(self, key):
+        entry = self._responses.get(key)
+        if entry is None:
+            raise ReplayMiss(f"No recorded response for request {key[:12]} in {self.directory}")
+        return decode(entry['response']), entry['latency']
+
+    def put(self, key, response, latency):
+        entry = {'key': key, 'latency': latency, 'response': encode(response)}
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._responses[key] = entry
+            with open(os.path.join(self.directory, RESPONSES), 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def save_algorithms(self, algorithms):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ALGORITHMS), 'w') as f:
+            json.dump(algorithms, f)
+
+    def load_algorithms(self):
+        path = os.path.join(self.directory, ALGORITHMS)
+        if not os.path.exists(path):
+            raise ReplayMiss(f"{self.directory} has no recorded algorithms, record it first")
+        with open(path) as f:
+            return json.load(f)
+
+    def __len__(self):
+        return len(self._responses)
+
+
+class ReplayExecutor(executor.RequestExecutor):
+
+    def __init__(self, cassette, mode='replay', latency=0.0, latency_scale=1.0, **kwargs):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        # Replayed requests are not rate limited
+        if mode == 'replay':
+            kwargs.setdefault('rate', float('inf'))
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+
+    def _call(self, key, func):
+        if self.mode == 'record':
+            started = time.perf_counter()
+            response = func()
+            self.cassette.put(key, response, time.perf_counter() - started)
+            return response
+
+        response, recorded = self.cassette.get(key)
+        delay = recorded * self.latency_scale if self.latency == 'recorded' else self.latency
+        if delay:
+            time.sleep(delay)
+        return response
+
+
+# Stand-in for the service account credentials on replay
+class ReplayCredentials:
+    expired = False
+
+
+# Initialize the client library from recorded algorithm signatures, without
+# credentials or a server
+def initialize_offline(algorithms):
+    with session._lock:
+        if session._credentials is not None:
+            return session._credentials
+        credentials = ReplayCredentials()
+        get_algorithms, data_initialize = ee.data.getAlgorithms, ee.data.initialize
+        ee.data.getAlgorithms = lambda: algorithms
+        ee.data.initialize = lambda *args, **kwargs: None
+        try:
+            ee.Initialize(credentials, project='replay')
+        finally:
+            ee.data.getAlgorithms, ee.data.initialize = get_algorithms, data_initialize
+        # geemap checks for credentials before building a map
+        ee.data._credentials = credentials
+        session._credentials = credentials
+        return credentials
+
+
+_installed = None
+
+
+# Route the app's Earth Engine requests through a cassette. In 'record'
+# mode session.initialize() still authorizes with the real service account
+# and stores the algorithm signatures; in 'replay' mode it ignores them.
+def install(directory, mode='replay', latency=0.0, latency_scale=1.0, **kwargs):
+    global _installed
+    cassette = Cassette(directory)
+    replay_executor = ReplayExecutor(cassette, mode, latency, latency_scale, **kwargs)
+    live_initialize = session.initialize if _installed is None else _installed[1]
+
+    if mode == 'record':
+        def initialize(service_account, json_data):
+            credentials = live_initialize(service_account, json_data)
+            if not os.path.exists(os.path.join(directory, ALGORITHMS)):
+                cassette.save_algorithms(ee.data.getAlgorithms())
+            return credentials
+    else:
+        def initialize(service_account=None, json_data=None):
+            return initialize_offline(cassette.load_algorithms())
+
+    previous = executor.set_executor(replay_executor)
+    if _installed is None:
+        _installed = (previous, live_initialize)
+    session.initialize = initialize
+    return replay_executor
+
+
+# Whether a cassette directory holds a recording to replay
+def is_recorded(directory):
+    return os.path.exists(os.path.join(directory, ALGORITHMS))
+
+
+# Restore the live executor and session initialization
+def uninstall():
+    global _installed
+    if _installed is None:
+        return
+    previous, live_initialize = _installed
+    executor.set_executor(previous)
+    session.initialize = live_initialize
+    _installed = None
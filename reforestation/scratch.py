@@ -0,0 +1,191 @@
+"""Session-scoped scratch space for uploads and exports.
+
+Every file the page writes (uploaded GeoTIFFs and their overviews, vector
+exports) goes into a directory of the session that wrote it. Sessions are
+identified through st.session_state and touched on every run. A session idle
+for longer than the TTL is evicted with its files, since Streamlit does not
+say when a browser tab goes away.
+
+Writes reserve their size first. A session over its quota drops its own
+oldest entries (a previous upload, an old export); the process over its
+total quota evicts the least recently used other sessions. When neither
+frees enough room, QuotaExceeded is raised instead of filling the disk.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_ROOT = os.environ.get(
+    'REFORESTATION_SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'reforestation-scratch'))
+# Disk quotas in bytes
+SESSION_QUOTA = 2 * 1024 ** 3
+TOTAL_QUOTA = 20 * 1024 ** 3
+# Idle time in seconds after which a session's scratch space is evicted
+SESSION_TTL = 3600
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+# Size in bytes of a file or of every file below a directory
+def disk_usage(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+class SessionScratch:
+
+    def __init__(self, session_id, directory, clock=time.time):
+        self.session_id = session_id
+        self.directory = directory
+        self.last_access = clock()
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    # Create a directory for one upload or export, removed with the session
+    def mkdtemp(self, prefix=''):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = tempfile.mkdtemp(prefix=prefix, dir=self.directory)
+            self._entries[path] = None
+            return path
+
+    # Remove an entry created by mkdtemp() before the session ends
+    def remove(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def usage(self):
+        with self._lock:
+            return sum(disk_usage(path) for path in self._entries if os.path.exists(path))
+
+    # Make room for `nbytes` in the session quota by dropping the oldest
+    # entries, except those in `keep`; returns the bytes still in use
+    def trim(self, nbytes, quota, keep=()):
+        with self._lock:
+            used = self.usage()
+            for path in list(self._entries):
+                if used + nbytes <= quota:
+                    break
+                if path not in keep:
+                    used -= disk_usage(path)
+                    self.remove(path)
+            if used + nbytes > quota:
+                raise QuotaExceeded(
+                    f"{nbytes / 1024 ** 2:.0f} MB do not fit in the session quota of {quota / 1024 ** 2:.0f} MB")
+            return used
+
+    # Delete every file of the session
+    def release(self):
+        with self._lock:
+            self._entries.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ScratchManager:
+
+    def __init__(self, root=DEFAULT_ROOT, session_quota=SESSION_QUOTA, total_quota=TOTAL_QUOTA,
+                 ttl=SESSION_TTL, clock=time.time):
+        self.root = root
+        self.session_quota = session_quota
+        self.total_quota = total_quota
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self._remove_stale()
+
+    # Directories left behind by an earlier server process
+    def _remove_stale(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) <= cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    # The scratch space of the session of a page run, keyed by an ID kept in
+    # its session state. Expired sessions are evicted on the way.
+    def begin_run(self, state):
+        session_id = state.get('_scratch_session')
+        if session_id is None:
+            session_id = state['_scratch_session'] = uuid.uuid4().hex
+        with self._lock:
+            self.evict_expired()
+            scratch = self._sessions.get(session_id)
+            if scratch is None:
+                scratch = self._sessions[session_id] = SessionScratch(
+                    session_id, os.path.join(self.root, session_id), self.clock)
+            scratch.last_access = self.clock()
+            return scratch
+
+    def evict_expired(self):
+        cutoff = self.clock() - self.ttl
+        with self._lock:
+            for session_id, scratch in list(self._sessions.items()):
+                if scratch.last_access <= cutoff:
+                    self.evict(session_id)
+
+    def evict(self, session_id):
+        with self._lock:
+            scratch = self._sessions.pop(session_id, None)
+        if scratch is not None:
+            scratch.release()
+
+    # Reserve `nbytes` for a write of `scratch`: its own oldest entries go
+    # first, then the least recently used other sessions
+    def reserve(self, scratch, nbytes, keep=()):
+        used = scratch.trim(nbytes, self.session_quota, keep)
+        with self._lock:
+            others = sorted((s for s in self._sessions.values() if s is not scratch),
+                            key=lambda s: s.last_access)
+            usages = {s.session_id: s.usage() for s in others}
+            total = used + sum(usages.values())
+            for other in others:
+                if total + nbytes <= self.total_quota:
+                    break
+                total -= usages[other.session_id]
+                self.evict(other.session_id)
+            if total + nbytes > self.total_quota:
+                raise QuotaExceeded("The server is out of scratch space, please try again later")
+
+    # Current sessions and disk usage
+    def usage(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            'sessions': len(sessions),
+            'bytes': sum(s.usage() for s in sessions),
+            'session_quota': self.session_quota,
+            'total_quota': self.total_quota,
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+# The scratch manager shared by every session of the server process
+def get_scratch():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ScratchManager()
+        return _manager
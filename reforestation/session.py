@@ -0,0 +1,68 @@
+"""Process-wide Earth Engine session.
+
+Streamlit reruns the page script on every interaction, so anything done at
+the top of the page is paid for on every click. The service account is parsed
+and Earth Engine initialized once per server process here, the access token is
+refreshed when it expires, and the constant dataset handles are built once
+and shared by every session.
+"""
+import json
+import threading
+
+import ee
+
+NLCD_2021 = 'USGS/NLCD_RELEASES/2021_REL/NLCD/2021'
+SRTM = 'CGIAR/SRTM90_V4'
+SENTINEL_2 = 'COPERNICUS/S2'
+WORLDCOVER = 'ESA/WorldCover/v100'
+
+# NLCD epochs of the change analysis (see reforestation.change); the 2021
+# release only holds 2021, the earlier epochs come from the 2019 release
+NLCD_2019_RELEASE = 'USGS/NLCD_RELEASES/2019_REL/NLCD'
+NLCD_EPOCHS = {year: f"{NLCD_2019_RELEASE}/{year}" for year in (2001, 2004, 2006, 2008, 2011, 2013, 2016, 2019)}
+NLCD_EPOCHS[2021] = NLCD_2021
+
+# Constant Earth Engine objects used by the page
+DATASETS = {
+    'nlcd': lambda: ee.Image(NLCD_2021).select('landcover'),
+    'srtm': lambda: ee.Image(SRTM),
+    'sentinel2': lambda: ee.ImageCollection(SENTINEL_2),
+    'worldcover': lambda: ee.ImageCollection(WORLDCOVER).first(),
+}
+DATASETS.update({f'nlcd_{year}': lambda asset=asset: ee.Image(asset).select('landcover')
+                 for year, asset in NLCD_EPOCHS.items()})
+
+_lock = threading.RLock()
+_credentials = None
+_datasets = {}
+
+
+# Authorize the app once per process; later calls only refresh an expired token
+def initialize(service_account, json_data):
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            key_data = json.dumps(json.loads(json_data, strict=False))
+            credentials = ee.ServiceAccountCredentials(service_account, key_data=key_data)
+            ee.Initialize(credentials)
+            _credentials = credentials
+        else:
+            refresh()
+        return _credentials
+
+
+# Refresh the access token shared by every session if it has expired
+def refresh():
+    with _lock:
+        if _credentials is None or not getattr(_credentials, 'expired', False):
+            return
+        from google.auth.transport.requests import Request
+        _credentials.refresh(Request())
+
+
+# Return the shared handle of a constant dataset ('nlcd', 'worldcover', 'srtm', ...)
+def dataset(name):
+    with _lock:
+        if name not in _datasets:
+            _datasets[name] = DATASETS[name]()
+        return _datasets[name]
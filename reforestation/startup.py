@@ -0,0 +1,61 @@
+"""Cold start of the calculator page.
+
+Importing Earth Engine, geemap and pandas and authorizing the service account
+take seconds after a deploy or a worker recycle. The page only needs them
+once an ROI is given, so warm_up() does that work on a background thread
+while the input widgets render, and the page calls wait() before its first
+Earth Engine request. Modules only one feature uses are left out of the
+warm-up and imported by that feature: geopandas for shapefile uploads and
+rasterio for GeoTIFF uploads.
+"""
+import importlib
+import threading
+from concurrent.futures import Future
+
+# Modules the page imports once an ROI is given, loaded ahead of it
+MODULES = (
+    'geemap.foliumap',
+    'pandas',
+    'reforestation.planner',
+    'reforestation.maps',
+    'reforestation.batch',
+    'reforestation.progressive',
+    'reforestation.export',
+    'reforestation.change',
+    'reforestation.charts',
+)
+
+_future = None
+_lock = threading.Lock()
+
+
+def _run(future, service_account, json_data):
+    try:
+        from reforestation import session
+        session.initialize(service_account, json_data)
+        for name in MODULES:
+            importlib.import_module(name)
+        future.set_result(True)
+    except BaseException as e:
+        future.set_exception(e)
+
+
+# Start the warm-up of the server process, unless it is running or done;
+# a warm-up that failed is started again
+def warm_up(service_account, json_data):
+    global _future
+    with _lock:
+        if _future is None or (_future.done() and _future.exception() is not None):
+            _future = Future()
+            threading.Thread(target=_run, args=(_future, service_account, json_data),
+                             name='warm-up', daemon=True).start()
+        return _future
+
+
+# Wait for the warm-up, raising its error if it failed
+def wait(timeout=None):
+    with _lock:
+        future = _future
+    if future is None:
+        raise RuntimeError("warm_up() has not been called")
+    return future.result(timeout)
@@ -0,0 +1,136 @@
+"""Vectorized area summaries of landcover histograms.
+
+Any number of frequencyHistogram dicts ({class: pixel count}), for the full
+ROI, the plantable areas, batch features or tiles, are stacked into one count
+matrix with a column per class code. Areas, percentages and the forested and
+non-forested totals are then computed on whole arrays, with lookup arrays
+indexed by class code (built from the class tables of reforestation.landcover)
+in place of per-row legend lookups. Values stay numeric; rounding and
+formatting are left to the display layer.
+
+Joint landcover-by-slope histograms are split locally into the full and the
+plantable histogram of any slope threshold, or summed cumulatively over the
+slope bins into an area-versus-threshold curve.
+"""
+import math
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from reforestation.landcover import EXCLUDED, FOREST, LANDCOVERS, PIXEL_AREA, PLANTABLE
+
+# Class codes are 8-bit (NLCD and WorldCover)
+N_CLASSES = 256
+
+# Joint landcover-by-slope histograms (see reforestation.planner.joint_image)
+# are keyed class * SLOPE_CODES + slope bin. Bins are whole degrees up to
+# MAX_SLOPE_BIN; pixels without a slope fall in NO_SLOPE and are never plantable.
+SLOPE_CODES = 100
+MAX_SLOPE_BIN = 89
+NO_SLOPE = 99
+
+
+# Lookup arrays of a landcover dataset indexed by class code: descriptions and
+# the weights of the classes counted towards the forested and non-forested totals
+def lookup_arrays(landcover):
+    descriptions = np.full(N_CLASSES, 'Unknown', dtype=object)
+    categories = np.full(N_CLASSES, -1)
+    for code, description in landcover['legend'].items():
+        descriptions[code] = description
+    for code, category in landcover['categories'].items():
+        categories[code] = category
+    return {
+        'descriptions': descriptions,
+        'forested': (categories == FOREST).astype(np.float64),
+        'non_forested': np.isin(categories, [PLANTABLE, EXCLUDED]).astype(np.float64),
+        'plantable': (categories == PLANTABLE).astype(np.float64),
+    }
+
+
+LOOKUPS = {name: lookup_arrays(landcover) for name, landcover in LANDCOVERS.items()}
+
+
+# Stack histograms into an (n, width) matrix of pixel counts.
+# Keys may be class codes or their string form, as returned by Earth Engine.
+def count_matrix(histograms, width=N_CLASSES):
+    histograms = [histogram or {} for histogram in histograms]
+    lengths = np.fromiter(map(len, histograms), dtype=np.intp, count=len(histograms))
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros((len(histograms), width))
+
+    codes = np.asarray(list(chain.from_iterable(histograms))).astype(np.float64).astype(np.intp)
+    counts = np.fromiter(chain.from_iterable(h.values() for h in histograms), dtype=np.float64, count=total)
+    if codes.min() < 0 or codes.max() >= width:
+        raise ValueError(f"Class codes must be between 0 and {width - 1}")
+
+    rows = np.repeat(np.arange(len(histograms)), lengths)
+    matrix = np.bincount(rows * width + codes, weights=counts, minlength=len(histograms) * width)
+    return matrix.reshape(len(histograms), width)
+
+
+# Pixel counts of a joint histogram as an (N_CLASSES, SLOPE_CODES) matrix
+def joint_matrix(histogram):
+    return count_matrix([histogram], N_CLASSES * SLOPE_CODES).reshape(N_CLASSES, SLOPE_CODES)
+
+
+# Convert per-class counts back to a frequencyHistogram dict
+def to_histogram(counts):
+    return {str(code): float(counts[code]) for code in np.flatnonzero(counts)}
+
+
+# Full and plantable landcover histograms for a slope threshold (degrees),
+# read from a joint histogram. Bins are whole degrees, so fractional
+# thresholds are rounded up.
+def split_joint(histogram, slope_threshold, landcover='nlcd'):
+    matrix = joint_matrix(histogram)
+    bins = min(max(math.ceil(slope_threshold), 0), MAX_SLOPE_BIN + 1)
+    plantable = matrix[:, :bins].sum(axis=1) * LOOKUPS[landcover]['plantable']
+    return {
+        'landcover': to_histogram(matrix.sum(axis=1)),
+        'plantable': to_histogram(plantable),
+    }
+
+
+# Plantable area (sq. km) for every whole-degree slope threshold from 0 to
+# MAX_SLOPE_BIN + 1, as the cumulative sum of the plantable classes over the
+# slope bins of a joint histogram
+def threshold_curve(histogram, landcover='nlcd', pixel_area=PIXEL_AREA):
+    matrix = joint_matrix(histogram)
+    per_bin = LOOKUPS[landcover]['plantable'] @ matrix[:, :MAX_SLOPE_BIN + 1] * (pixel_area / 1000000)
+    return pd.DataFrame({
+        'Slope threshold (degrees)': np.arange(MAX_SLOPE_BIN + 2),
+        'Plantable (sq. km)': np.concatenate([[0.0], np.cumsum(per_bin)]),
+    })
+
+
+# Areas (sq. km), percentages of each histogram's total and the category
+# totals of a batch of histograms, as arrays with one row per histogram
+def summarize_histograms(histograms, pixel_area=PIXEL_AREA, landcover='nlcd'):
+    lookups = LOOKUPS[landcover]
+    areas = count_matrix(histograms) * (pixel_area / 1000000)
+    total = areas.sum(axis=1)
+    percentages = np.divide(areas * 100, total[:, None], out=np.zeros_like(areas), where=total[:, None] > 0)
+    return {
+        'landcover': landcover,
+        'areas': areas,
+        'percentages': percentages,
+        'total': total,
+        'forested': areas @ lookups['forested'],
+        'non_forested': areas @ lookups['non_forested'],
+    }
+
+
+# Area table of one histogram of a summary: Class, Sum (sq. km), Percentage and
+# Description, largest class first
+def area_table(summary, index=0):
+    areas = summary['areas'][index]
+    classes = np.flatnonzero(areas)
+    order = classes[np.argsort(-areas[classes], kind='stable')]
+    return pd.DataFrame({
+        'Class': order,
+        'Sum': areas[order],
+        'Percentage': summary['percentages'][index][order],
+        'Description': LOOKUPS[summary['landcover']]['descriptions'][order],
+    })
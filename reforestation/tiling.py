@@ -0,0 +1,109 @@
+"""Adaptive tiling of large ROIs for the histogram reductions.
+
+County- or state-sized ROIs exceed what a single 30 m reduceRegion can do
+within Earth Engine's pixel and time limits. The pixel count of the ROI is
+estimated client-side; above TILE_PIXELS the ROI is cut into a grid of tiles
+(the exact intersections of the ROI with the grid cells). Tiles are reduced in
+parallel, a tile that fails is split 2 x 2 and retried, and the partial
+histograms are summed. frequencyHistogram weights edge pixels by the fraction
+of the pixel inside the geometry, so the tiles of a partition add up to the
+histogram of the whole ROI.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+from shapely.geometry import box, mapping, shape
+from shapely.ops import unary_union
+
+from reforestation.executor import get_executor
+from reforestation.ingest import METERS_PER_DEGREE
+from reforestation.planner import fetch, histogram_request, joint_image, landcover_image, slope_image
+
+# Pixels reduced per request before the ROI is tiled
+TILE_PIXELS = 2e7
+MAX_WORKERS = 8
+# How many times a failing tile is split again before giving up
+MAX_SPLITS = 3
+
+
+# Estimate the number of 30 m pixels of a GeoJSON geometry (EPSG:4326)
+def estimate_pixels(geometry, scale=30):
+    geom = shape(geometry)
+    if geom.is_empty:
+        return 0
+    mean_lat = (geom.bounds[1] + geom.bounds[3]) / 2
+    area = geom.area * METERS_PER_DEGREE ** 2 * math.cos(math.radians(mean_lat))
+    return area / scale ** 2
+
+
+# Cut a geometry into the non-empty parts of an n x n grid over its bounds
+def split_geometry(geom, n):
+    minx, miny, maxx, maxy = geom.bounds
+    width, height = (maxx - minx) / n, (maxy - miny) / n
+    parts = []
+    for i in range(n):
+        for j in range(n):
+            cell = box(minx + i * width, miny + j * height, minx + (i + 1) * width, miny + (j + 1) * height)
+            part = geom.intersection(cell)
+            # Drop the lines and points an intersection can leave along cell edges
+            if part.geom_type == 'GeometryCollection':
+                part = unary_union([g for g in part.geoms if g.area > 0])
+            if not part.is_empty and part.area > 0:
+                parts.append(part)
+    return parts
+
+
+# Plan the tiles of an ROI: the ROI itself when it fits one request, else a grid
+def plan_tiles(geometry, tile_pixels=TILE_PIXELS):
+    geom = shape(geometry)
+    pixels = estimate_pixels(geometry)
+    if pixels <= tile_pixels:
+        return [geom]
+    return split_geometry(geom, math.ceil(math.sqrt(pixels / tile_pixels)))
+
+
+# Sum frequencyHistogram dicts
+def merge_histograms(histograms):
+    merged = {}
+    for histogram in histograms:
+        for key, count in (histogram or {}).items():
+            merged[key] = merged.get(key, 0.0) + count
+    return merged
+
+
+# Earth Engine geometry of a tile, with planar edges so the tiles cut with
+# shapely partition the ROI exactly
+def tile_geometry(geom):
+    return ee.Geometry(mapping(geom), None, False)
+
+
+# Reduce one tile, splitting it and retrying the parts when Earth Engine fails
+def reduce_tile(geom, splits=0, landcover='nlcd'):
+    roi = tile_geometry(geom)
+    try:
+        joint = joint_image(landcover_image(roi, landcover), slope_image(roi))
+        results = fetch(histogram_request(roi, joint, tile_scale=2 ** splits), 'reduce_region_tile')
+        return [results]
+    except ee.EEException:
+        if splits >= MAX_SPLITS:
+            raise
+        results = []
+        for part in split_geometry(geom, 2):
+            results.extend(reduce_tile(part, splits + 1, landcover))
+        return results
+
+
+# Joint landcover-by-slope histogram of an ROI of any size
+def reduce_histograms(geometry, tile_pixels=TILE_PIXELS, max_workers=MAX_WORKERS, landcover='nlcd'):
+    tiles = plan_tiles(geometry, tile_pixels)
+    if len(tiles) == 1:
+        results = reduce_tile(tiles[0], landcover=landcover)
+    else:
+        # The tiles run under the cancel token of the calling page run
+        executor = get_executor()
+        token = executor.current_token()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tiles))) as pool:
+            futures = [pool.submit(executor.bind(reduce_tile, token), tile, landcover=landcover) for tile in tiles]
+            results = [result for future in futures for result in executor.result(future, token)]
+    return {'joint': merge_histograms(result['joint'] for result in results)}
@@ -0,0 +1,127 @@
+"""Windowed handling of uploaded GeoTIFFs.
+
+Uploaded landcover rasters (landcover.io, NAIP derived products) can be
+hundreds of MB. They are copied to disk in chunks, get internal overviews so a
+preview is read from a reduced resolution level, and their class histogram is
+computed block by block, clipped to the ROI, so the full raster is never held
+in memory.
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_geom
+
+from reforestation.raster import iter_blocks, roi_window
+
+# Longest side of the preview image in pixels
+PREVIEW_SIZE = 1024
+CHUNK_SIZE = 1024
+
+
+# Copy an uploaded file to `directory` without reading it into one buffer
+def save_upload(uploaded_file, directory):
+    path = os.path.join(directory, os.path.basename(uploaded_file.name))
+    uploaded_file.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(uploaded_file, f, length=16 * 1024 * 1024)
+    return path
+
+
+# Build internal overviews down to about the preview size
+def build_overviews(path, size=PREVIEW_SIZE):
+    with rasterio.open(path, 'r+') as src:
+        if src.overviews(1):
+            return
+        factors = []
+        factor = 2
+        while max(src.width, src.height) / factor >= size / 2:
+            factors.append(factor)
+            factor *= 2
+        if factors:
+            src.build_overviews(factors, Resampling.nearest)
+            src.update_tags(ns='rio_overview', resampling='nearest')
+
+
+# Read a display image of at most `size` pixels per side, using the overviews.
+# Single band rasters are coloured with their embedded colormap when present.
+def preview(path, size=PREVIEW_SIZE):
+    with rasterio.open(path) as src:
+        scale = min(1.0, size / max(src.width, src.height))
+        shape = (max(1, int(src.height * scale)), max(1, int(src.width * scale)))
+
+        if src.count >= 3:
+            data = src.read([1, 2, 3], out_shape=(3,) + shape, resampling=Resampling.nearest)
+            return np.moveaxis(stretch(data), 0, -1)
+
+        data = src.read(1, out_shape=shape, resampling=Resampling.nearest)
+        try:
+            colormap = src.colormap(1)
+        except ValueError:
+            return stretch(data)
+        lut = np.zeros((max(256, int(data.max()) + 1), 3), dtype=np.uint8)
+        for value, color in colormap.items():
+            if value < len(lut):
+                lut[value] = color[:3]
+        return lut[data]
+
+
+# Scale an array to 0-255 for display
+def stretch(data):
+    data = data.astype('float64')
+    low, high = np.nanpercentile(data, [2, 98])
+    if high <= low:
+        high = low + 1
+    return (np.clip((data - low) / (high - low), 0, 1) * 255).astype(np.uint8)
+
+
+# Per-class pixel counts of band 1, clipped to an ROI (GeoJSON, EPSG:4326),
+# computed block by block
+def class_histogram(path, roi=None, chunk_size=CHUNK_SIZE):
+    counts = {}
+    with rasterio.open(path) as src:
+        if roi is not None and src.crs is not None:
+            roi = transform_geom('EPSG:4326', src.crs, roi)
+        window = roi_window(src, roi)
+        if window.width <= 0 or window.height <= 0:
+            return counts, pixel_area(src)
+
+        for block in iter_blocks(window, chunk_size):
+            data = src.read(1, window=block, masked=True)
+            valid = ~np.ma.getmaskarray(data)
+            if roi is not None:
+                valid &= geometry_mask([roi], out_shape=data.shape,
+                                       transform=src.window_transform(block), invert=True)
+            values = data.data[valid]
+            if values.dtype.kind == 'u' and values.dtype.itemsize <= 2:
+                block_counts = np.bincount(values)
+                classes = np.flatnonzero(block_counts)
+                block_counts = block_counts[classes]
+            else:
+                classes, block_counts = np.unique(values, return_counts=True)
+            for value, count in zip(classes.tolist(), block_counts.tolist()):
+                counts[value] = counts.get(value, 0) + count
+
+        return counts, pixel_area(src)
+
+
+# Pixel area in square metres, or None when the raster is not in a projected CRS
+def pixel_area(src):
+    if src.crs is None or not src.crs.is_projected:
+        return None
+    return abs(src.transform.a * src.transform.e) * src.crs.linear_units_factor[1] ** 2
+
+
+# Area table (sq. km) of an uploaded landcover raster; without a pixel area
+# only pixel counts and percentages are given
+def class_table(counts, area=None):
+    df = pd.DataFrame({'Class': list(counts), 'Pixels': list(counts.values())})
+    if area is not None:
+        df['Sum'] = df['Pixels'] * area / 1000000
+    total = df['Pixels'].sum()
+    df['Percentage'] = df['Pixels'] / total * 100 if total else 0.0
+    return df.sort_values(by='Pixels', ascending=False)
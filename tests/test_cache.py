@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+from reforestation import cache as cache_module
+from reforestation.cache import ResultCache, cache_key
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'time', clock)
+    return clock
+
+
+def test_cache_key_is_canonical():
+    geometry = {'type': 'Point', 'coordinates': [1.0000000001, 2.0]}
+    same = {'coordinates': [1.0, 2.0], 'type': 'Point'}
+    assert cache_key(geometry, landcover='nlcd') == cache_key(same, landcover='nlcd')
+    assert cache_key(geometry, landcover='nlcd') != cache_key(geometry, landcover='worldcover')
+
+
+def test_memory_lru():
+    cache = ResultCache(directory=None, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_values_are_copied():
+    cache = ResultCache(directory=None)
+    value = {'tiles': {}}
+    cache.set('a', value)
+    value['tiles']['ROI'] = 'url'
+    assert cache.get('a') == {'tiles': {}}
+    cache.get('a')['tiles']['ROI'] = 'url'
+    assert cache.get('a') == {'tiles': {}}
+
+
+def test_ttl(clock, tmp_path):
+    cache = ResultCache(directory=str(tmp_path), ttl=60)
+    cache.set('a', {'joint': {'7105': 1.0}})
+    clock.now += 59
+    assert cache.get('a') == {'joint': {'7105': 1.0}}
+    clock.now += 2
+    os.utime(tmp_path / 'a.json', (clock.now - 61, clock.now - 61))
+    assert cache.get('a') is None
+    assert not (tmp_path / 'a.json').exists()
+
+
+def test_disk_tier_outlives_memory(tmp_path):
+    ResultCache(directory=str(tmp_path)).set('a', [1, 2])
+    assert ResultCache(directory=str(tmp_path)).get('a') == [1, 2]
+
+
+def test_disk_eviction_oldest_first(tmp_path):
+    cache = ResultCache(directory=str(tmp_path), max_bytes=250)
+    now = time.time()
+    for i, key in enumerate('abc'):
+        cache.set(key, 'x' * 100)
+        os.utime(tmp_path / f'{key}.json', (now - 10 + i, now - 10 + i))
+    cache.set('d', 'x' * 100)
+    assert sorted(os.listdir(tmp_path)) == ['c.json', 'd.json']
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    (tmp_path / 'a.json').write_text('{not json')
+    assert ResultCache(directory=str(tmp_path)).get('a') is None
+
+
+def test_clear(tmp_path):
+    cache = ResultCache(directory=str(tmp_path))
+    cache.set('a', 1)
+    cache.clear()
+    assert cache.get('a') is None
+    assert os.listdir(tmp_path) == []
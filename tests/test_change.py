@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip('ee')
+pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+pytest.importorskip('shapely')
+
+from reforestation.change import forest_transitions
+from reforestation.landcover import PIXEL_AREA
+from reforestation.summary import N_CLASSES
+
+SQ_KM = PIXEL_AREA / 1000000
+
+
+# Key of a transition histogram: the class of the first epoch and of the last
+def transition_key(first, last):
+    return str(first * N_CLASSES + last)
+
+
+def test_forest_transitions():
+    histogram = {
+        transition_key(41, 71): 2.0,   # forest lost to grassland
+        transition_key(43, 71): 1.0,
+        transition_key(71, 42): 3.0,   # forest gained from grassland
+        transition_key(41, 21): 4.0,   # forest lost to development
+        transition_key(41, 42): 7.0,   # forest to forest
+        transition_key(21, 22): 5.0,   # no forest involved
+        transition_key(41, 41): 9.0,   # unchanged
+    }
+    table = forest_transitions(histogram).set_index('Class')
+
+    assert list(table.index) == [21, 71]
+    assert table.loc[71, 'Loss (sq. km)'] == pytest.approx(3.0 * SQ_KM)
+    assert table.loc[71, 'Gain (sq. km)'] == pytest.approx(3.0 * SQ_KM)
+    assert table.loc[21, 'Loss (sq. km)'] == pytest.approx(4.0 * SQ_KM)
+    assert table.loc[21, 'Gain (sq. km)'] == 0.0
+    assert table.loc[71, 'Description'] == 'Grassland/Herbaceous'
+
+
+def test_forest_transitions_without_forest():
+    assert forest_transitions({transition_key(21, 22): 5.0}).empty
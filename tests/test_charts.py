@@ -0,0 +1,51 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from reforestation import charts
+from reforestation.charts import DEFAULT_COLOR, bar_spec, chart_rows, pie_spec, spec_key
+
+COLORS = {'Deciduous Forest': '#68ab5f', 'Grassland/Herbaceous': '#dfdfc2'}
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({'Class': [41, 71, 31], 'Sum': [2.123456, 1.0, 0.5], 'Percentage': [58.234, 27.4, 13.7],
+                         'Description': ['Deciduous Forest', 'Grassland/Herbaceous', 'Barren Land (Rock/Sand/Clay)']})
+
+
+def test_chart_rows(df):
+    assert chart_rows(df)[0] == {'Description': 'Deciduous Forest', 'Sum': 2.1235, 'Percentage': 58.23}
+
+
+def test_bar_spec(df):
+    spec = bar_spec(df, COLORS, "NLCD 2021 Landcover Types")
+    assert spec['title'] == "NLCD 2021 Landcover Types"
+    assert spec['data']['values'] == chart_rows(df)
+    scale = spec['layer'][0]['encoding']['color']['scale']
+    assert scale['domain'] == list(df['Description'])
+    assert scale['range'] == ['#68ab5f', '#dfdfc2', DEFAULT_COLOR]
+
+
+def test_pie_spec(df):
+    spec = pie_spec(df, COLORS)
+    assert spec['encoding']['theta']['field'] == 'Sum'
+    assert [layer['mark']['type'] for layer in spec['layer']] == ['arc', 'text']
+
+
+def test_specs_are_cached(df, monkeypatch):
+    monkeypatch.setattr(charts, '_specs', type(charts._specs)())
+    first = bar_spec(df, COLORS, "a")
+    assert bar_spec(df.copy(), COLORS, "a") is first
+    assert bar_spec(df, COLORS, "b") is not first
+    assert spec_key('bar', chart_rows(df), colors=COLORS, title="a") != spec_key('pie', chart_rows(df), colors=COLORS)
+
+
+def test_spec_cache_is_bounded(df, monkeypatch):
+    monkeypatch.setattr(charts, '_specs', type(charts._specs)())
+    monkeypatch.setattr(charts, 'MAX_SPECS', 2)
+    first = bar_spec(df, COLORS, "a")
+    bar_spec(df, COLORS, "b")
+    bar_spec(df, COLORS, "c")
+    assert len(charts._specs) == 2
+    assert bar_spec(df, COLORS, "a") is not first
@@ -0,0 +1,48 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('ee')
+pytest.importorskip('geopandas')
+
+from reforestation.cli import ResultWriter
+
+ROWS = [
+    {'feature_id': 0, 'Feature': 'a', 'Plantable (sq. km)': 1.5, 'Error': None},
+    {'feature_id': 1, 'Feature': 'b', 'Error': '429 Too Many Requests'},
+    {'feature_id': 2, 'Feature': 'c', 'Plantable (sq. km)': 0.5, 'Error': None},
+]
+
+
+def read_output(writer):
+    if writer.parquet:
+        return pd.concat(pd.read_parquet(part) for part in writer._parts())
+    return pd.read_csv(writer.path)
+
+
+@pytest.fixture(params=['screening.csv', 'screening.parquet'])
+def writer(request, tmp_path):
+    return ResultWriter(str(tmp_path / request.param))
+
+
+def test_done_skips_failed_rows(writer):
+    assert writer.done() == set()
+    writer.write(ROWS[:2])
+    writer.write(ROWS[2:])
+    assert writer.done() == {0, 2}
+
+
+def test_retried_row_replaces_failed_row(writer):
+    writer.write(ROWS)
+    assert writer.drop_failed() == 1
+    assert writer.drop_failed() == 0
+    assert writer.done() == {0, 2}
+
+    writer.write([{'feature_id': 1, 'Feature': 'b', 'Plantable (sq. km)': 2.0, 'Error': None}])
+    df = read_output(writer)
+    assert sorted(df['feature_id']) == [0, 1, 2]
+    assert df['Error'].isna().all()
+    assert writer.done() == {0, 1, 2}
+
+
+def test_drop_failed_without_output(writer):
+    assert writer.drop_failed() == 0
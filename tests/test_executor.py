@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ee = pytest.importorskip('ee')
+
+from reforestation import executor as executor_module
+from reforestation.executor import CancelToken, Cancelled, RequestExecutor, is_retryable
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(executor_module, 'backoff_delay', lambda attempt: 0)
+
+
+@pytest.fixture
+def executor():
+    executor = RequestExecutor(max_workers=2, rate=1000, burst=1000)
+    yield executor
+    executor._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def test_identical_requests_are_coalesced(executor):
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    first, first_token = executor.submit('key', func)
+    second, second_token = executor.submit('key', func)
+    release.set()
+    assert second is first
+    assert executor.result(first, first_token) == executor.result(second, second_token) == 'result'
+    assert calls == [1]
+    assert executor.stats['coalesced'] == 1
+
+    # Once finished, the same request is sent again
+    third, token = executor.submit('key', func)
+    assert executor.result(third, token) == 'result'
+    assert calls == [1, 1]
+
+
+def test_retryable_errors_are_retried(executor):
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ee.EEException('429 Too Many Requests')
+        return 'ok'
+
+    future, token = executor.submit('key', func)
+    assert executor.result(future, token) == 'ok'
+    assert len(attempts) == 3
+    assert executor.stats['retries'] == 2
+
+
+def test_other_errors_are_raised(executor):
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        raise ee.EEException('Image.load: Asset not found')
+
+    future, token = executor.submit('key', func)
+    with pytest.raises(ee.EEException):
+        executor.result(future, token)
+    assert attempts == [1]
+    assert is_retryable(ee.EEException('Quota exceeded'))
+
+
+def test_cancelled_run_stops_waiting(executor):
+    release = threading.Event()
+    token = CancelToken()
+    future, token = executor.submit('key', lambda: release.wait(5), token)
+    token.cancel()
+    with pytest.raises(Cancelled):
+        executor.result(future, token)
+    release.set()
+
+
+def test_abandoned_queued_request_is_dropped(executor):
+    release = threading.Event()
+    busy = [executor.submit(f'busy-{i}', lambda: release.wait(5)) for i in range(2)]
+    token = CancelToken()
+    calls = []
+    future, _ = executor.submit('queued', lambda: calls.append(1), token)
+    token.cancel()
+    release.set()
+    with pytest.raises(Cancelled):
+        future.result(5)
+    assert calls == []
+    assert executor.stats['cancelled'] == 1
+    for busy_future, busy_token in busy:
+        executor.result(busy_future, busy_token)
+
+
+def test_begin_run_cancels_the_previous_run(executor):
+    state = {}
+    first = executor.begin_run(state)
+    second = executor.begin_run(state)
+    assert first.cancelled and not second.cancelled
+    assert executor.current_token() is second
+
+
+def test_bind_runs_workers_under_the_token(executor):
+    token = executor.begin_run({})
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert pool.submit(executor.current_token).result() is None
+        future = pool.submit(executor.bind(executor.current_token, token))
+        assert list(executor.as_completed([future], token)) == [future]
+        assert future.result() is token
+
+
+def test_as_completed_gives_up_when_cancelled(executor):
+    release = threading.Event()
+    token = CancelToken()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(release.wait, 5)
+        token.cancel()
+        with pytest.raises(Cancelled):
+            list(executor.as_completed([future], token))
+        release.set()
@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip('ee')
+pytest.importorskip('numpy')
+pytest.importorskip('shapely')
+
+from shapely.geometry import box, mapping, shape
+
+from reforestation import gridindex
+from reforestation.gridindex import GridIndex, cover
+
+# Cells of a quarter degree, so the cell edges are exact in binary
+CELL_SIZE = 0.25
+# 2 x 2 full cells, and two partial cells along the east edge
+ROI = box(0, 0, 0.6, 0.5)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return GridIndex(str(tmp_path / 'cells.sqlite'), cell_size=CELL_SIZE)
+
+
+# Reductions sent to Earth Engine, answered with the area of the geometry
+@pytest.fixture
+def reduced(monkeypatch):
+    reduced = []
+
+    def reduce_histograms(geometry, landcover='nlcd', **kwargs):
+        reduced.append(shape(geometry))
+        return {'joint': {'7100': shape(geometry).area}}
+
+    monkeypatch.setattr(gridindex, 'reduce_histograms', reduce_histograms)
+    return reduced
+
+
+def test_cover():
+    full, partial = cover(ROI, CELL_SIZE)
+    assert sorted(full) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert sorted(partial) == [(2, 0), (2, 1)]
+    assert partial[(2, 0)].area == pytest.approx(0.1 * 0.25)
+
+
+def test_put_and_get(index):
+    index.put('nlcd', 3, -2, {'4105': 1.5, '7100': 2.0})
+    [(cell, (codes, counts))] = index.get('nlcd', [(3, -2), (4, -2)]).items()
+    assert cell == (3, -2)
+    assert dict(zip(codes.tolist(), counts.tolist())) == {4105: 1.5, 7100: 2.0}
+    assert index.get('worldcover', [(3, -2)]) == {}
+    assert index.stats() == {'nlcd': 1}
+
+
+def test_query_sums_indexed_cells_and_reduces_the_rest_once(index, reduced):
+    for cell in [(0, 0), (1, 0), (0, 1)]:
+        index.put('nlcd', *cell, {'4105': 10.0})
+    result = index.query(mapping(ROI))
+
+    # The missing full cell and both edges go out in a single reduction
+    assert len(reduced) == 1
+    assert reduced[0].area == pytest.approx(0.25 * 0.25 + 0.1 * 0.5)
+    assert result['joint']['4105'] == pytest.approx(30.0)
+    assert result['joint']['7100'] == pytest.approx(0.25 * 0.25 + 0.1 * 0.5)
+    assert (result['cells'], result['edge_cells'], result['missing_cells']) == (4, 2, 1)
+    # The query does not fill the index
+    assert index.stats() == {'nlcd': 3}
+
+
+def test_query_from_the_index_alone(index, reduced):
+    for cell in [(0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (2, 1)]:
+        index.put('nlcd', *cell, {'4105': 10.0})
+    result = index.query(mapping(ROI), prorate=True)
+
+    assert reduced == []
+    # Each edge cell is prorated by the share of the cell inside the ROI (0.4)
+    assert result['joint'] == {'4105': pytest.approx(4 * 10.0 + 2 * 4.0)}
+    assert result['reduced_edges'] == 0
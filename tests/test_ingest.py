@@ -0,0 +1,68 @@
+import io
+import zipfile
+
+import pytest
+
+shapely = pytest.importorskip('shapely')
+
+from shapely.geometry import Polygon, mapping, shape
+
+from reforestation.ingest import METERS_PER_DEGREE, prepare_geometry, read_geojson, read_zipped_shapefile
+
+
+# A square of `side` degrees at `lat` with a bump of `bump` metres to the
+# north in the middle of its top edge
+def bumpy_square(lat, side=0.01, bump=8.9):
+    height = bump / METERS_PER_DEGREE
+    return Polygon([(0, lat), (side, lat), (side, lat + side), (side / 2 + 1e-4, lat + side),
+                    (side / 2, lat + side + height), (side / 2 - 1e-4, lat + side), (0, lat + side)])
+
+
+@pytest.mark.parametrize('lat', [0, 45, 60])
+def test_prepare_geometry_stays_within_tolerance(lat):
+    original = bumpy_square(lat)
+    prepared, report = prepare_geometry(mapping(original), tolerance=5)
+    # A 8.9 m bump is kept at any latitude
+    assert report['vertices_after'] == report['vertices_before']
+    assert shape(prepared).hausdorff_distance(original) * METERS_PER_DEGREE < 5
+
+
+def test_prepare_geometry_removes_bumps_below_tolerance():
+    original = bumpy_square(60, bump=2)
+    prepared, report = prepare_geometry(mapping(original), tolerance=5)
+    assert report['vertices_after'] < report['vertices_before']
+    assert shape(prepared).hausdorff_distance(original) * METERS_PER_DEGREE < 5
+    assert report['area_error'] < 1e-3
+
+
+def test_prepare_geometry_repairs_invalid_geometry():
+    bowtie = {'type': 'Polygon', 'coordinates': [[(0, 0), (1, 1), (1, 0), (0, 1), (0, 0)]]}
+    prepared, report = prepare_geometry(bowtie, tolerance=0)
+    assert report['repaired']
+    assert shape(prepared).is_valid
+    assert shape(prepared).area == pytest.approx(0.5)
+
+
+def test_prepare_geometry_quantizes_coordinates():
+    square = {'type': 'Polygon', 'coordinates': [[(0.12345678, 0), (1, 0), (1, 1), (0, 1), (0.12345678, 0)]]}
+    prepared, _ = prepare_geometry(square, tolerance=0)
+    for x, y in prepared['coordinates'][0]:
+        assert round(x * 1e6) == pytest.approx(x * 1e6, abs=1e-6)
+        assert round(y * 1e6) == pytest.approx(y * 1e6, abs=1e-6)
+
+
+def test_read_geojson():
+    assert read_geojson(io.BytesIO(b' {"type": "Point", "coordinates": [1, 2]}\n')) == {
+        'type': 'Point', 'coordinates': [1, 2]}
+
+
+def test_read_zipped_shapefile_errors():
+    pytest.importorskip('geopandas')
+    with pytest.raises(ValueError, match="not a valid ZIP"):
+        read_zipped_shapefile(io.BytesIO(b'not a zip'))
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('readme.txt', 'no shapefile here')
+    with pytest.raises(ValueError, match=r"\.shp"):
+        read_zipped_shapefile(buffer)
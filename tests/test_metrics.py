@@ -0,0 +1,69 @@
+import pytest
+
+from reforestation.metrics import Metrics, Stage
+
+
+class StopScript(BaseException):
+    pass
+
+
+def observe(metrics, name, seconds, **fields):
+    stage = Stage(name)
+    stage.seconds = seconds
+    for field, value in fields.items():
+        setattr(stage, field, value)
+    metrics.observe(stage)
+
+
+def test_stage_records_trace_and_errors():
+    metrics = Metrics()
+    trace = metrics.begin_run('session')
+    with metrics.stage('fetch') as timed:
+        timed.payload_bytes = 10
+        timed.cache = 'miss'
+    with pytest.raises(ValueError):
+        with metrics.stage('fetch'):
+            raise ValueError("boom")
+
+    assert [record['error'] for record in trace] == [None, 'ValueError']
+    assert trace[0]['payload_bytes'] == 10
+    assert 'reforestation_stage_errors_total{stage="fetch"} 1' in metrics.render()
+
+
+def test_stopped_stage_is_not_counted():
+    metrics = Metrics()
+    trace = metrics.begin_run()
+    with pytest.raises(StopScript):
+        with metrics.stage('fetch'):
+            raise StopScript()
+    assert trace == []
+    assert 'stage="fetch"' not in metrics.render()
+
+
+def test_render():
+    metrics = Metrics(buckets=(0.1, 1))
+    observe(metrics, 'fetch', 0.05, payload_bytes=100, cache='hit')
+    observe(metrics, 'fetch', 0.5, payload_bytes=50, cache='miss')
+    observe(metrics, 'fetch', 2.0)
+    lines = metrics.render().splitlines()
+
+    assert 'reforestation_stage_seconds_bucket{stage="fetch",le="0.1"} 1' in lines
+    assert 'reforestation_stage_seconds_bucket{stage="fetch",le="1"} 2' in lines
+    assert 'reforestation_stage_seconds_bucket{stage="fetch",le="+Inf"} 3' in lines
+    assert 'reforestation_stage_seconds_sum{stage="fetch"} 2.55' in lines
+    assert 'reforestation_stage_seconds_count{stage="fetch"} 3' in lines
+    assert 'reforestation_stage_payload_bytes_total{stage="fetch"} 150' in lines
+    assert 'reforestation_stage_cache_total{stage="fetch",result="hit"} 1' in lines
+    assert 'reforestation_stage_cache_total{stage="fetch",result="miss"} 1' in lines
+    assert 'reforestation_stage_errors_total{stage="fetch"} 0' in lines
+
+
+def test_summary():
+    pytest.importorskip('numpy')
+    metrics = Metrics()
+    for seconds in (1, 2, 3, 4):
+        observe(metrics, 'fetch', seconds, cache='hit' if seconds > 1 else 'miss')
+    [row] = metrics.summary()
+    assert row['count'] == 4
+    assert row['p50 s'] == pytest.approx(2.5)
+    assert row['cache hit rate'] == pytest.approx(0.75)
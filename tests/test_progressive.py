@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+pytest.importorskip('ee')
+pytest.importorskip('numpy')
+pytest.importorskip('shapely')
+
+from reforestation import progressive
+from reforestation.cache import ResultCache
+from reforestation.landcover import PIXEL_AREA
+from reforestation.progressive import Z_95, error_band, get_refine, normalize_estimate, start_refine
+
+
+def test_normalize_estimate_rescales_to_30m_pixels():
+    # 4 coarse pixels over 3600 m2 of landcover data: 4 pixels at 30 m
+    estimate = normalize_estimate({'joint': {'4105': 3, '7100': 1}, 'valid_area': 4 * PIXEL_AREA}, scale=300)
+    assert estimate['joint'] == {'4105': pytest.approx(3.0), '7100': pytest.approx(1.0)}
+    assert estimate['samples'] == 4
+    assert estimate['estimate'] and estimate['scale'] == 300
+
+
+def test_normalize_estimate_of_an_empty_roi():
+    estimate = normalize_estimate({'joint': None, 'valid_area': None})
+    assert estimate['joint'] == {}
+    assert estimate['samples'] == 0
+
+
+def test_error_band():
+    assert error_band(25, 100, 400) == pytest.approx(Z_95 * math.sqrt(0.25 * 0.75 / 400) * 100)
+    assert error_band(0, 100, 400) == 0.0
+    assert error_band(100, 100, 400) == 0.0
+    assert error_band(25, 100, 0) == 0.0
+    assert error_band(25, 0, 400) == 0.0
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResultCache(directory=None)
+    monkeypatch.setattr(progressive, 'get_cache', lambda: cache)
+    return cache
+
+
+def test_refine_job_caches_its_result_and_leaves_the_registry(monkeypatch, cache):
+    monkeypatch.setattr(progressive, 'joint_histogram', lambda geometry, landcover: {'joint': {'4105': 1.0}})
+    job = start_refine('key', {}, 'nlcd')
+    job._thread.join(5)
+
+    assert job.state == 'done'
+    assert cache.get('key')['joint'] == {'4105': 1.0}
+    assert get_refine('key') is None
+
+    # A result that has left the cache is computed again
+    cache.clear()
+    again = start_refine('key', {}, 'nlcd')
+    assert again is not job
+    again._thread.join(5)
+    assert cache.get('key') is not None
+
+
+def test_failed_refine_job_stays_until_restarted(monkeypatch, cache):
+    def fail(geometry, landcover):
+        raise RuntimeError("Computation timed out")
+
+    monkeypatch.setattr(progressive, 'joint_histogram', fail)
+    job = start_refine('failing', {}, 'nlcd')
+    job._thread.join(5)
+    assert get_refine('failing') is job
+    assert job.state == 'failed' and job.error == "Computation timed out"
+
+    restarted = start_refine('failing', {}, 'nlcd')
+    assert restarted is not job
+    restarted._thread.join(5)
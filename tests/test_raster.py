@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+rasterio = pytest.importorskip('rasterio')
+
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from reforestation.raster import iter_blocks, read_padded, roi_window, slope_degrees
+
+
+# A single band raster in memory, with 30 m pixels in a UTM zone
+@pytest.fixture
+def dataset():
+    data = np.arange(20, dtype='float32').reshape(4, 5)
+    memfile = MemoryFile()
+    with memfile.open(driver='GTiff', width=5, height=4, count=1, dtype='float32', crs='EPSG:32617',
+                      transform=from_origin(500000, 4300000, 30, 30)) as dst:
+        dst.write(data, 1)
+    with memfile.open() as src:
+        yield src, data
+    memfile.close()
+
+
+def test_slope_of_a_plane():
+    # Rises 30 m per 30 m pixel to the east: 45 degrees everywhere
+    dem = np.tile(np.arange(5) * 30.0, (4, 1))
+    slope = slope_degrees(dem, 30, 30)
+    assert slope.shape == (2, 3)
+    assert slope == pytest.approx(np.full((2, 3), 45.0))
+
+
+def test_slope_uses_the_four_connected_neighbours():
+    # A spike on a diagonal neighbour does not change the slope of the centre
+    dem = np.zeros((3, 3))
+    dem[0, 0] = 100
+    assert slope_degrees(dem, 30, 30)[0, 0] == 0.0
+
+    dem = np.zeros((3, 3))
+    dem[1, 2] = 60
+    assert slope_degrees(dem, 30, 30)[0, 0] == pytest.approx(45.0)
+
+
+def test_iter_blocks_covers_the_window():
+    window = Window(3, 2, 10, 7)
+    blocks = list(iter_blocks(window, 4))
+    assert [(b.col_off, b.row_off, b.width, b.height) for b in blocks] == [
+        (3, 2, 4, 4), (7, 2, 4, 4), (11, 2, 2, 4),
+        (3, 6, 4, 3), (7, 6, 4, 3), (11, 6, 2, 3),
+    ]
+    assert sum(b.width * b.height for b in blocks) == 70
+
+
+def test_read_padded_inside(dataset):
+    src, data = dataset
+    padded = read_padded(src, Window(1, 1, 2, 2))
+    assert np.array_equal(padded, data[0:4, 0:4])
+
+
+def test_read_padded_replicates_edges(dataset):
+    src, data = dataset
+    padded = read_padded(src, Window(0, 0, 5, 4))
+    assert padded.shape == (6, 7)
+    assert np.array_equal(padded[1:-1, 1:-1], data)
+    assert np.array_equal(padded[0, 1:-1], data[0])
+    assert np.array_equal(padded[1:-1, 0], data[:, 0])
+    assert padded[-1, -1] == data[-1, -1]
+
+
+def test_roi_window(dataset):
+    src, _ = dataset
+    assert roi_window(src, None) == Window(0, 0, 5, 4)
+
+    # From the middle of pixel (1, 1) to beyond the raster
+    roi = {'type': 'Polygon', 'coordinates': [[
+        (500045, 4299955), (500200, 4299955), (500200, 4299800), (500045, 4299800), (500045, 4299955)]]}
+    assert roi_window(src, roi) == Window(1, 1, 4, 3)
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from reforestation.scratch import QuotaExceeded, ScratchManager
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def manager(tmp_path, clock):
+    return ScratchManager(str(tmp_path / 'scratch'), session_quota=1000, total_quota=2500, ttl=60, clock=clock)
+
+
+# Write a file of `nbytes` into a new entry of a session, after reserving it
+def write(manager, scratch, nbytes, keep=()):
+    manager.reserve(scratch, nbytes, keep)
+    path = scratch.mkdtemp('upload-')
+    with open(os.path.join(path, 'data'), 'wb') as f:
+        f.write(b'x' * nbytes)
+    return path
+
+
+def test_session_is_kept_across_runs(manager):
+    state = {}
+    scratch = manager.begin_run(state)
+    assert manager.begin_run(state) is scratch
+    assert manager.begin_run({}) is not scratch
+
+
+def test_session_quota_drops_oldest_entries(manager):
+    scratch = manager.begin_run({})
+    first = write(manager, scratch, 400)
+    second = write(manager, scratch, 400)
+    third = write(manager, scratch, 400)
+    assert not os.path.exists(first)
+    assert os.path.exists(second) and os.path.exists(third)
+    assert scratch.usage() == 800
+
+
+def test_session_quota_keeps_entries_in_use(manager):
+    scratch = manager.begin_run({})
+    first = write(manager, scratch, 400)
+    second = write(manager, scratch, 400)
+    write(manager, scratch, 400, keep=[first])
+    assert os.path.exists(first) and not os.path.exists(second)
+    with pytest.raises(QuotaExceeded):
+        manager.reserve(scratch, 1200)
+
+
+def test_total_quota_evicts_least_recently_used_sessions(manager, clock):
+    states = [{} for _ in range(3)]
+    paths = []
+    for state in states:
+        clock.now += 1
+        paths.append(write(manager, manager.begin_run(state), 800))
+    clock.now += 1
+    manager.begin_run(states[0])
+    scratch = manager.begin_run({})
+    write(manager, scratch, 800)
+
+    assert os.path.exists(paths[0]) and os.path.exists(paths[2])
+    assert not os.path.exists(paths[1])
+    assert manager.usage()['bytes'] <= 2500
+
+
+def test_idle_sessions_expire(manager, clock):
+    state = {}
+    path = write(manager, manager.begin_run(state), 100)
+    clock.now += 61
+    manager.begin_run({})
+    assert not os.path.exists(path)
+    assert manager.usage()['sessions'] == 1
+    assert manager.begin_run(state).usage() == 0
+
+
+def test_remove(manager):
+    scratch = manager.begin_run({})
+    path = write(manager, scratch, 100)
+    scratch.remove(path)
+    assert not os.path.exists(path)
+    assert scratch.usage() == 0
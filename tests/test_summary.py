@@ -0,0 +1,66 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+
+from reforestation.landcover import PIXEL_AREA
+from reforestation.summary import MAX_SLOPE_BIN, NO_SLOPE, SLOPE_CODES, joint_matrix, split_joint, threshold_curve
+
+SQ_KM = PIXEL_AREA / 1000000
+
+
+# Key of a joint histogram, as Earth Engine returns it
+def joint_key(landcover_class, slope_bin):
+    return str(landcover_class * SLOPE_CODES + slope_bin)
+
+
+def test_joint_encoding():
+    matrix = joint_matrix({joint_key(41, 5): 3.0, joint_key(71, MAX_SLOPE_BIN): 2.0, joint_key(11, NO_SLOPE): 1.0})
+    assert matrix.shape == (256, SLOPE_CODES)
+    assert matrix[41, 5] == 3.0
+    assert matrix[71, MAX_SLOPE_BIN] == 2.0
+    assert matrix[11, NO_SLOPE] == 1.0
+    assert matrix.sum() == 6.0
+
+
+def test_joint_encoding_float_keys():
+    assert joint_matrix({'4105.0': 3.0})[41, 5] == 3.0
+
+
+def test_split_joint_rounds_threshold_up():
+    histogram = {joint_key(71, 0): 1.0, joint_key(71, 1): 2.0, joint_key(71, 2): 4.0}
+    assert split_joint(histogram, 1)['plantable'] == {'71': 1.0}
+    assert split_joint(histogram, 1.2)['plantable'] == {'71': 3.0}
+    assert split_joint(histogram, 2)['plantable'] == {'71': 3.0}
+    assert split_joint(histogram, 0)['plantable'] == {}
+    assert split_joint(histogram, 1)['landcover'] == {'71': 7.0}
+
+
+def test_split_joint_excludes_forest_and_missing_slope():
+    histogram = {joint_key(41, 0): 10.0, joint_key(71, NO_SLOPE): 5.0, joint_key(52, MAX_SLOPE_BIN): 1.0}
+    histograms = split_joint(histogram, 90)
+    assert histograms['plantable'] == {'52': 1.0}
+    assert histograms['landcover'] == {'41': 10.0, '52': 1.0, '71': 5.0}
+
+
+def test_threshold_curve():
+    histogram = {joint_key(71, 0): 1.0, joint_key(71, 2): 2.0, joint_key(31, 10): 4.0,
+                 joint_key(41, 0): 8.0, joint_key(71, NO_SLOPE): 16.0}
+    curve = threshold_curve(histogram)
+    plantable = curve['Plantable (sq. km)'].to_numpy()
+
+    assert list(curve['Slope threshold (degrees)']) == list(range(MAX_SLOPE_BIN + 2))
+    assert plantable[0] == 0.0
+    assert plantable[1] == pytest.approx(1.0 * SQ_KM)
+    assert plantable[2] == pytest.approx(1.0 * SQ_KM)
+    assert plantable[3] == pytest.approx(3.0 * SQ_KM)
+    assert plantable[-1] == pytest.approx(7.0 * SQ_KM)
+    assert np.all(np.diff(plantable) >= 0)
+
+
+def test_threshold_curve_matches_split_joint():
+    histogram = {joint_key(71, slope_bin): float(slope_bin + 1) for slope_bin in range(0, 60, 3)}
+    curve = threshold_curve(histogram)['Plantable (sq. km)']
+    for threshold in (1, 10, 30, 45):
+        plantable = sum(split_joint(histogram, threshold)['plantable'].values())
+        assert curve[threshold] == pytest.approx(plantable * SQ_KM)
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip('ee')
+pytest.importorskip('numpy')
+shapely = pytest.importorskip('shapely')
+
+from shapely.geometry import Polygon, box, mapping
+from shapely.ops import unary_union
+
+from reforestation.tiling import estimate_pixels, merge_histograms, plan_tiles, split_geometry
+
+
+def test_split_geometry_partitions_the_geometry():
+    geom = box(0, 0, 2, 2)
+    parts = split_geometry(geom, 2)
+    assert len(parts) == 4
+    assert [part.area for part in parts] == pytest.approx([1.0] * 4)
+    assert unary_union(parts).symmetric_difference(geom).area == pytest.approx(0.0)
+
+
+def test_split_geometry_drops_empty_cells_and_edges():
+    # An L shape covering three of the four cells, touching the fourth along its edges
+    geom = Polygon([(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)])
+    parts = split_geometry(geom, 2)
+    assert len(parts) == 3
+    assert all(part.geom_type == 'Polygon' for part in parts)
+    assert sum(part.area for part in parts) == pytest.approx(geom.area)
+
+
+def test_plan_tiles():
+    geometry = mapping(box(-80.7, 38.4, -80.6, 38.5))
+    assert len(plan_tiles(geometry)) == 1
+
+    pixels = estimate_pixels(geometry)
+    tiles = plan_tiles(geometry, tile_pixels=pixels / 10)
+    assert len(tiles) == 16
+    assert sum(tile.area for tile in tiles) == pytest.approx(box(-80.7, 38.4, -80.6, 38.5).area)
+
+
+def test_merge_histograms():
+    merged = merge_histograms([{'4105': 1.0, '7100': 2.5}, None, {}, {'7100': 0.5, '2101': 3.0}])
+    assert merged == {'4105': 1.0, '7100': 3.0, '2101': 3.0}
+    assert merge_histograms([]) == {}
+
+
+def test_reduce_histograms_merges_the_tiles(monkeypatch):
+    from reforestation import tiling
+
+    reduced = []
+
+    def reduce_tile(geom, splits=0, landcover='nlcd'):
+        reduced.append(geom)
+        return [{'joint': {'7105': geom.area}}]
+
+    monkeypatch.setattr(tiling, 'reduce_tile', reduce_tile)
+    geometry = mapping(box(-80.7, 38.4, -80.6, 38.5))
+    result = tiling.reduce_histograms(geometry, tile_pixels=estimate_pixels(geometry) / 10, max_workers=4)
+
+    assert len(reduced) == 16
+    assert result['joint']['7105'] == pytest.approx(box(-80.7, 38.4, -80.6, 38.5).area)